@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""Benchmark release discovery on a synthetic dir tree.
+
+Compares the os.scandir discovery engine with the unipath walk + listdir
+scan it replaced. Every release dir gets a few RAR volumes, an nfo and a
+Sample dir, every tenth release a Subs dir with a RAR.
+
+    python benchmarks/bench_discovery.py --dirs 100000
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from tempfile import mkdtemp
+
+from unipath import DIRS, FILES, Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from releaseunpacker.discovery import iter_rar_files, iter_releases  # noqa
+
+# Dirs per release, release dir, Sample dir and every tenth a Subs dir
+DIRS_PER_RELEASE = 2.1
+
+
+def legacy_scan_rars(top):
+    """Return RAR files like scan_rars did with unipath walk + listdir."""
+    top = Path(top)
+    scan_dirs = [dir for dir in top.walk(filter=DIRS)]
+    scan_dirs.append(top)
+
+    rar_files = []
+    for dir in scan_dirs:
+        rar_files_found = dir.listdir(pattern="*.rar", filter=FILES)
+        if rar_files_found:
+            rar_files.append(rar_files_found[0])
+
+    return rar_files
+
+
+def create_tree(top, dirs):
+    """Create a synthetic release tree with about dirs dirs below top."""
+    releases = int(dirs / DIRS_PER_RELEASE)
+    groups = max(1, releases // 1000)
+    for number in range(releases):
+        release = os.path.join(
+            top,
+            "group{:03d}".format(number % groups),
+            "Release.{:06d}-Group".format(number),
+        )
+        os.makedirs(os.path.join(release, "Sample"))
+        for ext in ("rar", "r00", "r01", "r02", "nfo", "sfv"):
+            open(os.path.join(release, "release.{}".format(ext)), "w").close()
+
+        if number % 10 == 0:
+            os.makedirs(os.path.join(release, "Subs"))
+            open(os.path.join(release, "Subs", "subs.rar"), "w").close()
+
+    return releases
+
+
+def timed(func):
+    """Return result and seconds spent running func."""
+    start = time.perf_counter()
+    result = func()
+
+    return result, time.perf_counter() - start
+
+
+def main():
+    """Run discovery benchmark and print results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--dirs", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    top = mkdtemp(prefix="releaseunpacker-bench-")
+    try:
+        releases, create_time = timed(lambda: create_tree(top, args.dirs))
+
+        results = {
+            "dirs": args.dirs,
+            "releases": releases,
+            "create_seconds": round(create_time, 3),
+        }
+        for name, func in (
+            ("legacy_walk_listdir", lambda: legacy_scan_rars(top)),
+            ("scandir", lambda: list(iter_rar_files(top))),
+            ("scandir_first_release", lambda: next(iter_releases(top))),
+        ):
+            times = []
+            for _ in range(args.rounds):
+                result, seconds = timed(func)
+                times.append(seconds)
+
+            results[name] = {
+                "best_seconds": round(min(times), 4),
+                "rar_files": len(result) if isinstance(result, list) else 1,
+            }
+
+        results["speedup"] = round(
+            results["legacy_walk_listdir"]["best_seconds"]
+            / results["scandir"]["best_seconds"],
+            2,
+        )
+    finally:
+        shutil.rmtree(top)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
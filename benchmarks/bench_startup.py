@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""Benchmark startup of the releaseunpacker command.
+
+Runs the command on an empty search dir, the cron run with nothing to
+unpack, and on a dir with one stored release, with python -X importtime.
+Wall time and the modules with the largest cumulative import time are
+printed as JSON.
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from tempfile import mkdtemp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from releaseunpacker.tests.rarbuilder import write_rar  # noqa
+from releaseunpacker.tests.test_startup import BIN, import_times  # noqa
+
+
+def run(search_dir, tmp_dir, unpack_dir, runs, top):
+    """Return best wall time and top import times of runs."""
+    best_seconds = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        returncode, times = import_times(
+            BIN, "-t", tmp_dir, "-u", unpack_dir, "--no-remove", search_dir
+        )
+        seconds = time.perf_counter() - start
+        if returncode:
+            raise RuntimeError(
+                "releaseunpacker exited with {}".format(returncode)
+            )
+
+        if best_seconds is None or seconds < best_seconds:
+            best_seconds = seconds
+            best_times = times
+
+        # Unpack the release again on the next run
+        for name in os.listdir(unpack_dir):
+            os.remove(os.path.join(unpack_dir, name))
+
+    return {
+        "seconds": round(best_seconds, 4),
+        "modules": len(best_times),
+        "import_ms": {
+            module: round(cumulative / 1000, 1)
+            for module, cumulative in sorted(
+                best_times.items(), key=lambda item: -item[1]
+            )[:top]
+        },
+    }
+
+
+def main():
+    """Run startup benchmark and print results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--top", type=int, default=15, help="Number of modules to report"
+    )
+    args = parser.parse_args()
+
+    work_dir = mkdtemp(prefix="releaseunpacker-bench-")
+    try:
+        dirs = {}
+        for name in ("empty", "release", "tmp", "unpack"):
+            dirs[name] = os.path.join(work_dir, name)
+            os.makedirs(dirs[name])
+
+        release_dir = os.path.join(dirs["release"], "Release-Group")
+        os.makedirs(release_dir)
+        write_rar(
+            os.path.join(release_dir, "release-group.rar"),
+            [("movie.mkv", b"movie")],
+        )
+
+        results = {
+            name: run(
+                dirs[name], dirs["tmp"], dirs["unpack"], args.runs, args.top
+            )
+            for name in ("empty", "release")
+        }
+    finally:
+        shutil.rmtree(work_dir)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
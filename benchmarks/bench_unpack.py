@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+"""Benchmark scan, extract and cleanup of synthetic RAR releases.
+
+Builds a release tree of configurable shape and unpacks it with
+ReleaseUnpacker. Stored releases are written in pure Python with the test
+RAR builder, compressed releases need the rar tool. Every phase runs in a
+child process so peak RSS is measured per phase. Results are printed as
+JSON, runs with the same options and seed build the same tree so results
+from two versions can be diffed.
+
+    python benchmarks/bench_unpack.py --releases 4 --volumes 10 --size 256
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from tempfile import mkdtemp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from releaseunpacker.releaseunpacker import ReleaseUnpacker  # noqa
+from releaseunpacker.tests.rarbuilder import write_rar  # noqa
+
+MB = 1024 * 1024
+
+
+def member_data(rng, size):
+    """Return size bytes of data built from a seeded random MB block."""
+    block = rng.randbytes(min(size, MB))
+
+    return (block * (size // len(block) + 1))[:size]
+
+
+def write_archive(path, files, volumes, compression):
+    """Write files to a RAR volume set at path with about volumes volumes."""
+    volume_size = -(-sum(len(data) for _, data in files) // volumes)
+    if compression == "store":
+        if volumes == 1:
+            return write_rar(path, files)
+
+        return write_rar(path, files, volume_size, new_naming=True)
+
+    # Compressed archives need the rar tool, write members to a scratch dir
+    scratch_dir = mkdtemp(prefix="releaseunpacker-bench-rar-")
+    try:
+        for name, data in files:
+            with open(os.path.join(scratch_dir, name), "wb") as fp:
+                fp.write(data)
+
+        command = ["rar", "a", "-m3", "-ep", "-idq"]
+        if volumes > 1:
+            command.append("-v{}b".format(volume_size))
+        command.append(os.path.abspath(path))
+        command.extend(os.path.join(scratch_dir, name) for name, _ in files)
+        subprocess.run(command, check=True)
+    finally:
+        shutil.rmtree(scratch_dir)
+
+
+def write_subs(subs_dir, rng, depth, compression):
+    """Write a Subs RAR with the idx/sub nested depth RARs deep."""
+    files = [
+        ("subs.idx", member_data(rng, 64 * 1024)),
+        ("subs.sub", member_data(rng, MB)),
+    ]
+    for level in range(depth - 1, 0, -1):
+        nested_path = os.path.join(subs_dir, "nested{}.rar".format(level))
+        write_archive(nested_path, files, 1, compression)
+        with open(nested_path, "rb") as fp:
+            files = [("subs{}.rar".format(level), fp.read())]
+        os.remove(nested_path)
+
+    write_archive(os.path.join(subs_dir, "subs.rar"), files, 1, compression)
+
+
+def create_tree(top, args):
+    """Create releases below top and return number of data bytes."""
+    rng = random.Random(args.seed)
+    data_bytes = 0
+    for number in range(args.releases):
+        name = "Bench.Release.{:04d}-Group".format(number)
+        release_dir = os.path.join(top, name)
+        os.makedirs(release_dir)
+
+        files = [("movie.mkv", member_data(rng, args.size * MB))]
+        data_bytes += len(files[0][1])
+        write_archive(
+            os.path.join(release_dir, "{}.rar".format(name.lower())),
+            files,
+            args.volumes,
+            args.compression,
+        )
+
+        if args.subs_depth:
+            subs_dir = os.path.join(release_dir, "Subs")
+            os.makedirs(subs_dir)
+            write_subs(subs_dir, rng, args.subs_depth, args.compression)
+
+    return data_bytes
+
+
+def run_phase(phase, search_dir, tmp_dir, unpack_dir, extract_mode):
+    """Run phase and return seconds spent and peak RSS in KB.
+
+    Runs in a child process, ru_maxrss is the peak of this phase only.
+    """
+    release_unpacker = ReleaseUnpacker(
+        search_dir,
+        tmp_dir,
+        unpack_dir,
+        no_remove=True,
+        extract_mode=extract_mode,
+        check_volumes=False,
+    )
+    releases = release_unpacker.scan_releases()
+
+    start = time.perf_counter()
+    if phase == "scan":
+        release_unpacker.scan_releases()
+    elif phase == "extract":
+        for release in releases:
+            release_unpacker.unpack_release(release)
+    elif phase == "cleanup":
+        release_unpacker.no_remove = False
+        release_unpacker.remove_release_dirs(release_unpacker.rar_files)
+    seconds = time.perf_counter() - start
+
+    return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def dir_size(dir):
+    """Return size of all files below dir."""
+    size = 0
+    for root, _, files in os.walk(dir):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+
+    return size
+
+
+def version():
+    """Return git version of the tree being benchmarked."""
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """Run unpack benchmark and print results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--releases", type=int, default=4)
+    parser.add_argument("--volumes", type=int, default=10)
+    parser.add_argument(
+        "--size", type=int, default=64, help="Movie size in MB"
+    )
+    parser.add_argument(
+        "--subs-depth",
+        type=int,
+        default=1,
+        help="0 for no Subs dir, 2 or more for RARs in the Subs RAR",
+    )
+    parser.add_argument(
+        "--compression", choices=("store", "rar"), default="store"
+    )
+    parser.add_argument(
+        "--extract-mode", choices=("auto", "direct", "tmp"), default="auto"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=None)
+    parser.add_argument("--output", default=None, help="Write JSON to file")
+    args = parser.parse_args()
+
+    if args.compression == "rar" and not shutil.which("rar"):
+        parser.error("--compression rar needs the rar tool in PATH")
+
+    work_dir = mkdtemp(prefix="releaseunpacker-bench-", dir=args.work_dir)
+    search_dir = os.path.join(work_dir, "search")
+    tmp_dir = os.path.join(work_dir, "tmp")
+    unpack_dir = os.path.join(work_dir, "unpack")
+    for dir in (search_dir, tmp_dir, unpack_dir):
+        os.makedirs(dir)
+
+    # Run everything in fresh processes, ru_maxrss is inherited by forked
+    # children and kept across exec so the parent must stay small
+    mp_context = multiprocessing.get_context("spawn")
+
+    try:
+        create_start = time.perf_counter()
+        with ProcessPoolExecutor(1, mp_context=mp_context) as executor:
+            future = executor.submit(create_tree, search_dir, args)
+            data_bytes = future.result()
+        create_seconds = time.perf_counter() - create_start
+        archive_bytes = dir_size(search_dir)
+
+        results = {
+            "version": version(),
+            "python": platform.python_version(),
+            "options": vars(args),
+            "data_bytes": data_bytes,
+            "archive_bytes": archive_bytes,
+            "create_seconds": round(create_seconds, 3),
+            "phases": {},
+        }
+
+        for phase in ("scan", "extract", "cleanup"):
+            with ProcessPoolExecutor(1, mp_context=mp_context) as executor:
+                seconds, max_rss = executor.submit(
+                    run_phase,
+                    phase,
+                    search_dir,
+                    tmp_dir,
+                    unpack_dir,
+                    args.extract_mode,
+                ).result()
+
+            # Bytes written by extract and removed by cleanup
+            phase_bytes = {
+                "extract": dir_size(unpack_dir),
+                "cleanup": archive_bytes,
+            }.get(phase)
+            results["phases"][phase] = {
+                "seconds": round(seconds, 4),
+                "bytes": phase_bytes,
+                "mb_per_second": round(phase_bytes / MB / seconds, 1)
+                if phase_bytes and seconds
+                else None,
+                "max_rss_kb": max_rss,
+            }
+    finally:
+        shutil.rmtree(work_dir)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as fp:
+            fp.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
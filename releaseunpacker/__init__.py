@@ -1,2 +1,74 @@
-from .lib import setup_log
-from .releaseunpacker import ReleaseUnpacker, ReleaseUnpackerError
+"""releaseunpacker.
+
+Public names are imported from their modules on first use, importing the
+package doesn't load rarfile and the rest of the extraction stack.
+"""
+import importlib
+
+LAZY_IMPORTS = {
+    "SpaceAdmission": "admission",
+    "SpaceAdmissionError": "admission",
+    "ReleaseClaims": "claim",
+    "ReleaseClaimsError": "claim",
+    "has_rar_files": "discovery",
+    "HeaderCache": "headercache",
+    "HeaderCacheError": "headercache",
+    "sweep_tmp_artifacts": "journal",
+    "ioprio_set_idle": "lib",
+    "setup_log": "lib",
+    "JsonLinesHook": "metrics",
+    "Metrics": "metrics",
+    "MetricsHook": "metrics",
+    "PrometheusHook": "metrics",
+    "NestedArchiveError": "nested",
+    "NestedArchives": "nested",
+    "ReleasePipeline": "pipeline",
+    "ReleasePipelineError": "pipeline",
+    "ReleasePlanner": "plan",
+    "ReleasePlannerError": "plan",
+    "ReleasePriority": "priority",
+    "ReleasePriorityError": "priority",
+    "parse_category": "priority",
+    "ReleaseUnpacker": "releaseunpacker",
+    "ReleaseUnpackerError": "releaseunpacker",
+    "ReleaseRemover": "remover",
+    "ReleaseRemoverError": "remover",
+    "Rules": "rules",
+    "RulesError": "rules",
+    "ReleaseScheduler": "scheduler",
+    "ReleaseSchedulerError": "scheduler",
+    "ScanIndex": "scanindex",
+    "ScanIndexError": "scanindex",
+    "UnpackCancelledError": "service",
+    "UnpackService": "service",
+    "UnpackServiceError": "service",
+    "IoThrottle": "throttle",
+    "IoThrottleError": "throttle",
+    "parse_profile": "throttle",
+    "Verifier": "verify",
+    "ReleaseWatcher": "watch",
+    "ReleaseWatcherError": "watch",
+}
+
+__all__ = list(LAZY_IMPORTS)
+
+
+def __getattr__(name):
+    """Return public name, importing its module on first use."""
+    if name not in LAZY_IMPORTS:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name)
+        )
+
+    module = importlib.import_module(
+        ".{}".format(LAZY_IMPORTS[name]), __name__
+    )
+    value = getattr(module, name)
+    globals()[name] = value
+
+    return value
+
+
+def __dir__():
+    """Return module attributes, public names included."""
+    return sorted(set(globals()) | set(LAZY_IMPORTS))
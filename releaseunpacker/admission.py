@@ -0,0 +1,196 @@
+"""ReleaseUnpacker disk space admission."""
+import logging
+import os
+import threading
+
+log = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+HEADROOM = 1024 * MB
+
+# Seconds between free space checks while a release waits, space can also be
+# freed by removals in the background
+WAIT_INTERVAL = 30
+
+
+class SpaceAdmissionError(Exception):
+    """SpaceAdmission error."""
+
+    pass
+
+
+class Reservation(object):
+    """Space reserved on filesystems for a release being unpacked.
+
+    paths are the files being written for the release, the blocks allocated
+    to them are taken off the space still needed.
+    """
+
+    def __init__(self, admission, name, needs):
+        """Initialize Reservation."""
+        self.admission = admission
+        self.name = name
+        self.needs = needs
+        self.paths = set()
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<Reservation: {} ({} bytes)>".format(
+            self.name, sum(self.needs.values())
+        )
+
+    def allocated(self, device):
+        """Return bytes allocated to the paths being written on device.
+
+        Paths that are gone, renamed or removed, are forgotten.
+        """
+        allocated = 0
+        for path in list(self.paths):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self.paths.discard(path)
+                continue
+
+            if stat.st_dev == device:
+                allocated += stat.st_blocks * 512
+
+        return allocated
+
+    def unallocated(self, device):
+        """Return bytes reserved on device that aren't allocated yet."""
+        return max(self.needs.get(device, 0) - self.allocated(device), 0)
+
+    def writing(self, path):
+        """Take the blocks allocated to path, being written, off the needs."""
+        self.admission.writing(self, path)
+
+    def done(self, size):
+        """Hand back size bytes that are written to disk now."""
+        self.admission.done(self, size)
+
+    def release(self):
+        """Hand back all space left in the reservation."""
+        self.admission.release(self)
+
+
+class SpaceAdmission(object):
+    """Only start unpacks that fit on the filesystems they write to.
+
+    The bytes a release needs are summed per filesystem and checked against
+    the free space from statvfs, less headroom and the space reserved by
+    unpacks in flight. A release that only fits once the unpacks in flight
+    are done waits for them, a release that doesn't fit at all is skipped.
+    Reserved space is handed back file by file as files are written. Blocks
+    of files still being written, preallocated or written so far, are gone
+    from the free space already, so only the part of a reservation that
+    isn't allocated yet is counted.
+    """
+
+    def __init__(self, headroom=HEADROOM):
+        """Initialize and validate SpaceAdmission."""
+        self.headroom = headroom
+        self.condition = threading.Condition()
+        self.reservations = []
+
+        if self.headroom < 0:
+            raise SpaceAdmissionError(
+                "Headroom must be 0 or more, got {}".format(self.headroom)
+            )
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<SpaceAdmission: {} MB headroom ({} reserved)>".format(
+            self.headroom // MB, len(self.reservations)
+        )
+
+    def free(self, path):
+        """Return bytes free for unprivileged users on filesystem of path."""
+        stat = os.statvfs(path)
+
+        return stat.f_bavail * stat.f_frsize
+
+    def reserved(self, device):
+        """Return bytes reserved on device by unpacks in flight.
+
+        Only the part not allocated to the files being written yet counts.
+        """
+        return sum(
+            reservation.unallocated(device)
+            for reservation in self.reservations
+        )
+
+    def devices(self, needs):
+        """Return needs, a dict of dir to bytes, as device to (dir, bytes)."""
+        devices = {}
+        for path, size in needs.items():
+            device = os.stat(path).st_dev
+            dir, total = devices.get(device, (path, 0))
+            devices[device] = (dir, total + size)
+
+        return devices
+
+    def admit(self, name, needs):
+        """Reserve space for name and return the Reservation.
+
+        needs is a dict of dir to bytes that will be written to it. Block
+        while the unpack only fits once unpacks in flight are done, return
+        None if it doesn't fit.
+        """
+        devices = self.devices(needs)
+        waiting = False
+        with self.condition:
+            while True:
+                fits = True
+                for device, (path, size) in devices.items():
+                    free = self.free(path) - self.headroom
+                    if size > free:
+                        log.warning(
+                            "Skipping %s, needs %s MB on %s, %s MB free",
+                            name,
+                            size // MB,
+                            path,
+                            max(free, 0) // MB,
+                        )
+                        return None
+
+                    if size > free - self.reserved(device):
+                        fits = False
+
+                if fits:
+                    break
+
+                if not waiting:
+                    log.info("Queueing %s, waiting for disk space", name)
+                    waiting = True
+                self.condition.wait(WAIT_INTERVAL)
+
+            reservation = Reservation(
+                self,
+                name,
+                {device: size for device, (_, size) in devices.items()},
+            )
+            self.reservations.append(reservation)
+
+        return reservation
+
+    def writing(self, reservation, path):
+        """Add path to the files being written for reservation."""
+        with self.condition:
+            reservation.paths.add(str(path))
+
+    def done(self, reservation, size):
+        """Take size bytes off every device of reservation."""
+        with self.condition:
+            for device in reservation.needs:
+                reservation.needs[device] = max(
+                    reservation.needs[device] - size, 0
+                )
+            self.condition.notify_all()
+
+    def release(self, reservation):
+        """Drop reservation."""
+        with self.condition:
+            if reservation in self.reservations:
+                self.reservations.remove(reservation)
+            self.condition.notify_all()
@@ -0,0 +1,248 @@
+"""ReleaseUnpacker release claims for workers sharing release dirs."""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from unipath import Path
+
+log = logging.getLogger(__name__)
+
+LEASE_TIME = 10 * 60
+CLAIM_SUFFIX = ".releaseunpacker-claim"
+
+
+class ReleaseClaimsError(Exception):
+    """ReleaseClaims error."""
+
+    pass
+
+
+def claim_path(release_dir):
+    """Return path of the claim file of release_dir, next to it."""
+    release_dir = Path(release_dir)
+
+    return Path(
+        release_dir.parent, ".{}{}".format(release_dir.name, CLAIM_SUFFIX)
+    )
+
+
+def is_claim_file(name):
+    """Return True if name is a claim file or a broken claim file."""
+    return name.startswith(".") and CLAIM_SUFFIX in name
+
+
+def read_claim(path):
+    """Return owner of the claim at path or None if it can't be read."""
+    try:
+        with open(path) as fp:
+            return json.load(fp)["owner"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+class Lease(object):
+    """A claim on a release dir held by this worker.
+
+    lost is set by the heartbeat when another worker took the claim over.
+    """
+
+    def __init__(self, release_dir, path, owner, inode):
+        """Initialize Lease."""
+        self.release_dir = Path(release_dir)
+        self.path = path
+        self.owner = owner
+        self.inode = inode
+        self.linger = False
+        self.lost = threading.Event()
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<Lease: {}>".format(self.release_dir)
+
+    def held(self):
+        """Return True if the claim file is still the one created."""
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return False
+
+        return inode == self.inode and read_claim(self.path) == self.owner
+
+    def check(self):
+        """Raise ReleaseClaimsError if the claim was lost."""
+        if self.lost.is_set():
+            raise ReleaseClaimsError(
+                "Lost claim of {}".format(self.release_dir)
+            )
+
+
+class ReleaseClaims(object):
+    """Claim release dirs so workers on many hosts can share them.
+
+    A release is claimed by creating a claim file next to the release dir
+    with O_EXCL, which is atomic on local filesystems and NFS. Only the
+    worker that created the file unpacks the release. A heartbeat thread
+    touches the claim files every lease_time / 4 seconds, a claim that
+    wasn't touched for lease_time seconds belongs to a dead worker and is
+    broken by the next worker that wants the release. The clocks of the
+    hosts must be in sync.
+
+    A broken claim is renamed away first, only one worker can rename it.
+    If the file renamed turns out to be a new claim of another worker it's
+    linked back.
+    """
+
+    def __init__(self, lease_time=LEASE_TIME, owner=None):
+        """Initialize and validate ReleaseClaims."""
+        self.lease_time = lease_time
+        self.owner = owner or "{}.{}.{}".format(
+            socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8]
+        )
+        self.leases = []
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+
+        if self.lease_time <= 0:
+            raise ReleaseClaimsError(
+                "Lease time must be more than 0, got {}".format(
+                    self.lease_time
+                )
+            )
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<ReleaseClaims: {} ({} leases)>".format(
+            self.owner, len(self.leases)
+        )
+
+    def claim(self, release_dir):
+        """Claim release_dir, return the Lease or None if claimed already."""
+        path = claim_path(release_dir)
+        for _ in range(2):
+            try:
+                fd = os.open(
+                    path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644
+                )
+            except FileExistsError:
+                if not self.break_expired(release_dir, path):
+                    return None
+                continue
+
+            with os.fdopen(fd, "w") as fp:
+                json.dump({"owner": self.owner, "time": time.time()}, fp)
+                inode = os.fstat(fp.fileno()).st_ino
+            lease = Lease(release_dir, path, self.owner, inode)
+
+            log.debug("Claimed %s", release_dir)
+            with self.lock:
+                self.leases.append(lease)
+                if not self.thread:
+                    self.thread = threading.Thread(
+                        target=self.run,
+                        name="releaseunpacker-claims",
+                        daemon=True,
+                    )
+                    self.thread.start()
+
+            return lease
+
+        return None
+
+    def break_expired(self, release_dir, path):
+        """Remove the claim at path if it expired.
+
+        Return True if the claim is gone and release_dir can be claimed.
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return True
+
+        owner = read_claim(path)
+        if time.time() - stat.st_mtime < self.lease_time:
+            log.info("Skipping %s, claimed by %s", release_dir, owner)
+            return False
+
+        broken_path = "{}.{}".format(path, self.owner)
+        try:
+            os.rename(path, broken_path)
+        except FileNotFoundError:
+            return True
+
+        broken = (os.stat(broken_path).st_ino, read_claim(broken_path))
+        if broken != (stat.st_ino, owner):
+            # Another worker broke the claim and claimed the release first
+            try:
+                os.link(broken_path, path)
+            except FileExistsError:
+                pass
+            os.remove(broken_path)
+            log.info("Skipping %s, claimed by another worker", release_dir)
+            return False
+
+        log.warning("Breaking expired claim of %s by %s", release_dir, owner)
+        os.remove(broken_path)
+
+        return True
+
+    def release(self, lease, linger=False):
+        """Release lease.
+
+        With linger the claim is held until the release dir is gone, for
+        releases that are still being removed in the background.
+        """
+        if linger and os.path.lexists(lease.release_dir):
+            lease.linger = True
+            return
+
+        with self.lock:
+            if lease in self.leases:
+                self.leases.remove(lease)
+
+        if lease.held():
+            try:
+                os.remove(lease.path)
+            except FileNotFoundError:
+                pass
+        log.debug("Released %s", lease.release_dir)
+
+    def beat(self):
+        """Touch all claim files, release lingering leases of gone dirs."""
+        with self.lock:
+            leases = list(self.leases)
+
+        for lease in leases:
+            if lease.linger and not os.path.lexists(lease.release_dir):
+                self.release(lease)
+            elif lease.held():
+                try:
+                    os.utime(lease.path)
+                except OSError as e:
+                    log.warning("Can't renew claim of %s: %s", lease, e)
+            else:
+                log.error("Lost claim of %s", lease.release_dir)
+                lease.lost.set()
+                with self.lock:
+                    if lease in self.leases:
+                        self.leases.remove(lease)
+
+    def run(self):
+        """Renew claims until stopped."""
+        while not self.stopping.wait(self.lease_time / 4):
+            self.beat()
+
+    def close(self):
+        """Stop the heartbeat and release all leases."""
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+
+        with self.lock:
+            leases = list(self.leases)
+        for lease in leases:
+            self.release(lease)
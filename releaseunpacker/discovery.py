@@ -0,0 +1,116 @@
+"""ReleaseUnpacker release discovery."""
+import os
+
+from unipath import Path
+
+SUBS_DIR_NAMES = ("subs", "sub")
+
+
+def list_dir(dir):
+    """Return sub dirs and first .rar file name in dir.
+
+    Sub dirs are sorted (name, is_symlink) tuples. Everything is read from
+    one os.scandir pass, the DirEntry type info comes from the dir listing so
+    no stat calls are made except for symlinks.
+    """
+    subdirs = []
+    rar_files = []
+    with os.scandir(dir) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                subdirs.append((entry.name, entry.is_symlink()))
+            elif entry.name.endswith(".rar") and entry.is_file():
+                rar_files.append(entry.name)
+
+    subdirs.sort()
+
+    return subdirs, min(rar_files) if rar_files else None
+
+
+def walk(top, listing=list_dir):
+    """Walk top and yield (rar_file_path, None) and (None, dir) tuples.
+
+    The first .rar file of each dir is yielded as (rar_file_path, None) and
+    (None, dir) is yielded when everything below dir has been walked. Dirs
+    are walked top down in name order with the .rar file of top yielded
+    last, the same order as ReleaseUnpacker.scan_rars. Symlinked dirs are
+    followed unless they point inside top or to a dir already walked.
+    listing is called once per dir and returns sub dirs and first .rar file
+    like list_dir.
+    """
+    top = str(top)
+    top_real = os.path.realpath(top)
+    seen_links = set()
+
+    def walk_dir(dir):
+        subdirs, rar_file = listing(dir)
+        if rar_file and dir != top:
+            yield Path(dir, rar_file), None
+
+        for name, is_symlink in subdirs:
+            subdir = os.path.join(dir, name)
+            if is_symlink:
+                subdir_real = os.path.realpath(subdir)
+                if (
+                    subdir_real == top_real
+                    or subdir_real.startswith(top_real + os.sep)
+                    or subdir_real in seen_links
+                ):
+                    continue
+                seen_links.add(subdir_real)
+
+            yield from walk_dir(subdir)
+
+        if rar_file and dir == top:
+            yield Path(dir, rar_file), None
+
+        yield None, Path(dir)
+
+    yield from walk_dir(top)
+
+
+def iter_rar_files(top, listing=list_dir):
+    """Yield the first .rar file in top and every dir below it."""
+    for rar_file_path, _ in walk(top, listing):
+        if rar_file_path:
+            yield rar_file_path
+
+
+def has_rar_files(top, listing=list_dir):
+    """Return True if there's a .rar file in top or any dir below it.
+
+    The walk stops at the first .rar file found.
+    """
+    return next(iter_rar_files(top, listing), None) is not None
+
+
+def release_dir(rar_file_path):
+    """Return release dir of rar_file_path.
+
+    A RAR file in a Subs folder belongs to the release dir above it.
+    """
+    dir = rar_file_path.parent
+    if dir.name.lower() in SUBS_DIR_NAMES:
+        return dir.parent
+
+    return dir
+
+
+def iter_releases(top, listing=list_dir):
+    """Yield releases found in top as soon as they have been walked.
+
+    A release is a dict with the release dir and its RAR files in scan
+    order. It is yielded when everything below the release dir has been
+    walked, so unpacking can start before the walk is done.
+    """
+    releases = {}
+    for rar_file_path, done_dir in walk(top, listing):
+        if rar_file_path:
+            dir = release_dir(rar_file_path)
+            releases.setdefault(dir, {"dir": dir, "rar_files": []})
+            releases[dir]["rar_files"].append(rar_file_path)
+        elif done_dir in releases:
+            yield releases.pop(done_dir)
+
+    # Subs folder RARs with the release dir above top
+    yield from releases.values()
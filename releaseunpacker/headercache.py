@@ -0,0 +1,187 @@
+"""ReleaseUnpacker RAR header cache."""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from unipath import Path
+
+from .rarheader import read_volume
+from .scanindex import RACY_MTIME_NS
+
+log = logging.getLogger(__name__)
+
+# Least recently used volumes are evicted above this many entries
+MAX_ENTRIES = 100000
+
+SCHEMA_VERSION = 1
+
+
+class HeaderCacheError(Exception):
+    """HeaderCache error."""
+
+    pass
+
+
+class HeaderCache(object):
+    """Persistent cache of parsed RAR volume headers.
+
+    Each volume is stored with its size, mtime and inode and the parsed
+    headers, member names, sizes, CRCs and data offsets. A cached volume
+    is used as long as size, mtime and inode are unchanged, so volume sets
+    that were already checked are not opened again. Volumes that disappeared
+    are evicted by prune, least recently used volumes above max_entries too.
+
+    Every new volume is committed right away so the database isn't locked
+    for other workers. The time a cached volume was last used is kept in
+    memory and written by commit, prune and close.
+    """
+
+    def __init__(self, cache_file, max_entries=MAX_ENTRIES):
+        """Initialize and open HeaderCache."""
+        self.cache_file = Path(cache_file)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.used = {}
+
+        try:
+            self.db = sqlite3.connect(
+                str(self.cache_file), check_same_thread=False
+            )
+            (version,) = self.db.execute("PRAGMA user_version").fetchone()
+            if version != SCHEMA_VERSION:
+                self.db.execute("DROP TABLE IF EXISTS volumes")
+                self.db.execute(
+                    "PRAGMA user_version = {}".format(SCHEMA_VERSION)
+                )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS volumes ("
+                " path TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " inode INTEGER NOT NULL,"
+                " volume TEXT NOT NULL,"
+                " last_used REAL NOT NULL"
+                ")"
+            )
+            self.db.commit()
+        except sqlite3.Error as e:
+            raise HeaderCacheError(
+                "Can't open header cache {}: {}".format(self.cache_file, e)
+            )
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<HeaderCache: {}>".format(self.cache_file)
+
+    def close(self):
+        """Commit and close cache database."""
+        with self.lock:
+            self.write_used()
+            self.db.close()
+
+    def commit(self):
+        """Commit the time cached volumes were last used."""
+        with self.lock:
+            self.write_used()
+
+    def write_used(self):
+        """Write and commit last used times of volumes, call with lock."""
+        self.db.executemany(
+            "UPDATE volumes SET last_used = ? WHERE path = ?",
+            [(last_used, path) for path, last_used in self.used.items()],
+        )
+        self.db.commit()
+        self.used = {}
+
+    def lookup(self, path, stat):
+        """Return cached volume at path or None if it changed, call with lock.
+
+        The time it's used is only written by write_used.
+        """
+        row = self.db.execute(
+            "SELECT size, mtime_ns, inode, volume FROM volumes"
+            " WHERE path = ?",
+            (path,),
+        ).fetchone()
+        if row and row[:3] == (
+            stat.st_size,
+            stat.st_mtime_ns,
+            stat.st_ino,
+        ):
+            self.used[path] = time.time()
+            return json.loads(row[3])
+
+        return None
+
+    def read_volume(self, path):
+        """Return parsed headers of the volume at path like read_volume.
+
+        The volume is only read if it changed since it was cached. Volumes
+        that fail to parse are not cached.
+        """
+        path = str(path)
+        stat = os.stat(path)
+
+        with self.lock:
+            volume = self.lookup(path, stat)
+            if volume:
+                self.hits += 1
+                return volume
+
+        volume = read_volume(path)
+
+        with self.lock:
+            self.misses += 1
+
+            # Volumes modified this close to now can change again within
+            # the same mtime tick
+            if time.time_ns() - stat.st_mtime_ns < RACY_MTIME_NS:
+                return volume
+
+            self.db.execute(
+                "INSERT OR REPLACE INTO volumes"
+                " (path, size, mtime_ns, inode, volume, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    path,
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    stat.st_ino,
+                    json.dumps(volume, default=str),
+                    time.time(),
+                ),
+            )
+            self.db.commit()
+            self.used.pop(path, None)
+
+        return volume
+
+    def prune(self):
+        """Evict volumes that are gone and least recently used volumes."""
+        with self.lock:
+            self.write_used()
+            rows = self.db.execute("SELECT path FROM volumes").fetchall()
+            removed = [(path,) for path, in rows if not os.path.exists(path)]
+            self.db.executemany("DELETE FROM volumes WHERE path = ?", removed)
+
+            self.db.execute(
+                "DELETE FROM volumes WHERE path IN ("
+                " SELECT path FROM volumes ORDER BY last_used DESC"
+                " LIMIT -1 OFFSET ?"
+                ")",
+                (self.max_entries,),
+            )
+            self.db.commit()
+
+        log.debug(
+            "Header cache %s pruned %s gone volumes, %s hits, %s misses",
+            self.cache_file,
+            len(removed),
+            self.hits,
+            self.misses,
+        )
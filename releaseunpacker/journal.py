@@ -0,0 +1,207 @@
+"""ReleaseUnpacker extract checkpoint journal."""
+import json
+import logging
+import os
+
+from unipath import Path
+
+from .lib import fdatasync
+
+log = logging.getLogger(__name__)
+
+# Bytes copied between checkpoints, every checkpoint syncs the file to disk
+CHECKPOINT_BYTES = 256 * 1024 * 1024
+
+JOURNAL_SUFFIX = ".journal"
+PARTIAL_SUFFIX = ".partial"
+TMP_PREFIX = ".releaseunpacker-"
+
+
+def volume_parts(stored):
+    """Return parts of stored with size and mtime of the volumes."""
+    parts = []
+    for volume_path, offset, size in stored["parts"]:
+        stat = os.stat(volume_path)
+        parts.append(
+            [str(volume_path), offset, size, stat.st_size, stat.st_mtime_ns]
+        )
+
+    return parts
+
+
+class Checkpoint(object):
+    """Progress of a stored file copy, saved in a journal beside the file.
+
+    The journal has the bytes written, the running CRC32 and the volume and
+    offset to go on from, files with a BLAKE2sp are hashed again up to the
+    checkpoint when resumed. The parts are saved with size and mtime of their
+    volumes, a checkpoint is only used when the volumes didn't change.
+    """
+
+    def __init__(self, dst_path, stored, verify=True):
+        """Initialize Checkpoint."""
+        self.dst_path = Path(dst_path)
+        self.journal_path = journal_path(dst_path)
+        self.key = {
+            "parts": volume_parts(stored),
+            "size": stored["size"],
+            "crc": stored["crc"],
+            "blake2sp": stored.get("blake2sp"),
+            "verify": verify,
+        }
+        self.interval = CHECKPOINT_BYTES
+        self.copied = 0
+        self.crc = 0
+        self.resumed = 0
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<Checkpoint: {} ({} bytes)>".format(
+            self.dst_path, self.copied
+        )
+
+    def load(self):
+        """Return (bytes written, CRC32) to resume from.
+
+        Return (0, 0) if there's no journal or it doesn't match.
+        """
+        journal = read_journal(self.journal_path)
+        if (
+            journal
+            and journal["key"] == self.key
+            and os.path.exists(self.dst_path)
+            and os.path.getsize(self.dst_path) >= journal["copied"]
+        ):
+            self.copied = self.resumed = journal["copied"]
+            self.crc = journal["crc"]
+            log.info(
+                "Resuming %s at %s bytes, volume %s offset %s",
+                self.dst_path.name,
+                self.copied,
+                journal["volume"],
+                journal["offset"],
+            )
+
+        return self.copied, self.crc
+
+    def due(self, copied):
+        """Return True if a checkpoint should be saved at copied bytes."""
+        return copied - self.copied >= self.interval
+
+    def save(self, dst_fd, copied, crc, volume_path, offset):
+        """Sync dst_fd to disk and save progress in the journal."""
+        fdatasync(dst_fd)
+
+        tmp_path = "{}.tmp".format(self.journal_path)
+        with open(tmp_path, "w") as fp:
+            json.dump(
+                {
+                    "key": self.key,
+                    "copied": copied,
+                    "crc": crc,
+                    "volume": str(volume_path),
+                    "offset": offset,
+                },
+                fp,
+            )
+        os.replace(tmp_path, self.journal_path)
+
+        self.copied = copied
+        self.crc = crc
+
+    def remove(self):
+        """Remove the journal."""
+        Path(self.journal_path).remove()
+
+
+def journal_path(dst_path):
+    """Return journal path of dst_path."""
+    return Path("{}{}".format(dst_path, JOURNAL_SUFFIX))
+
+
+def read_journal(path):
+    """Return journal at path or None if missing or invalid."""
+    try:
+        with open(path) as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        log.warning("Can't read journal %s: %s", path, e)
+        return None
+
+
+def resumable(dst_path):
+    """Return True if dst_path has a journal and its volumes are unchanged."""
+    journal = read_journal(journal_path(dst_path))
+    if not journal:
+        return False
+
+    for volume_path, _, _, size, mtime_ns in journal["key"]["parts"]:
+        try:
+            stat = os.stat(volume_path)
+        except OSError:
+            return False
+
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+            return False
+
+    return True
+
+
+def sweep_file(path):
+    """Remove path and its journal unless it can be resumed.
+
+    Return True if removed.
+    """
+    if path.endswith(JOURNAL_SUFFIX):
+        dst_path = path[: -len(JOURNAL_SUFFIX)]
+        if os.path.exists(dst_path) and resumable(dst_path):
+            return False
+    elif resumable(path):
+        log.debug("Keeping resumable %s", path)
+        return False
+
+    log.info("Removing stale %s", path)
+    os.remove(path)
+
+    return True
+
+
+def sweep_tmp_artifacts(tmp_dir, unpack_dir):
+    """Remove files left behind by crashed runs and return how many.
+
+    Extract dirs in tmp_dir and .partial files in unpack_dir are removed
+    unless they have a journal to resume from.
+    """
+    removed = 0
+    with os.scandir(tmp_dir) as entries:
+        extract_dirs = [
+            entry.path
+            for entry in entries
+            if entry.name.startswith(TMP_PREFIX) and entry.is_dir()
+        ]
+
+    for extract_dir in extract_dirs:
+        for root, _, file_names in os.walk(extract_dir, topdown=False):
+            for name in sorted(file_names):
+                path = os.path.join(root, name)
+                if os.path.exists(path):
+                    removed += sweep_file(path)
+
+            if not os.listdir(root):
+                os.rmdir(root)
+
+    with os.scandir(unpack_dir) as entries:
+        partial_paths = sorted(
+            entry.path
+            for entry in entries
+            if entry.name.endswith(PARTIAL_SUFFIX)
+            or entry.name.endswith(PARTIAL_SUFFIX + JOURNAL_SUFFIX)
+        )
+
+    for path in partial_paths:
+        if os.path.exists(path):
+            removed += sweep_file(path)
+
+    return removed
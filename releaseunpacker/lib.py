@@ -1,6 +1,34 @@
 """releaseunpacker lib functions."""
+import ctypes
+import errno
 import logging
 import logging.handlers
+import os
+import platform
+
+# fallocate mode, allocate blocks past the end without changing the size
+FALLOC_FL_KEEP_SIZE = 1
+
+# fallocate errors meaning the filesystem can't preallocate
+FALLOCATE_UNSUPPORTED_ERRORS = (
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+    errno.ENOSYS,
+    errno.EINVAL,
+)
+
+# ioprio_set syscall numbers, there's no libc wrapper
+IOPRIO_SET_SYSCALLS = {
+    "x86_64": 251,
+    "i386": 289,
+    "i686": 289,
+    "aarch64": 30,
+    "armv7l": 314,
+    "ppc64le": 273,
+}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
 
 
 def setup_log(name, level=logging.INFO, log_file=False, console_output=True):
@@ -28,3 +56,125 @@ def setup_log(name, level=logging.INFO, log_file=False, console_output=True):
     log.propagate = console_output
 
     return log
+
+
+def copy_fileobj(fsrc, fdst, buffer, progress=None, throttle=None):
+    """Copy all data from fsrc to fdst through buffer.
+
+    buffer is a preallocated bytearray that is reused for every read so large
+    copies don't allocate a new bytes object per chunk. progress is called
+    with the bytes of every chunk copied. throttle.consume is called with the
+    size of every chunk read, before it's written. Return bytes copied.
+    """
+    view = memoryview(buffer)
+    copied = 0
+    while True:
+        size = fsrc.readinto(view)
+        if not size:
+            break
+
+        if throttle:
+            throttle.consume(size)
+        fdst.write(view[:size])
+        copied += size
+        if progress:
+            progress(size)
+
+    return copied
+
+
+def libc_fallocate():
+    """Return fallocate from libc or None if there's no fallocate."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return None
+
+    fallocate = getattr(libc, "fallocate64", None) or getattr(
+        libc, "fallocate", None
+    )
+    if fallocate:
+        fallocate.argtypes = (
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.c_int64,
+            ctypes.c_int64,
+        )
+        fallocate.restype = ctypes.c_int
+
+    return fallocate
+
+
+FALLOCATE = libc_fallocate()
+
+
+def ioprio_set_idle():
+    """Put the I/O of this process in the idle class.
+
+    Only disk time no other process wants is used, with the CFQ and BFQ
+    schedulers. Threads started after the call inherit the class. Return
+    False if the class can't be set.
+    """
+    syscall_number = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if not syscall_number:
+        return False
+
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return False
+
+    return (
+        libc.syscall(
+            syscall_number,
+            IOPRIO_WHO_PROCESS,
+            0,
+            IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT,
+        )
+        == 0
+    )
+
+
+def preallocate(fd, size):
+    """Allocate size bytes on disk for fd in as few extents as possible.
+
+    The file size isn't changed, blocks are allocated past the end with
+    fallocate and FALLOC_FL_KEEP_SIZE. os.posix_fallocate isn't used, glibc
+    emulates it by writing to every block where the filesystem can't
+    preallocate. Return True if preallocated, raises OSError if the disk is
+    full.
+    """
+    if not FALLOCATE or size <= 0:
+        return False
+
+    if FALLOCATE(fd, FALLOC_FL_KEEP_SIZE, 0, size) == 0:
+        return True
+
+    error = ctypes.get_errno()
+    if error in FALLOCATE_UNSUPPORTED_ERRORS:
+        return False
+
+    raise OSError(error, os.strerror(error))
+
+
+def fdatasync(fd):
+    """Flush file data of fd to disk."""
+    getattr(os, "fdatasync", os.fsync)(fd)
+
+
+def fadvise_dontneed(fd, offset=0, size=0):
+    """Drop cached pages of fd from offset, all pages if size is 0.
+
+    Dirty pages are only dropped once written, sync fd first.
+    """
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, offset, size, os.POSIX_FADV_DONTNEED)
+
+
+def fadvise_dontneed_file(path):
+    """Drop cached pages of the file at path."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        fadvise_dontneed(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,172 @@
+"""ReleaseUnpacker metrics."""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+STAGES = (
+    "scan",
+    "volume_check",
+    "header_parse",
+    "extract",
+    "move",
+    "rmtree",
+    "release",
+)
+
+
+class MetricsHook(object):
+    """Metrics hook base class.
+
+    Hooks get every stage measurement through emit and are closed when the
+    run is done.
+    """
+
+    def emit(self, stage, seconds, fields):
+        """Handle a stage measurement."""
+        pass
+
+    def close(self):
+        """Flush and close hook."""
+        pass
+
+
+class JsonLinesHook(MetricsHook):
+    """Append every stage measurement as a JSON line to stats_file."""
+
+    def __init__(self, stats_file):
+        """Initialize and open stats_file."""
+        self.stats_file = stats_file
+        self.lock = threading.Lock()
+        self.fp = open(stats_file, "a")
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<JsonLinesHook: {}>".format(self.stats_file)
+
+    def emit(self, stage, seconds, fields):
+        """Write stage measurement as a JSON line."""
+        line = {
+            "time": datetime.now().isoformat(),
+            "stage": stage,
+            "seconds": round(seconds, 6),
+        }
+        line.update(fields)
+
+        with self.lock:
+            self.fp.write(json.dumps(line, default=str) + "\n")
+            self.fp.flush()
+
+    def close(self):
+        """Close stats_file."""
+        with self.lock:
+            self.fp.close()
+
+
+class PrometheusHook(MetricsHook):
+    """Write stage totals in Prometheus textfile collector format.
+
+    The file is rewritten atomically after every release so the node
+    exporter never reads a half written file.
+    """
+
+    def __init__(self, prometheus_file):
+        """Initialize PrometheusHook."""
+        self.prometheus_file = prometheus_file
+        self.lock = threading.Lock()
+        self.totals = {}
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<PrometheusHook: {}>".format(self.prometheus_file)
+
+    def emit(self, stage, seconds, fields):
+        """Add stage measurement to totals."""
+        with self.lock:
+            totals = self.totals.setdefault(
+                stage, {"count": 0, "seconds": 0.0, "bytes": 0, "last": 0.0}
+            )
+            totals["count"] += 1
+            totals["seconds"] += seconds
+            totals["bytes"] += fields.get("bytes", 0)
+            totals["last"] = seconds
+
+            if stage == "release":
+                self.write()
+
+    def close(self):
+        """Write totals."""
+        with self.lock:
+            self.write()
+
+    def write(self):
+        """Write totals to prometheus_file."""
+        lines = []
+        for name, key, metric_type, help in (
+            ("count_total", "count", "counter", "Number of stage runs"),
+            ("seconds_total", "seconds", "counter", "Seconds spent in stage"),
+            ("bytes_total", "bytes", "counter", "Bytes handled in stage"),
+            ("last_seconds", "last", "gauge", "Seconds of last stage run"),
+        ):
+            metric = "releaseunpacker_stage_{}".format(name)
+            lines.append("# HELP {} {}".format(metric, help))
+            lines.append("# TYPE {} {}".format(metric, metric_type))
+            for stage, totals in sorted(self.totals.items()):
+                lines.append(
+                    '{}{{stage="{}"}} {}'.format(metric, stage, totals[key])
+                )
+
+        tmp_file = "{}.{}.tmp".format(self.prometheus_file, os.getpid())
+        with open(tmp_file, "w") as fp:
+            fp.write("\n".join(lines) + "\n")
+        os.replace(tmp_file, self.prometheus_file)
+
+
+class Metrics(object):
+    """Measure unpack stages and pass the measurements to hooks."""
+
+    def __init__(self, hooks=None):
+        """Initialize Metrics."""
+        self.hooks = list(hooks or [])
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<Metrics: {}>".format(self.hooks)
+
+    def emit(self, stage, seconds, **fields):
+        """Pass a stage measurement to all hooks."""
+        if "bytes" in fields and seconds > 0:
+            fields["bytes_per_second"] = round(fields["bytes"] / seconds)
+
+        for hook in self.hooks:
+            try:
+                hook.emit(stage, seconds, fields)
+            except Exception as e:
+                log.warning("Metrics hook %s failed: %s", hook, e)
+
+    @contextmanager
+    def timer(self, stage, **fields):
+        """Measure the time spent in the with block.
+
+        The fields dict is yielded so the block can add fields like bytes,
+        the measurement is emitted when the block is done.
+        """
+        start = time.perf_counter()
+        try:
+            yield fields
+        except Exception as e:
+            fields["error"] = type(e).__name__
+            raise
+        finally:
+            if self.hooks:
+                self.emit(stage, time.perf_counter() - start, **fields)
+
+    def close(self):
+        """Close all hooks."""
+        for hook in self.hooks:
+            hook.close()
@@ -0,0 +1,402 @@
+"""ReleaseUnpacker archives nested in RARs."""
+import logging
+import tempfile
+import zipfile
+import zlib
+
+import rarfile
+from unipath import Path
+
+from .lib import copy_fileobj
+
+log = logging.getLogger(__name__)
+
+MAX_DEPTH = 3
+MEMORY_SIZE = 64 * 1024 * 1024
+NESTED_EXTS = (".rar", ".zip", ".7z")
+
+
+class NestedArchiveError(Exception):
+    """Nested archive error."""
+
+    pass
+
+
+def load_py7zr():
+    """Return py7zr or None if it isn't installed.
+
+    py7zr is only imported when a 7z archive is opened, it's slow to import.
+    """
+    try:
+        import py7zr
+    except ImportError:
+        return None
+
+    return py7zr
+
+
+class CrcReader(object):
+    """File object that keeps the CRC32 of the data read into buffers."""
+
+    def __init__(self, fp, expected):
+        """Initialize CrcReader."""
+        self.fp = fp
+        self.expected = expected
+        self.crc = 0
+
+    def __enter__(self):
+        """Return self."""
+        return self
+
+    def __exit__(self, *args):
+        """Close file object."""
+        self.close()
+
+    def readinto(self, buffer):
+        """Read into buffer and return bytes read."""
+        size = self.fp.readinto(buffer)
+        if size:
+            self.crc = zlib.crc32(memoryview(buffer)[:size], self.crc)
+
+        return size
+
+    def close(self):
+        """Close file object."""
+        self.fp.close()
+
+
+class Archive(object):
+    """An archive nested in a RAR, read from a buffer.
+
+    Files are read through a CrcReader and checked against the CRC32 in the
+    archive, if it has one, like the RAR files they're nested in.
+    """
+
+    def __init__(self, name, fp):
+        """Initialize Archive."""
+        self.name = Path(name)
+        self.fp = fp
+        self.crcs = None
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<{}: {}>".format(self.__class__.__name__, self.name)
+
+    def files(self):
+        """Return list of dicts with name, size and crc of the files."""
+        raise NotImplementedError
+
+    def open_file(self, file_name):
+        """Return file object to read file_name from."""
+        raise NotImplementedError
+
+    def open(self, file_name):
+        """Return CrcReader to read file_name from."""
+        if self.crcs is None:
+            self.crcs = {
+                str(file["name"]): file["crc"] for file in self.files()
+            }
+
+        return CrcReader(
+            self.open_file(file_name), self.crcs.get(str(file_name))
+        )
+
+    def check(self, file_name, fp, copied, size):
+        """Raise NestedArchiveError if data is short or the CRC is wrong."""
+        if copied != size:
+            raise NestedArchiveError(
+                "Read {} bytes of {} bytes of {} in {}".format(
+                    copied, size, file_name, self.name
+                )
+            )
+        elif fp.expected is not None and fp.crc != fp.expected:
+            raise NestedArchiveError(
+                "CRC mismatch for {} in {}, expected {:08x}, got "
+                "{:08x}".format(file_name, self.name, fp.expected, fp.crc)
+            )
+
+    def close(self):
+        """Close archive."""
+        pass
+
+
+class RarArchive(Archive):
+    """A nested RAR, read with rarfile."""
+
+    def __init__(self, name, fp):
+        """Initialize RarArchive."""
+        super().__init__(name, fp)
+        self.archive = rarfile.RarFile(fp)
+
+    def files(self):
+        """Return list of dicts with name, size and crc of the files."""
+        return [
+            {
+                "name": Path(info.filename),
+                "size": info.file_size,
+                "crc": info.CRC,
+            }
+            for info in self.archive.infolist()
+            if not info.is_dir()
+        ]
+
+    def open_file(self, file_name):
+        """Return file object to read file_name from."""
+        return self.archive.open(str(file_name))
+
+    def check(self, file_name, fp, copied, size):
+        """Raise exception if data is short or the hash doesn't match.
+
+        rarfile only checks at the end of read, not readinto, RAR5 files
+        with a BLAKE2sp and no CRC32 are checked by it.
+        """
+        super().check(file_name, fp, copied, size)
+        fp.fp._check()
+
+    def close(self):
+        """Close archive."""
+        self.archive.close()
+
+
+class ZipArchive(Archive):
+    """A nested zip, read with zipfile which checks the CRC32 as it reads."""
+
+    def __init__(self, name, fp):
+        """Initialize ZipArchive."""
+        super().__init__(name, fp)
+        self.archive = zipfile.ZipFile(fp)
+
+    def files(self):
+        """Return list of dicts with name, size and crc of the files."""
+        return [
+            {
+                "name": Path(info.filename),
+                "size": info.file_size,
+                "crc": info.CRC,
+            }
+            for info in self.archive.infolist()
+            if not info.is_dir()
+        ]
+
+    def open_file(self, file_name):
+        """Return file object to read file_name from."""
+        return self.archive.open(str(file_name))
+
+    def close(self):
+        """Close archive."""
+        self.archive.close()
+
+
+class SpoolWriter(object):
+    """Buffer file py7zr extracts a file into."""
+
+    def __init__(self, fp):
+        """Initialize SpoolWriter."""
+        self.fp = fp
+
+    def write(self, data):
+        """Write data."""
+        return self.fp.write(data)
+
+    def read(self, size=None):
+        """Return up to size bytes."""
+        return self.fp.read(size)
+
+    def seek(self, offset, whence=0):
+        """Seek to offset."""
+        return self.fp.seek(offset, whence)
+
+    def flush(self):
+        """Flush buffer file."""
+        self.fp.flush()
+
+    def size(self):
+        """Return bytes written."""
+        position = self.fp.tell()
+        size = self.fp.seek(0, 2)
+        self.fp.seek(position)
+
+        return size
+
+    def close(self):
+        """Rewind, the buffer file is read once py7zr is done."""
+        self.fp.seek(0)
+
+
+class SpoolWriterFactory(object):
+    """py7zr writer factory that extracts files into buffer files."""
+
+    def __init__(self, buffer_file):
+        """Initialize SpoolWriterFactory."""
+        self.buffer_file = buffer_file
+        self.writers = {}
+
+    def create(self, file_name):
+        """Return SpoolWriter for file_name."""
+        self.writers[file_name] = SpoolWriter(self.buffer_file())
+
+        return self.writers[file_name]
+
+
+class SevenZipArchive(Archive):
+    """A nested 7z, read with py7zr.
+
+    py7zr can't stream a file, it's extracted into a buffer file from
+    buffer_file when it's opened.
+    """
+
+    def __init__(self, name, fp, buffer_file=tempfile.SpooledTemporaryFile):
+        """Initialize SevenZipArchive."""
+        super().__init__(name, fp)
+        self.buffer_file = buffer_file
+        self.archive = load_py7zr().SevenZipFile(fp)
+
+    def files(self):
+        """Return list of dicts with name, size and crc of the files."""
+        return [
+            {
+                "name": Path(info.filename),
+                "size": info.uncompressed,
+                "crc": info.crc32,
+            }
+            for info in self.archive.list()
+            if not info.is_directory
+        ]
+
+    def open_file(self, file_name):
+        """Return file object to read file_name from."""
+        factory = SpoolWriterFactory(self.buffer_file)
+        self.archive.reset()
+        self.archive.extract(targets=[str(file_name)], factory=factory)
+
+        return factory.writers[str(file_name)].fp
+
+    def close(self):
+        """Close archive."""
+        self.archive.close()
+
+
+ARCHIVES = {".rar": RarArchive, ".zip": ZipArchive}
+
+
+class NestedArchives(object):
+    """Open archives nested in RARs without writing them to disk first.
+
+    An inner archive is read into a buffer that's kept in memory up to
+    memory_size bytes, larger archives are spooled to a temporary file in
+    spool_dir. Archives in inner archives are opened the same way, up to
+    max_depth levels deep, 0 turns nested archives off. RAR and zip archives
+    are read with rarfile and zipfile, 7z archives with py7zr if it's
+    installed.
+    """
+
+    def __init__(
+        self, max_depth=MAX_DEPTH, memory_size=MEMORY_SIZE, spool_dir=None
+    ):
+        """Initialize and validate NestedArchives."""
+        self.max_depth = max_depth
+        self.memory_size = memory_size
+        self.spool_dir = spool_dir
+
+        if self.max_depth < 0:
+            raise NestedArchiveError(
+                "Max depth must be 0 or more, got {}".format(self.max_depth)
+            )
+        elif self.memory_size < 0:
+            raise NestedArchiveError(
+                "Memory size must be 0 or more, got {}".format(
+                    self.memory_size
+                )
+            )
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<NestedArchives: {} deep ({} bytes in memory)>".format(
+            self.max_depth, self.memory_size
+        )
+
+    def is_archive(self, file_name):
+        """Return True if file_name is an archive that can be nested."""
+        return Path(file_name).ext.lower() in NESTED_EXTS
+
+    def buffer_file(self):
+        """Return file kept in memory up to memory_size bytes."""
+        if not self.memory_size:
+            return tempfile.TemporaryFile(dir=self.spool_dir)
+
+        return tempfile.SpooledTemporaryFile(
+            max_size=self.memory_size, dir=self.spool_dir
+        )
+
+    def open(self, name, fp):
+        """Return Archive for name read from fp.
+
+        Raise NestedArchiveError if it can't be read, the release must be kept
+        for its files to be unpacked later.
+        """
+        ext = Path(name).ext.lower()
+        errors = (rarfile.Error, zipfile.BadZipFile, zipfile.LargeZipFile)
+        if ext == ".7z":
+            py7zr = load_py7zr()
+            if not py7zr:
+                raise NestedArchiveError(
+                    "Can't open {}, py7zr isn't installed".format(name)
+                )
+            errors += (py7zr.exceptions.ArchiveError,)
+
+        try:
+            if ext == ".7z":
+                return SevenZipArchive(name, fp, self.buffer_file)
+
+            return ARCHIVES[ext](name, fp)
+        except errors as e:
+            raise NestedArchiveError("Can't open {}: {}".format(name, e))
+
+    def walk(self, name, fp, size, buffer, check, depth=1, throttle=None):
+        """Yield (archive, files) of archive name and archives nested in it.
+
+        The size bytes of the archive are read from fp through buffer and
+        throttle and check(name, fp, copied, size) raises if they're bad.
+        files are the files in archive that aren't archives themselves, the
+        archive is open until the next item is taken. Raise
+        NestedArchiveError if an archive can't be opened or is nested more
+        than max_depth deep.
+        """
+        if depth > self.max_depth:
+            raise NestedArchiveError(
+                "{} is nested more than {} deep".format(name, self.max_depth)
+            )
+
+        log.debug("Opening nested archive %s", name)
+        spool = self.buffer_file()
+        try:
+            check(
+                name,
+                fp,
+                copy_fileobj(fp, spool, buffer, throttle=throttle),
+                size,
+            )
+            spool.seek(0)
+            archive = self.open(name, spool)
+            try:
+                files = archive.files()
+                yield archive, [
+                    file for file in files if not self.is_archive(file["name"])
+                ]
+
+                for file in files:
+                    if self.is_archive(file["name"]):
+                        with archive.open(file["name"]) as inner_fp:
+                            yield from self.walk(
+                                file["name"],
+                                inner_fp,
+                                file["size"],
+                                buffer,
+                                archive.check,
+                                depth + 1,
+                                throttle,
+                            )
+            finally:
+                archive.close()
+        finally:
+            spool.close()
@@ -0,0 +1,142 @@
+"""ReleaseUnpacker background move and cleanup stage."""
+import collections
+import logging
+import queue
+import threading
+
+log = logging.getLogger(__name__)
+
+TMP_BYTES = 4 * 1024 * 1024 * 1024
+
+
+class ReleasePipelineError(Exception):
+    """ReleasePipeline error."""
+
+    pass
+
+
+class ReleasePipeline(object):
+    """Move unpacked files and clean up releases in the background.
+
+    A release is found, its headers are parsed, its files are extracted to
+    tmp dir, moved to unpack dir and its dirs are removed. ReleaseUnpacker
+    does the first three stages as releases are found, the moves and the
+    cleanup after them are queued here. They run on a worker thread in the
+    order they were submitted, so the files of one release are moved while
+    the next one is extracted.
+
+    Jobs are grouped by release dir. Once a job of a release fails the rest
+    of its jobs are skipped, except jobs that must always run, like handing
+    back its disk space and claim. Extraction waits while max_tmp_bytes of
+    extracted files are waiting to be moved, so tmp dir usage stays capped.
+    """
+
+    def __init__(self, max_tmp_bytes=TMP_BYTES):
+        """Initialize and validate ReleasePipeline."""
+        self.max_tmp_bytes = max_tmp_bytes
+        self.queue = queue.Queue()
+        self.condition = threading.Condition()
+        self.pending_bytes = 0
+        self.jobs = collections.Counter()
+        self.failed = {}
+        self.thread = None
+
+        if self.max_tmp_bytes < 1:
+            raise ReleasePipelineError(
+                "Max tmp bytes must be 1 or more, got {}".format(
+                    self.max_tmp_bytes
+                )
+            )
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<ReleasePipeline: {} bytes in tmp dir ({} waiting)>".format(
+            self.max_tmp_bytes, self.pending_bytes
+        )
+
+    def pending(self, release_dir):
+        """Return True if release_dir has jobs waiting to run."""
+        with self.condition:
+            return self.jobs[str(release_dir)] > 0
+
+    def has_room(self, size):
+        """Return True if size more bytes fit in tmp dir, call with lock."""
+        return (
+            not self.pending_bytes
+            or self.pending_bytes + size <= self.max_tmp_bytes
+        )
+
+    def wait_room(self, size):
+        """Wait until size more bytes can be extracted to tmp dir.
+
+        A file larger than max_tmp_bytes is extracted once nothing else is
+        waiting to be moved.
+        """
+        with self.condition:
+            if not self.has_room(size):
+                log.debug(
+                    "Waiting for moves, %s bytes in tmp dir",
+                    self.pending_bytes,
+                )
+                self.condition.wait_for(lambda: self.has_room(size))
+
+    def submit(self, release_dir, job, size=0, always=False):
+        """Queue job of release_dir.
+
+        size is the bytes in tmp dir the job frees. With always the job runs
+        even if an earlier job of release_dir failed.
+        """
+        with self.condition:
+            self.pending_bytes += size
+            self.jobs[str(release_dir)] += 1
+            if not self.thread:
+                self.thread = threading.Thread(
+                    target=self.run,
+                    name="releaseunpacker-pipeline",
+                    daemon=True,
+                )
+                self.thread.start()
+
+        self.queue.put((str(release_dir), job, size, always))
+
+    def run(self):
+        """Run queued jobs until None is queued."""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+
+            release_dir, job, size, always = item
+            try:
+                if always or release_dir not in self.failed:
+                    job()
+            except Exception as e:
+                log.error("Finishing %s failed: %s", release_dir, e)
+                self.failed.setdefault(release_dir, e)
+            finally:
+                with self.condition:
+                    self.pending_bytes -= size
+                    self.jobs[release_dir] -= 1
+                    if not self.jobs[release_dir]:
+                        del self.jobs[release_dir]
+                    self.condition.notify_all()
+                self.queue.task_done()
+
+    def join(self):
+        """Wait for all queued jobs.
+
+        Return {release_dir: exception} of releases that failed since the
+        last join.
+        """
+        self.queue.join()
+        failed, self.failed = self.failed, {}
+
+        return failed
+
+    def close(self):
+        """Run all queued jobs and stop the worker thread."""
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,355 @@
+"""ReleaseUnpacker dry run planner."""
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import rarfile
+from unipath import Path
+
+from .admission import SpaceAdmission
+from .journal import PARTIAL_SUFFIX, TMP_PREFIX
+from .lib import fadvise_dontneed, fdatasync
+from .releaseunpacker import ReleaseUnpackerRarFileError
+from .volumes import COMPLETE, VolumeSet
+
+log = logging.getLogger(__name__)
+
+JOBS = 8
+MB = 1024 * 1024
+
+
+class ReleasePlannerError(Exception):
+    """ReleasePlanner error."""
+
+    pass
+
+
+class ReleasePlanner(object):
+    """Plan what ReleaseUnpackers would unpack without unpacking anything.
+
+    Releases are found and their headers parsed, jobs releases at a time,
+    and every release gets the files the rules pick, their target names and
+    the reason it would be skipped. Release sizes for the smallest first
+    order are read in the same jobs. Nothing is extracted, moved or removed.
+
+    The time to unpack is only estimated when asked for with a sample_size,
+    from throughput measured on the devices: sample_size bytes are read from
+    the largest volume on every release device and written to a probe file
+    in tmp dir and unpack dir, which is removed again. Cached pages of the
+    volumes are left alone, a volume that is still cached reads faster than
+    the device. With a sample_size of 0, the default, nothing is read or
+    written and there's no estimate. The bytes to write are checked against
+    the free space less the headroom of admission.
+    """
+
+    def __init__(
+        self,
+        release_unpackers,
+        jobs=JOBS,
+        sample_size=0,
+        admission=None,
+    ):
+        """Initialize and validate ReleasePlanner."""
+        self.release_unpackers = release_unpackers
+        self.jobs = jobs
+        self.sample_size = sample_size
+        self.admission = admission or SpaceAdmission(0)
+
+        if self.jobs < 1:
+            raise ReleasePlannerError(
+                "Jobs must be 1 or more, got {}".format(self.jobs)
+            )
+        elif self.sample_size < 0:
+            raise ReleasePlannerError(
+                "Sample size must be 0 or more, got {}".format(
+                    self.sample_size
+                )
+            )
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<ReleasePlanner: {} release dirs ({} jobs)>".format(
+            len(self.release_unpackers), self.jobs
+        )
+
+    def volume_status(self, release_unpacker, release):
+        """Return None if all volume sets of release are complete.
+
+        Else return why the release would be deferred or skipped.
+        """
+        for rar_file_path in release["rar_files"]:
+            volume_set = VolumeSet(
+                rar_file_path,
+                release_unpacker.stall_time,
+                release_unpacker.header_cache,
+                sfv_crc=release_unpacker.sfv_crc,
+            )
+            if volume_set.status != COMPLETE:
+                return "Volume set {}: {}".format(
+                    volume_set.status, volume_set.reason
+                )
+
+        return None
+
+    def plan_files(self, release_unpacker, release_unpacker_rar_file):
+        """Return files a RAR file would unpack, with their target names."""
+        files = []
+        for unpack_file_path, rarfile_file in release_unpacker.unpack_files(
+            release_unpacker_rar_file
+        ):
+            exists = release_unpacker.file_exists_size_match(
+                unpack_file_path, rarfile_file["size"]
+            )
+            files.append(
+                {
+                    "rar": str(release_unpacker_rar_file.rar_file_path_abs),
+                    "member": str(rarfile_file["name"]),
+                    "target": str(unpack_file_path),
+                    "bytes": rarfile_file["size"],
+                    "stored": rarfile_file["stored"],
+                    "action": "exists" if exists else "unpack",
+                }
+            )
+
+        # Files in nested archives aren't known until they're opened
+        for rarfile_file in release_unpacker.nested_files(
+            release_unpacker_rar_file
+        ):
+            files.append(
+                {
+                    "rar": str(release_unpacker_rar_file.rar_file_path_abs),
+                    "member": str(rarfile_file["name"]),
+                    "target": None,
+                    "bytes": rarfile_file["size"],
+                    "stored": rarfile_file["stored"],
+                    "action": "nested",
+                }
+            )
+
+        return files
+
+    def plan_release(self, release_unpacker, release):
+        """Return the plan of a release."""
+        release_plan = {
+            "release": str(release["dir"]),
+            "unpack": False,
+            "skip_reason": None,
+            "files": [],
+            "bytes": {},
+            "seconds": None,
+        }
+
+        if release_unpacker.check_volumes:
+            release_plan["skip_reason"] = self.volume_status(
+                release_unpacker, release
+            )
+            if release_plan["skip_reason"]:
+                return release_plan
+
+        try:
+            release_unpacker_rar_files = [
+                release_unpacker.open_rar_file(
+                    rar_file_path, release_unpacker.header_cache
+                )
+                for rar_file_path in release["rar_files"]
+            ]
+            for release_unpacker_rar_file in release_unpacker_rar_files:
+                release_plan["files"].extend(
+                    self.plan_files(
+                        release_unpacker, release_unpacker_rar_file
+                    )
+                )
+            needs = release_unpacker.space_needed(release_unpacker_rar_files)
+        except (rarfile.Error, OSError, ReleaseUnpackerRarFileError) as e:
+            release_plan["skip_reason"] = str(e)
+            return release_plan
+
+        if not release_plan["files"]:
+            release_plan["skip_reason"] = "No files picked by the rules"
+        elif all(file["action"] == "exists" for file in release_plan["files"]):
+            release_plan["skip_reason"] = "Already unpacked"
+        else:
+            release_plan["unpack"] = True
+            release_plan["bytes"] = {
+                str(dir): size for dir, size in needs.items()
+            }
+
+        return release_plan
+
+    def releases(self, executor=None):
+        """Return (release_unpacker, release) of all releases in order.
+
+        With executor release sizes to order by are read in parallel.
+        """
+        return [
+            (release_unpacker, release)
+            for release_unpacker in self.release_unpackers
+            for release in release_unpacker.iter_releases(executor)
+        ]
+
+    def largest_volumes(self, releases):
+        """Return the largest volume of the releases on every device."""
+        volumes = {}
+        for _, release in releases:
+            for rar_file_path in release["rar_files"]:
+                with os.scandir(rar_file_path.parent) as entries:
+                    for entry in entries:
+                        if not entry.is_file():
+                            continue
+
+                        stat = entry.stat()
+                        largest = volumes.get(stat.st_dev)
+                        if not largest or stat.st_size > largest[1]:
+                            volumes[stat.st_dev] = (entry.path, stat.st_size)
+
+        return {device: path for device, (path, _) in volumes.items()}
+
+    def measure_read(self, path):
+        """Return bytes per second read from path."""
+        buffer = bytearray(min(self.sample_size, MB))
+        with open(path, "rb", buffering=0) as fp:
+            start = time.perf_counter()
+            read = 0
+            while read < self.sample_size:
+                size = fp.readinto(buffer)
+                if not size:
+                    break
+                read += size
+            seconds = time.perf_counter() - start
+
+        return round(read / seconds) if read and seconds else None
+
+    def measure_write(self, dir):
+        """Return bytes per second written to a probe file in dir."""
+        probe_path = Path(
+            dir, "{}plan-{}{}".format(TMP_PREFIX, os.getpid(), PARTIAL_SUFFIX)
+        )
+        data = bytes(min(self.sample_size, MB))
+        fd = os.open(probe_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        try:
+            start = time.perf_counter()
+            written = 0
+            while written < self.sample_size:
+                written += os.write(fd, data)
+            fdatasync(fd)
+            seconds = time.perf_counter() - start
+            fadvise_dontneed(fd)
+        finally:
+            os.close(fd)
+            probe_path.remove()
+
+        return round(written / seconds) if written and seconds else None
+
+    def throughput(self, releases):
+        """Return measured throughput by device.
+
+        Every device gets a dict with the path measured and the bytes per
+        second read and written, if measured.
+        """
+        throughput = {}
+        if not self.sample_size:
+            return throughput
+
+        for device, path in self.largest_volumes(releases).items():
+            throughput[device] = {
+                "path": str(path),
+                "read": self.measure_read(path),
+            }
+
+        for release_unpacker in self.release_unpackers:
+            for dir in (release_unpacker.tmp_dir, release_unpacker.unpack_dir):
+                rates = throughput.setdefault(
+                    os.stat(dir).st_dev, {"path": str(dir)}
+                )
+                if "write" not in rates:
+                    rates["write"] = self.measure_write(dir)
+
+        return throughput
+
+    def estimate(self, release_unpacker, release_plan, throughput):
+        """Return estimated seconds to unpack a release, None if unknown.
+
+        Files are read from the release device while they're written, the
+        slower of the two sets the pace. A move to another device writes
+        every file a second time.
+        """
+        size = sum(
+            file["bytes"]
+            for file in release_plan["files"]
+            if file["action"] != "exists"
+        )
+        release_device = os.stat(release_plan["release"]).st_dev
+        tmp_device = os.stat(release_unpacker.tmp_dir).st_dev
+        unpack_device = os.stat(release_unpacker.unpack_dir).st_dev
+
+        if release_unpacker.direct_extract:
+            stages = [(release_device, unpack_device)]
+        else:
+            stages = [(release_device, tmp_device)]
+            if tmp_device != unpack_device:
+                stages.append((tmp_device, unpack_device))
+
+        seconds = 0
+        for read_device, write_device in stages:
+            rates = [
+                throughput.get(read_device, {}).get("read"),
+                throughput.get(write_device, {}).get("write"),
+            ]
+            rates = [rate for rate in rates if rate]
+            if not rates:
+                return None
+            seconds += size / min(rates)
+
+        return round(seconds, 1)
+
+    def plan(self):
+        """Return the plan of all releases, ready to be dumped as JSON."""
+        with ThreadPoolExecutor(self.jobs) as executor:
+            releases = self.releases(executor)
+            throughput = self.throughput(releases)
+            release_plans = list(
+                executor.map(
+                    lambda job: self.plan_release(*job),
+                    releases,
+                )
+            )
+
+        total_bytes = {}
+        total_seconds = 0
+        for (release_unpacker, _), release_plan in zip(
+            releases, release_plans
+        ):
+            if not release_plan["unpack"]:
+                continue
+
+            for dir, size in release_plan["bytes"].items():
+                total_bytes[dir] = total_bytes.get(dir, 0) + size
+
+            release_plan["seconds"] = self.estimate(
+                release_unpacker, release_plan, throughput
+            )
+            if total_seconds is not None:
+                if release_plan["seconds"] is None:
+                    total_seconds = None
+                else:
+                    total_seconds += release_plan["seconds"]
+
+        return {
+            "releases": release_plans,
+            "unpack": sum(
+                release_plan["unpack"] for release_plan in release_plans
+            ),
+            "skip": sum(
+                not release_plan["unpack"] for release_plan in release_plans
+            ),
+            "bytes": total_bytes,
+            "free": {
+                dir: self.admission.free(dir) - self.admission.headroom
+                for dir in sorted(total_bytes)
+            },
+            "throughput": list(throughput.values()),
+            "seconds": None
+            if total_seconds is None
+            else round(total_seconds, 1),
+        }
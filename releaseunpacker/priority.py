@@ -0,0 +1,166 @@
+"""ReleaseUnpacker release ordering."""
+import fnmatch
+import logging
+import threading
+import time
+
+from .releaseunpacker import ReleaseUnpackerError
+
+log = logging.getLogger(__name__)
+
+ORDERS = ("found", "smallest", "oldest")
+AGING_TIME = 6 * 60 * 60
+
+# Sort key of releases that can't be ordered, after all others
+LAST = (2, 0, 0)
+
+
+class ReleasePriorityError(Exception):
+    """ReleasePriority error."""
+
+    pass
+
+
+def parse_category(category):
+    """Return (pattern, priority) of a PATTERN=PRIORITY category."""
+    pattern, _, priority = category.rpartition("=")
+    try:
+        priority = int(priority)
+    except ValueError:
+        priority = None
+
+    if not pattern or priority is None:
+        raise ReleasePriorityError(
+            "Category must be PATTERN=PRIORITY, got {}".format(category)
+        )
+
+    return pattern, priority
+
+
+class ReleasePriority(object):
+    """Decide the order releases are unpacked in.
+
+    Releases are ordered by the priority of their category first, higher
+    first. categories is a list of (pattern, priority) tuples, the first glob
+    that matches the release dir name, ignoring case, gives the priority,
+    releases no pattern matches get 0. Within a priority releases are
+    unpacked in the order they were found, smallest first by the size of the
+    files to unpack in the RAR headers, or oldest first by the newest mtime
+    in the release dirs. A release that was first queued by sort aging_time
+    seconds ago or more is unpacked before everything else so it's never
+    starved by smaller or higher priority releases, 0 turns aging off. Queue
+    times are kept for as long as the release dirs exist, so they only age
+    in a process that keeps running, like watch mode. Releases that can't be
+    ordered, with headers that can't be read or dirs that are gone, are
+    unpacked last.
+    """
+
+    def __init__(
+        self, order="smallest", categories=None, aging_time=AGING_TIME
+    ):
+        """Initialize and validate ReleasePriority."""
+        self.order = order
+        self.categories = [
+            (pattern.lower(), priority)
+            for pattern, priority in categories or []
+        ]
+        self.aging_time = aging_time
+        self.queued = {}
+        self.lock = threading.Lock()
+
+        if self.order not in ORDERS:
+            raise ReleasePriorityError("Invalid order {}".format(self.order))
+        elif self.aging_time < 0:
+            raise ReleasePriorityError(
+                "Aging time must be 0 or more, got {}".format(
+                    self.aging_time
+                )
+            )
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<ReleasePriority: {} ({} categories)>".format(
+            self.order, len(self.categories)
+        )
+
+    def category_priority(self, release_dir):
+        """Return priority of the category of release_dir."""
+        name = release_dir.name.lower()
+        for pattern, priority in self.categories:
+            if fnmatch.fnmatchcase(name, pattern):
+                return priority
+
+        return 0
+
+    def queue(self, release_dir, now=None):
+        """Return time release_dir was first queued, now if it's new."""
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            return self.queued.setdefault(release_dir, now)
+
+    def prune(self):
+        """Forget queue times of release dirs that are gone."""
+        with self.lock:
+            for release_dir in list(self.queued):
+                if not release_dir.exists():
+                    del self.queued[release_dir]
+
+    def key(self, release_unpacker, release, now=None):
+        """Return sort key of release found by release_unpacker."""
+        if now is None:
+            now = time.time()
+
+        queued = self.queue(release["dir"], now)
+        if self.aging_time and now - queued >= self.aging_time:
+            return 0, 0, queued
+
+        if self.order == "smallest":
+            score = release_unpacker.release_size(release)
+        elif self.order == "oldest":
+            try:
+                score = release_unpacker.release_mtime(release)
+            except OSError:
+                # Removed since it was found, it's skipped when it's unpacked
+                score = now
+        else:
+            score = 0
+
+        return 1, -self.category_priority(release["dir"]), score
+
+    def safe_key(self, release_unpacker, release, now=None):
+        """Return sort key of release, LAST if it can't be ordered."""
+        try:
+            return self.key(release_unpacker, release, now=now)
+        except (OSError, ReleaseUnpackerError) as e:
+            log.warning("Unpacking %s last: %s", release["dir"], e)
+            return LAST
+
+    def sort(self, releases, now=None, executor=None):
+        """Return (release_unpacker, release) tuples in unpack order.
+
+        With executor the sort keys, like the release sizes, are read in
+        parallel on it, else one by one.
+        """
+        if now is None:
+            now = time.time()
+
+        self.prune()
+
+        releases = list(releases)
+        keys = (executor.map if executor else map)(
+            lambda item: self.safe_key(item[0], item[1], now=now), releases
+        )
+
+        # Sorting is stable, releases with the same key keep the found order
+        releases = [
+            item
+            for _, item in sorted(
+                zip(keys, releases), key=lambda key_item: key_item[0]
+            )
+        ]
+        for _, release in releases:
+            log.debug("Unpack order: %s", release["dir"])
+
+        return releases
@@ -0,0 +1,467 @@
+"""Read RAR4 and RAR5 volume headers without unrar."""
+import contextlib
+import mmap
+import os
+import struct
+import zlib
+
+RAR4_MARKER = b"Rar!\x1a\x07\x00"
+RAR5_MARKER = b"Rar!\x1a\x07\x01\x00"
+
+# RAR4 block types and flags
+RAR4_MAIN = 0x73
+RAR4_FILE = 0x74
+RAR4_SERVICE = 0x7A
+RAR4_END = 0x7B
+
+RAR4_MHD_VOLUME = 0x0001
+RAR4_MHD_NEWNUMBERING = 0x0010
+RAR4_MHD_PASSWORD = 0x0080
+RAR4_MHD_FIRSTVOLUME = 0x0100
+
+RAR4_LHD_SPLIT_BEFORE = 0x0001
+RAR4_LHD_SPLIT_AFTER = 0x0002
+RAR4_LHD_PASSWORD = 0x0004
+RAR4_LHD_LARGE = 0x0100
+RAR4_LHD_UNICODE = 0x0200
+RAR4_LHD_DIRECTORY = 0x00E0
+RAR4_LONG_BLOCK = 0x8000
+
+RAR4_EARC_NEXT_VOLUME = 0x0001
+RAR4_EARC_DATACRC = 0x0002
+RAR4_EARC_VOLNUMBER = 0x0008
+
+RAR4_METHOD_STORE = 0x30
+
+# RAR5 header types and flags
+RAR5_MAIN = 1
+RAR5_FILE = 2
+RAR5_SERVICE = 3
+RAR5_ENCRYPTION = 4
+RAR5_END = 5
+
+RAR5_HFL_EXTRA = 0x0001
+RAR5_HFL_DATA = 0x0002
+RAR5_HFL_SPLIT_BEFORE = 0x0008
+RAR5_HFL_SPLIT_AFTER = 0x0010
+
+RAR5_MHD_VOLUME = 0x0001
+RAR5_MHD_VOLNUMBER = 0x0002
+
+RAR5_FHD_DIRECTORY = 0x0001
+RAR5_FHD_MTIME = 0x0002
+RAR5_FHD_CRC32 = 0x0004
+
+RAR5_EHD_NOT_LAST_VOLUME = 0x0001
+
+RAR5_EXTRA_ENCRYPTION = 0x01
+RAR5_EXTRA_HASH = 0x02
+RAR5_HASH_BLAKE2SP = 0
+
+RAR4_BLOCK = struct.Struct("<HBHH")
+RAR4_FILE_HEADER = struct.Struct("<IIBIIBBHI")
+
+
+class RarHeaderError(Exception):
+    """RAR header error."""
+
+    pass
+
+
+class RarHeaderTruncatedError(RarHeaderError):
+    """RAR volume ends before its headers say it should."""
+
+    pass
+
+
+def read_vint(buffer, offset):
+    """Return RAR5 variable length integer and offset after it."""
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(buffer):
+            raise RarHeaderError("Truncated vint")
+
+        byte = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+
+        shift += 7
+        if shift > 63:
+            raise RarHeaderError("Invalid vint")
+
+
+def decode_rar4_name(name):
+    """Return RAR4 unicode file name.
+
+    The name is the 8-bit name, a zero byte and the UTF-16 name compressed
+    against the 8-bit name. Without a zero byte the name is UTF-8.
+    """
+    if b"\0" not in name:
+        return name.decode("utf-8", "replace")
+
+    std_name, encoded = name.split(b"\0", 1)
+    chars = bytearray()
+    try:
+        high_byte = encoded[0]
+        position = 1
+        flag_bits = 0
+        while position < len(encoded):
+            if not flag_bits:
+                flags = encoded[position]
+                position += 1
+                flag_bits = 8
+
+            flag_bits -= 2
+            char_type = (flags >> flag_bits) & 3
+            if char_type == 0:
+                chars += bytes((encoded[position], 0))
+                position += 1
+            elif char_type == 1:
+                chars += bytes((encoded[position], high_byte))
+                position += 1
+            elif char_type == 2:
+                chars += encoded[position : position + 2]
+                position += 2
+            else:
+                # Run of chars from the 8-bit name, with a correction added
+                length = encoded[position]
+                position += 1
+                if length & 0x80:
+                    correction = encoded[position]
+                    position += 1
+                    for _ in range((length & 0x7F) + 2):
+                        low_byte = std_name[len(chars) // 2] + correction
+                        chars += bytes((low_byte & 0xFF, high_byte))
+                else:
+                    for _ in range(length + 2):
+                        chars += bytes((std_name[len(chars) // 2], 0))
+    except IndexError:
+        return std_name.decode("utf-8", "replace")
+
+    return chars.decode("utf-16le", "replace")
+
+
+def read_exact(buffer, offset, size):
+    """Return view of size bytes at offset or raise RarHeaderTruncatedError."""
+    data = buffer[offset : offset + size]
+    if len(data) != size:
+        raise RarHeaderTruncatedError(
+            "Expected {} bytes at {}, got {}".format(size, offset, len(data))
+        )
+
+    return data
+
+
+def new_volume(path, fmt, size):
+    """Return an empty parsed volume dict."""
+    return {
+        "path": path,
+        "format": fmt,
+        "size": size,
+        "volume": False,
+        "first_volume": True,
+        "new_naming": False,
+        "volume_number": None,
+        "more_volumes": None,
+        "headers_encrypted": False,
+        "end_offset": None,
+        "files": [],
+    }
+
+
+def new_file(name, size, packed_size, data_offset, **kwargs):
+    """Return a parsed file entry dict."""
+    file = {
+        "name": name,
+        "size": size,
+        "packed_size": packed_size,
+        "data_offset": data_offset,
+        "crc": None,
+        "blake2sp": None,
+        "stored": False,
+        "encrypted": False,
+        "directory": False,
+        "split_before": False,
+        "split_after": False,
+    }
+    file.update(kwargs)
+
+    return file
+
+
+def read_rar4(buffer, volume):
+    """Read RAR4 blocks from buffer after the marker."""
+    offset = len(RAR4_MARKER)
+    while True:
+        if offset >= len(buffer):
+            # No end of archive block, old RAR versions don't write one
+            break
+        elif offset + RAR4_BLOCK.size > len(buffer):
+            raise RarHeaderTruncatedError("Truncated block header")
+
+        crc, block_type, flags, head_size = RAR4_BLOCK.unpack_from(
+            buffer, offset
+        )
+        if head_size < RAR4_BLOCK.size:
+            raise RarHeaderError(
+                "Invalid block size {} at {}".format(head_size, offset)
+            )
+
+        header = read_exact(buffer, offset, head_size)
+        if zlib.crc32(header[2:]) & 0xFFFF != crc:
+            raise RarHeaderError(
+                "Block header CRC mismatch at {}".format(offset)
+            )
+
+        add_size = 0
+        if block_type in (RAR4_FILE, RAR4_SERVICE) or flags & RAR4_LONG_BLOCK:
+            (add_size,) = struct.unpack_from("<I", header, RAR4_BLOCK.size)
+
+        if block_type == RAR4_MAIN:
+            volume["volume"] = bool(flags & RAR4_MHD_VOLUME)
+            volume["new_naming"] = bool(flags & RAR4_MHD_NEWNUMBERING)
+            volume["first_volume"] = bool(
+                not volume["volume"] or flags & RAR4_MHD_FIRSTVOLUME
+            )
+            if flags & RAR4_MHD_PASSWORD:
+                volume["headers_encrypted"] = True
+                return volume
+        elif block_type == RAR4_FILE:
+            (
+                packed_size,
+                size,
+                _,
+                file_crc,
+                _,
+                _,
+                method,
+                name_size,
+                _,
+            ) = RAR4_FILE_HEADER.unpack_from(header, RAR4_BLOCK.size)
+            name_offset = RAR4_BLOCK.size + RAR4_FILE_HEADER.size
+            if flags & RAR4_LHD_LARGE:
+                high_packed_size, high_size = struct.unpack_from(
+                    "<II", header, name_offset
+                )
+                packed_size |= high_packed_size << 32
+                size |= high_size << 32
+                name_offset += 8
+
+            name = bytes(header[name_offset : name_offset + name_size])
+            if flags & RAR4_LHD_UNICODE:
+                name = decode_rar4_name(name)
+            else:
+                name = name.decode("utf-8", "replace")
+            add_size = packed_size
+
+            volume["files"].append(
+                new_file(
+                    name.replace("\\", "/"),
+                    size,
+                    packed_size,
+                    offset + head_size,
+                    crc=file_crc,
+                    stored=method == RAR4_METHOD_STORE,
+                    encrypted=bool(flags & RAR4_LHD_PASSWORD),
+                    directory=(
+                        flags & RAR4_LHD_DIRECTORY == RAR4_LHD_DIRECTORY
+                    ),
+                    split_before=bool(flags & RAR4_LHD_SPLIT_BEFORE),
+                    split_after=bool(flags & RAR4_LHD_SPLIT_AFTER),
+                )
+            )
+        elif block_type == RAR4_END:
+            volume["more_volumes"] = bool(flags & RAR4_EARC_NEXT_VOLUME)
+            position = RAR4_BLOCK.size
+            if flags & RAR4_EARC_DATACRC:
+                position += 4
+            if flags & RAR4_EARC_VOLNUMBER and len(header) >= position + 2:
+                (volume["volume_number"],) = struct.unpack_from(
+                    "<H", header, position
+                )
+            offset += head_size
+            break
+
+        offset += head_size + add_size
+
+    volume["end_offset"] = offset
+
+    return volume
+
+
+def read_rar5(buffer, volume):
+    """Read RAR5 headers from buffer after the marker."""
+    offset = len(RAR5_MARKER)
+    while True:
+        start = buffer[offset : offset + 7]
+        if not start:
+            break
+        elif len(start) < 5:
+            raise RarHeaderTruncatedError("Truncated header")
+
+        (crc,) = struct.unpack_from("<I", start)
+        header_size, position = read_vint(start, 4)
+        if not header_size or header_size > 2 * 1024 * 1024:
+            raise RarHeaderError(
+                "Invalid header size {} at {}".format(header_size, offset)
+            )
+
+        header = read_exact(buffer, offset, position + header_size)
+        if zlib.crc32(header[4:]) != crc:
+            raise RarHeaderError("Header CRC mismatch at {}".format(offset))
+
+        header_type, position = read_vint(header, position)
+        header_flags, position = read_vint(header, position)
+        extra_size = data_size = 0
+        if header_flags & RAR5_HFL_EXTRA:
+            extra_size, position = read_vint(header, position)
+        if header_flags & RAR5_HFL_DATA:
+            data_size, position = read_vint(header, position)
+        extra_offset = len(header) - extra_size
+
+        if header_type == RAR5_MAIN:
+            archive_flags, position = read_vint(header, position)
+            volume["volume"] = bool(archive_flags & RAR5_MHD_VOLUME)
+            if archive_flags & RAR5_MHD_VOLNUMBER:
+                volume["volume_number"], position = read_vint(
+                    header, position
+                )
+            volume["first_volume"] = not volume["volume_number"]
+        elif header_type == RAR5_FILE:
+            volume["files"].append(
+                read_rar5_file(
+                    header,
+                    position,
+                    extra_offset,
+                    header_flags,
+                    data_size,
+                    offset + len(header),
+                )
+            )
+        elif header_type == RAR5_ENCRYPTION:
+            volume["headers_encrypted"] = True
+            return volume
+        elif header_type == RAR5_END:
+            end_flags, position = read_vint(header, position)
+            volume["more_volumes"] = bool(
+                end_flags & RAR5_EHD_NOT_LAST_VOLUME
+            )
+            offset += len(header)
+            break
+
+        offset += len(header) + data_size
+
+    volume["end_offset"] = offset
+
+    return volume
+
+
+def read_rar5_file(
+    header, position, extra_offset, header_flags, data_size, data_offset
+):
+    """Return file entry from a RAR5 file header."""
+    file_flags, position = read_vint(header, position)
+    size, position = read_vint(header, position)
+    _, position = read_vint(header, position)
+    if file_flags & RAR5_FHD_MTIME:
+        position += 4
+    crc = None
+    if file_flags & RAR5_FHD_CRC32:
+        (crc,) = struct.unpack_from("<I", header, position)
+        position += 4
+    compression, position = read_vint(header, position)
+    _, position = read_vint(header, position)
+    name_size, position = read_vint(header, position)
+    name = bytes(header[position : position + name_size])
+
+    encrypted = False
+    blake2sp = None
+    position = extra_offset
+    while position < len(header):
+        record_size, position = read_vint(header, position)
+        record_end = position + record_size
+        record_type, record_position = read_vint(header, position)
+        if record_type == RAR5_EXTRA_ENCRYPTION:
+            encrypted = True
+        elif record_type == RAR5_EXTRA_HASH:
+            hash_type, record_position = read_vint(header, record_position)
+            if hash_type == RAR5_HASH_BLAKE2SP:
+                blake2sp = bytes(
+                    header[record_position : record_position + 32]
+                ).hex()
+        position = record_end
+
+    return new_file(
+        name.decode("utf-8", "replace"),
+        size,
+        data_size,
+        data_offset,
+        crc=crc,
+        blake2sp=blake2sp,
+        stored=(compression >> 7) & 0x07 == 0,
+        encrypted=encrypted,
+        directory=bool(file_flags & RAR5_FHD_DIRECTORY),
+        split_before=bool(header_flags & RAR5_HFL_SPLIT_BEFORE),
+        split_after=bool(header_flags & RAR5_HFL_SPLIT_AFTER),
+    )
+
+
+def read_buffer(buffer, path=None):
+    """Return parsed headers of the RAR volume in buffer.
+
+    buffer is any object with the buffer protocol, like an mmap or the bytes
+    of a RAR read into memory. Headers are parsed with struct from views of
+    buffer, data is skipped without being copied. Raises
+    RarHeaderTruncatedError if buffer is shorter than the headers say, like
+    a volume that is still being copied.
+    """
+    view = memoryview(buffer)
+    size = len(view)
+    marker = bytes(view[: len(RAR5_MARKER)])
+    if marker.startswith(RAR4_MARKER):
+        volume = read_rar4(view, new_volume(path, 4, size))
+    elif marker == RAR5_MARKER:
+        volume = read_rar5(view, new_volume(path, 5, size))
+    elif len(marker) < len(RAR4_MARKER):
+        raise RarHeaderTruncatedError("Missing RAR marker")
+    else:
+        raise RarHeaderError("Not a RAR file {}".format(path))
+
+    if volume["end_offset"] is not None and volume["end_offset"] > size:
+        raise RarHeaderTruncatedError(
+            "{} is {} bytes, expected {}".format(
+                path, size, volume["end_offset"]
+            )
+        )
+
+    # More volumes from the last file if there is no end of archive block
+    if volume["more_volumes"] is None:
+        volume["more_volumes"] = bool(
+            volume["files"] and volume["files"][-1]["split_after"]
+        )
+
+    return volume
+
+
+def read_volume(path):
+    """Return parsed headers of the RAR volume at path.
+
+    The volume is mapped into memory and only the pages with headers are
+    read from disk.
+    """
+    with open(path, "rb") as fp:
+        if not os.fstat(fp.fileno()).st_size:
+            raise RarHeaderTruncatedError("Missing RAR marker")
+
+        buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        return read_buffer(buffer, path)
+    finally:
+        # Views held by the traceback of an error keep the map open until
+        # they're freed
+        with contextlib.suppress(BufferError):
+            buffer.close()
@@ -1,15 +1,38 @@
 """ReleaseUnpacker."""
+import functools
 import logging
 import os
+import shutil
+import time
 from datetime import datetime
 
 import rarfile
 from ago import human
 from lazy import lazy
-from unipath import DIRS, FILES, Path
+from unipath import Path
+
+from .claim import ReleaseClaimsError
+from .discovery import iter_rar_files, iter_releases, release_dir
+from .journal import PARTIAL_SUFFIX, TMP_PREFIX, Checkpoint
+from .lib import (
+    copy_fileobj,
+    fadvise_dontneed,
+    fadvise_dontneed_file,
+    fdatasync,
+    preallocate,
+)
+from .metrics import Metrics
+from .nested import NestedArchives
+from .rules import Rules
+from .storecopy import copy_stored_file, stored_parts
+from .verify import Verifier
+from .volumes import COMPLETE, STALL_TIME, STALLED, VolumeSet
 
 log = logging.getLogger(__name__)
 
+EXTRACT_MODES = ("auto", "direct", "tmp")
+BUFFER_SIZE = 16 * 1024 * 1024
+
 
 class ReleaseUnpackerError(Exception):
     """ReleaseUnpacker unpack error."""
@@ -23,11 +46,63 @@ class ReleaseUnpackerRarFileError(Exception):
     pass
 
 
+class ReleaseProgress(object):
+    """Bytes unpacked of a release.
+
+    callback is called with the release dir, bytes done and bytes total
+    every time bytes are unpacked. Files that were already unpacked count as
+    done when they're skipped.
+    """
+
+    def __init__(self, release_dir, total, callback):
+        """Initialize ReleaseProgress."""
+        self.release_dir = release_dir
+        self.total = total
+        self.callback = callback
+        self.done = 0
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<ReleaseProgress: {} ({}/{})>".format(
+            self.release_dir, self.done, self.total
+        )
+
+    def update(self, size):
+        """Add size bytes done and call callback."""
+        self.done += size
+        self.callback(self.release_dir, self.done, self.total)
+
+
 class ReleaseUnpacker(object):
     """ReleaseUnpacker."""
 
     def __init__(
-        self, release_search_dir, tmp_dir, unpack_dir, no_remove=False
+        self,
+        release_search_dir,
+        tmp_dir,
+        unpack_dir,
+        no_remove=False,
+        extract_mode="auto",
+        scan_index=None,
+        check_volumes=True,
+        sfv_crc=False,
+        stall_time=STALL_TIME,
+        metrics=None,
+        header_cache=None,
+        verify=True,
+        verifier=None,
+        remover=None,
+        progress=None,
+        buffer_size=BUFFER_SIZE,
+        preallocate=True,
+        drop_cache=False,
+        admission=None,
+        rules=None,
+        claims=None,
+        nested=None,
+        priority=None,
+        pipeline=None,
+        throttle=None,
     ):
         """Initialize and validate ReleaseUnpacker."""
         self.release_search_dir = Path(release_search_dir)
@@ -35,6 +110,29 @@ class ReleaseUnpacker(object):
         self.tmp_dir = Path(tmp_dir)
         self.unpack_dir = Path(unpack_dir)
         self.no_remove = no_remove
+        self.extract_mode = extract_mode
+        self.scan_index = scan_index
+        self.check_volumes = check_volumes
+        self.sfv_crc = sfv_crc
+        self.stall_time = stall_time
+        self.metrics = metrics or Metrics()
+        self.header_cache = header_cache
+        self.verify = verify
+        self.verifier = verifier or Verifier(sidecar_dir=self.tmp_dir)
+        self.remover = remover
+        self.progress = progress
+        self.buffer_size = buffer_size
+        self.preallocate = preallocate
+        self.drop_cache = drop_cache
+        self.admission = admission
+        self.rules = rules or Rules()
+        self.claims = claims
+        self.nested = nested or NestedArchives(spool_dir=self.tmp_dir)
+        self.priority = priority
+        self.pipeline = pipeline
+        self.throttle = throttle
+        self.deferred = []
+        self.failed = []
 
         if not self.release_search_dir_abs.exists():
             raise ReleaseUnpackerError(
@@ -64,6 +162,16 @@ class ReleaseUnpacker(object):
             raise ReleaseUnpackerError(
                 "Unpack dir {} is not a dir".format(self.unpack_dir)
             )
+        elif self.extract_mode not in EXTRACT_MODES:
+            raise ReleaseUnpackerError(
+                "Invalid extract mode {}".format(self.extract_mode)
+            )
+        elif self.buffer_size < 1:
+            raise ReleaseUnpackerError(
+                "Buffer size must be 1 or more, got {}".format(
+                    self.buffer_size
+                )
+            )
 
     def __repr__(self):
         """Return object string representation."""
@@ -71,6 +179,21 @@ class ReleaseUnpacker(object):
             self.release_search_dir_abs, self.tmp_dir, self.unpack_dir
         )
 
+    @lazy
+    def direct_extract(self):
+        """Return True if files should be streamed directly to unpack_dir.
+
+        In auto mode files are streamed directly when tmp_dir and unpack_dir
+        are on different filesystems, the move from tmp_dir would copy every
+        byte a second time. On the same filesystem the move is a rename.
+        """
+        if self.extract_mode == "auto":
+            return os.stat(self.tmp_dir).st_dev != os.stat(
+                self.unpack_dir
+            ).st_dev
+        else:
+            return self.extract_mode == "direct"
+
     def file_exists_size_match(self, unpack_file_path, size_in_rar):
         """Return True if unpack_file_path exists already and size matches."""
         if (
@@ -82,140 +205,520 @@ class ReleaseUnpacker(object):
         else:
             return False
 
-    def unpack_release_dir_rars(self):
+    def existing_files_match(self, unpack_files):
+        """Return unpack file paths that exist already and match the RAR.
+
+        unpack_files is a list of (unpack_file_path, rarfile_file) tuples.
+        Files with the right size are verified against the hashes in the RAR
+        headers, all files in parallel.
+        """
+        unpack_files = [
+            (unpack_file_path, rarfile_file)
+            for unpack_file_path, rarfile_file in unpack_files
+            if self.file_exists_size_match(
+                unpack_file_path, rarfile_file["size"]
+            )
+        ]
+        if not self.verify or not unpack_files:
+            return {unpack_file_path for unpack_file_path, _ in unpack_files}
+
+        return self.verifier.verify(unpack_files)
+
+    def open_rar_file(self, rar_file_path, header_cache=None):
+        """Return ReleaseUnpackerRarFile with the write options."""
+        return ReleaseUnpackerRarFile(
+            rar_file_path,
+            self.metrics,
+            header_cache,
+            buffer_size=self.buffer_size,
+            preallocate=self.preallocate,
+            drop_cache=self.drop_cache,
+            throttle=self.throttle,
+        )
+
+    def unpack_release_dir_rars(self, keep_going=False):
         """Run unpacker.
 
-        Unpack all whitelisted file extensions found in RAR files.
+        Unpack all whitelisted file extensions found in RAR files. With
+        keep_going a failing release is logged and recorded in failed, the
+        other releases are still unpacked.
         """
-        # Scan for RAR files
-        self.rar_files = self.scan_rars()
+        # Unpack releases as they are found, the scan time is the time spent
+        # waiting for the next release
+        rar_files = []
+        releases = self.iter_releases()
+        scan_seconds = 0
+        while True:
+            scan_start = time.perf_counter()
+            release = next(releases, None)
+            scan_seconds += time.perf_counter() - scan_start
+            if release is None:
+                break
+
+            rar_files.extend(release["rar_files"])
+            if not keep_going:
+                self.unpack_release(release)
+                continue
+
+            try:
+                self.unpack_release(release)
+            except Exception as e:
+                log.error("Unpack of %s failed: %s", release["dir"], e)
+                self.failed.append((release, e))
+
+        self.metrics.emit(
+            "scan",
+            scan_seconds,
+            dir=str(self.release_search_dir_abs),
+            rar_files=len(rar_files),
+        )
+
+        self.rar_files = rar_files
         if not self.rar_files:
             log.debug("No RARs found in %s", self.release_search_dir_abs)
             return False
 
-        # Process the RAR files in any were found
-        for rar_file_path in self.rar_files:
-            log.debug("Found RAR file %s", rar_file_path)
+        return self
+
+    def iter_releases(self, executor=None):
+        """Yield releases in release_search_dir as they are found.
+
+        Without a scan index releases are yielded while the search dir is
+        still being walked. With priority all releases are found first and
+        yielded in the order it decides, with executor the releases it orders
+        by size are read in parallel.
+        """
+        if self.priority:
+            for _, release in self.priority.sort(
+                [(self, release) for release in self.scan_releases()],
+                executor=executor,
+            ):
+                yield release
+        elif self.scan_index:
+            yield from self.scan_releases()
+        else:
+            yield from iter_releases(self.release_search_dir_abs)
+
+    def scan_releases(self):
+        """Scan release_search_dir and return RAR files grouped by release."""
+        self.rar_files = self.scan_rars()
+
+        return self.group_releases(self.rar_files)
+
+    def group_releases(self, rar_files):
+        """Group rar_files by release dir.
+
+        A RAR file in a Subs folder belongs to the release dir above it.
+        Return a list of dicts with the release dir and its RAR files in scan
+        order.
+        """
+        releases = []
+        release_dirs = {}
+        for rar_file_path in rar_files:
+            dir = release_dir(rar_file_path)
+            if dir not in release_dirs:
+                release_dirs[dir] = {"dir": dir, "rar_files": []}
+                releases.append(release_dirs[dir])
 
-            release_unpacker_rar_file = ReleaseUnpackerRarFile(rar_file_path)
-            if release_unpacker_rar_file.subs_dir:
-                self.unpack_subs_rar(release_unpacker_rar_file)
+            release_dirs[dir]["rar_files"].append(rar_file_path)
+
+        return releases
+
+    def release_complete(self, release):
+        """Return True if the volume sets of all RAR files are complete.
+
+        Only the volume headers are read, releases that are still being
+        copied are deferred without opening the archives.
+        """
+        for rar_file_path in release["rar_files"]:
+            volume_set = VolumeSet(
+                rar_file_path,
+                self.stall_time,
+                self.header_cache,
+                sfv_crc=self.sfv_crc,
+            )
+            with self.metrics.timer(
+                "volume_check", file=str(rar_file_path)
+            ) as fields:
+                fields["status"] = volume_set.status
+            if volume_set.status == COMPLETE:
+                continue
+
+            if volume_set.status == STALLED:
+                log.warning(
+                    "Skipping %s, volume set stalled: %s",
+                    release["dir"],
+                    volume_set.reason,
+                )
             else:
-                self.unpack_rar(release_unpacker_rar_file)
+                log.info(
+                    "Deferring %s, volume set incomplete: %s",
+                    release["dir"],
+                    volume_set.reason,
+                )
 
-        # Remove release dirs when unpack is done
-        self.remove_release_dirs()
+            return False
 
-        return self
+        return True
+
+    def release_size(self, release):
+        """Return bytes to unpack from release read from the RAR headers.
+
+        Raises ReleaseUnpackerError if the headers can't be read.
+        """
+        try:
+            return sum(
+                self.unpack_size(
+                    self.open_rar_file(rar_file_path, self.header_cache)
+                )
+                for rar_file_path in release["rar_files"]
+            )
+        except (rarfile.Error, OSError, ReleaseUnpackerRarFileError) as e:
+            raise ReleaseUnpackerError(
+                "Can't read size of {}: {}".format(release["dir"], e)
+            )
+
+    def release_mtime(self, release):
+        """Return newest mtime of the files in the release dirs."""
+        newest = 0
+        for rar_file_path in release["rar_files"]:
+            with os.scandir(rar_file_path.parent) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        newest = max(newest, entry.stat().st_mtime)
+
+        return newest
+
+    def unpack_size(self, release_unpacker_rar_file):
+        """Return bytes to unpack from a RAR file.
+
+        Nested archives count with their size in the RAR, what's in them isn't
+        known until they're opened.
+        """
+        rarfile_files = [
+            rarfile_file
+            for _, rarfile_file in self.unpack_files(release_unpacker_rar_file)
+        ] + self.nested_files(release_unpacker_rar_file)
+
+        return sum(rarfile_file["size"] for rarfile_file in rarfile_files)
+
+    def space_needed(self, release_unpacker_rar_files):
+        """Return bytes to write per dir for files not unpacked yet.
+
+        Files are written to unpack_dir when streamed directly, else to
+        tmp_dir and to unpack_dir as well when the move is a copy.
+        """
+        size = 0
+        for release_unpacker_rar_file in release_unpacker_rar_files:
+            unpack_files = self.unpack_files(release_unpacker_rar_file)
+            for unpack_file_path, rarfile_file in unpack_files:
+                if not (
+                    unpack_file_path.exists()
+                    and unpack_file_path.size() == rarfile_file["size"]
+                ):
+                    size += rarfile_file["size"]
+
+            # Files in nested archives are about as big as the archives
+            nested_files = self.nested_files(release_unpacker_rar_file)
+            size += sum(rarfile_file["size"] for rarfile_file in nested_files)
+
+        if self.direct_extract:
+            return {self.unpack_dir: size}
+
+        needs = {self.tmp_dir: size}
+        if os.stat(self.tmp_dir).st_dev != os.stat(self.unpack_dir).st_dev:
+            needs[self.unpack_dir] = size
+
+        return needs
+
+    def unpack_release(self, release):
+        """Unpack release, add its dir to deferred if it isn't unpacked.
+
+        Return False if the release was skipped or deferred, exceptions are
+        raised after the release dir is added.
+        """
+        unpacked = False
+        try:
+            unpacked = self.claim_release(release)
+        finally:
+            if not unpacked:
+                self.deferred.append(release["dir"])
+
+        return unpacked
+
+    def claim_release(self, release):
+        """Unpack release if it can be claimed.
+
+        Without claims every release is unpacked. With claims releases
+        claimed by other workers are skipped, the claim is held until the
+        release dir is removed. A release whose claim is lost while it's
+        unpacked is left as it is. Return False if the release was skipped,
+        deferred or its claim was lost.
+        """
+        if not self.claims:
+            return self.unpack_claimed_release(release)
+
+        lease = self.claims.claim(release["dir"])
+        if not lease:
+            return False
+
+        try:
+            # Unpacked and removed by another worker since it was found
+            if not release["dir"].exists():
+                log.debug("Skipping %s, removed", release["dir"])
+                return False
+
+            return self.unpack_claimed_release(release, lease)
+        except ReleaseClaimsError as e:
+            log.error("Aborting %s: %s", release["dir"], e)
+            return False
+        finally:
+            self.finish(
+                release["dir"],
+                functools.partial(self.release_claim, lease, release["dir"]),
+                always=True,
+            )
+
+    def release_claim(self, lease, dir):
+        """Release claim on dir, kept until dir is removed if it's queued."""
+        self.claims.release(
+            lease, linger=bool(self.remover and self.remover.pending(dir))
+        )
+
+    def finish(self, release_dir, job, always=False):
+        """Run job of release_dir now or after its queued moves.
+
+        With a pipeline the job is queued behind the moves of release_dir,
+        with always it runs even if one of them failed.
+        """
+        if self.pipeline:
+            self.pipeline.submit(release_dir, job, always=always)
+        else:
+            job()
+
+    def extract_dir(self, release_unpacker_rar_file):
+        """Return tmp dir files of a RAR file are extracted to.
+
+        Every release gets a dir of its own, releases unpacked at the same
+        time can contain files with the same name. The dir name doesn't
+        change between runs so a killed extract can be resumed.
+        """
+        return Path(
+            self.tmp_dir,
+            "{}{}".format(TMP_PREFIX, release_unpacker_rar_file.name),
+        )
+
+    def unpack_claimed_release(self, release, lease=None):
+        """Unpack all RAR files in release and remove the release dirs.
+
+        Return False if the release was deferred. With a progress callback
+        the bytes to unpack are counted from the headers first. With
+        admission space is reserved for the release before it's unpacked.
+        With a lease ReleaseClaimsError is raised between files if the claim
+        was lost, before anything is removed.
+        """
+        release_name = str(release["dir"])
+        with self.metrics.timer("release", release=release_name) as fields:
+            if self.remover and self.remover.pending(release["dir"]):
+                log.debug("Skipping %s, removal pending", release["dir"])
+                fields["deferred"] = True
+                return False
+
+            if self.pipeline and self.pipeline.pending(release["dir"]):
+                log.debug("Skipping %s, move pending", release["dir"])
+                fields["deferred"] = True
+                return False
+
+            if self.check_volumes and not self.release_complete(release):
+                fields["deferred"] = True
+                return False
+
+            release_mtime = self.release_mtime(release)
+
+            release_unpacker_rar_files = [
+                self.open_rar_file(rar_file_path, self.header_cache)
+                for rar_file_path in release["rar_files"]
+            ]
+            for release_unpacker_rar_file in release_unpacker_rar_files:
+                release_unpacker_rar_file.lease = lease
+
+            # Wait for disk space or skip the release if it doesn't fit
+            reservation = None
+            if self.admission:
+                reservation = self.admission.admit(
+                    release_name,
+                    self.space_needed(release_unpacker_rar_files),
+                )
+                if not reservation:
+                    fields["deferred"] = True
+                    return False
+
+                for release_unpacker_rar_file in release_unpacker_rar_files:
+                    release_unpacker_rar_file.reservation = reservation
+
+            try:
+                if self.progress:
+                    progress = ReleaseProgress(
+                        release["dir"],
+                        sum(
+                            map(self.unpack_size, release_unpacker_rar_files)
+                        ),
+                        self.progress,
+                    )
+                    progress.update(0)
+                    for rar_file in release_unpacker_rar_files:
+                        rar_file.progress = progress
+
+                for release_unpacker_rar_file in release_unpacker_rar_files:
+                    log.debug(
+                        "Found RAR file %s",
+                        release_unpacker_rar_file.rar_file_path,
+                    )
+
+                    self.unpack_rar(release_unpacker_rar_file)
+
+                # Remove release dirs when unpack is done
+                self.finish(
+                    release["dir"],
+                    functools.partial(
+                        self.finish_release,
+                        release_unpacker_rar_files,
+                        release["rar_files"],
+                    ),
+                )
+            finally:
+                if reservation:
+                    self.finish(
+                        release["dir"], reservation.release, always=True
+                    )
+
+            # Time from the last write to the release until it's unpacked
+            fields["latency_seconds"] = round(time.time() - release_mtime, 3)
+
+        return True
+
+    def finish_release(self, release_unpacker_rar_files, rar_files):
+        """Remove the extract dirs and release dirs of an unpacked release.
+
+        Extract dirs are kept until the last file of the release is moved.
+        """
+        for release_unpacker_rar_file in release_unpacker_rar_files:
+            release_unpacker_rar_file.check_lease()
+
+        if self.pipeline:
+            for release_unpacker_rar_file in release_unpacker_rar_files:
+                self.extract_dir(release_unpacker_rar_file).rmtree()
+
+        self.remove_release_dirs(rar_files)
 
     def scan_rars(self):
         """Scan release_search_dir for .rar files.
 
         Find all sub folders and return a list of the first .rar file in
-        each folder if any is found.
+        each folder if any is found. With a scan index only folders changed
+        since the last scan are listed.
         """
-        scan_dirs = [
-            dir for dir in self.release_search_dir_abs.walk(filter=DIRS)
-        ]
-        scan_dirs.append(self.release_search_dir_abs)
+        if self.scan_index:
+            return self.scan_index.scan(self.release_search_dir_abs)
 
-        rar_files = []
-        for dir in scan_dirs:
-            rar_files_found = dir.listdir(pattern="*.rar", filter=FILES)
-            if rar_files_found:
-                rar_files.append(rar_files_found[0])
+        return list(iter_rar_files(self.release_search_dir_abs))
+
+    def remove_release_dirs(self, rar_files=None):
+        """Remove all release dirs from rar_files list.
 
-        return rar_files
+        With a remover the dirs are removed in the background, dirs inside
+        another dir being removed are left to that dir.
+        """
+        if rar_files is None:
+            rar_files = self.rar_files
 
-    def remove_release_dirs(self):
-        """Remove all release dirs from rar_files list."""
-        for rar_file_path in self.rar_files:
-            release_dir = rar_file_path.parent
+        release_dirs = [rar_file_path.parent for rar_file_path in rar_files]
+        for release_dir in release_dirs:
             if release_dir.exists():
                 if self.no_remove:
                     log.info("No remove active, not removing %s", release_dir)
+                elif self.remover:
+                    if any(
+                        release_dir.startswith(dir + os.sep)
+                        for dir in release_dirs
+                    ):
+                        continue
+
+                    log.info(
+                        "Unpack complete, queueing removal of %s", release_dir
+                    )
+                    self.remover.remove(release_dir)
                 else:
                     log.info("Unpack complete, removing %s", release_dir)
-                    release_dir.rmtree()
+                    with self.metrics.timer("rmtree", dir=str(release_dir)):
+                        release_dir.rmtree()
 
-    def unpack_subs_rar(self, release_unpacker_rar_file):
-        """Unpack a RAR in a Subs folder."""
-        log.debug(
-            "Processing subs RAR file %s",
-            release_unpacker_rar_file.rar_file_path_abs,
-        )
+    def section(self, release_unpacker_rar_file):
+        """Return the rules section of files in a RAR file."""
+        if release_unpacker_rar_file.subs_dir:
+            return "subs"
 
-        for rarfile_file in release_unpacker_rar_file.file_list:
-            # File in RAR is not a RAR file, extract
-            if rarfile_file["name"].ext != ".rar":
-                unpack_filename = "{}{}".format(
-                    release_unpacker_rar_file.name, rarfile_file["name"].ext
-                )
-                unpack_file_path_abs = Path(self.unpack_dir, unpack_filename)
+        return "files"
 
-                # File exists and size match
-                if self.file_exists_size_match(
-                    unpack_file_path_abs, rarfile_file["size"]
-                ):
-                    continue
+    def nested_files(self, release_unpacker_rar_file):
+        """Return rarfile_files of archives nested in a RAR file."""
+        if not self.nested.max_depth:
+            return []
 
-                self.unpack_move_rar_file(
-                    release_unpacker_rar_file,
-                    rarfile_file["name"],
-                    unpack_file_path_abs,
-                )
-            # RAR file in RAR, extract to Subs folder and extract RAR
-            else:
-                log.debug(
-                    "RAR file %s in %s",
-                    rarfile_file["name"],
-                    release_unpacker_rar_file.rar_file_path_abs,
-                )
+        return [
+            rarfile_file
+            for rarfile_file in release_unpacker_rar_file.file_list
+            if self.nested.is_archive(rarfile_file["name"])
+        ]
 
-                # Extract the RAR to Subs folder
-                subs_dir = release_unpacker_rar_file.rar_file_path_abs.parent
-                log.debug(
-                    "Extracting %s to %s", rarfile_file["name"], subs_dir
-                )
+    def unpack_files(self, release_unpacker_rar_file):
+        """Return (unpack_file_path, rarfile_file) of files to unpack.
 
-                extracted_file_path = release_unpacker_rar_file.extract_file(
-                    rarfile_file["name"], subs_dir
-                )
+        The rules pick the files and their names, files in a Subs RAR get the
+        subs rules. Nested archives are left to unpack_nested. Raises
+        ReleaseUnpackerRarFileError if a file to unpack is encrypted.
+        """
+        nested_files = self.nested_files(release_unpacker_rar_file)
+        rarfile_files = [
+            rarfile_file
+            for rarfile_file in release_unpacker_rar_file.file_list
+            if rarfile_file not in nested_files
+        ]
 
-                # Extract the extracted Subs RAR file
-                self.unpack_subs_rar(
-                    ReleaseUnpackerRarFile(extracted_file_path)
-                )
+        unpack_files = [
+            (Path(self.unpack_dir, unpack_name), rarfile_file)
+            for unpack_name, rarfile_file in self.rules.apply(
+                self.section(release_unpacker_rar_file),
+                release_unpacker_rar_file.name,
+                rarfile_files,
+            )
+        ]
 
-                # Remove RAR file in Subs folder
-                log.debug(
-                    "Removing extracted Subs RAR %s", extracted_file_path
+        # Fail before anything is written, there's no password to give
+        for rarfile_file in [
+            rarfile_file for _, rarfile_file in unpack_files
+        ] + nested_files:
+            if rarfile_file["encrypted"]:
+                raise ReleaseUnpackerRarFileError(
+                    "{} in {} is encrypted".format(
+                        rarfile_file["name"],
+                        release_unpacker_rar_file.rar_file_path,
+                    )
                 )
-                extracted_file_path.remove()
+
+        return unpack_files
 
     def unpack_rar(self, release_unpacker_rar_file):
-        """Unpack RAR files. Only process whitelisted file extensions."""
-        for rarfile_file in release_unpacker_rar_file.file_list:
-            # Check file extension
-            if rarfile_file["name"].ext not in (
-                ".avi",
-                ".mkv",
-                ".img",
-                ".iso",
-                ".mp4",
-            ):
-                log.info("Skipping %s, unwanted ext", rarfile_file["name"])
-                continue
+        """Unpack RAR files. Only process files picked by the rules."""
+        unpack_files = self.unpack_files(release_unpacker_rar_file)
 
-            unpack_filename = "{}{}".format(
-                release_unpacker_rar_file.name, rarfile_file["name"].ext
-            )
-            unpack_file_path_abs = Path(self.unpack_dir, unpack_filename)
+        # Files already unpacked
+        existing_files = self.existing_files_match(unpack_files)
 
-            # File exists and size match
-            if self.file_exists_size_match(
-                unpack_file_path_abs, rarfile_file["size"]
-            ):
+        for unpack_file_path_abs, rarfile_file in unpack_files:
+            release_unpacker_rar_file.check_lease()
+            if unpack_file_path_abs in existing_files:
+                release_unpacker_rar_file.report_progress(rarfile_file["size"])
                 continue
 
             # Unpack file in RAR
@@ -225,25 +728,105 @@ class ReleaseUnpacker(object):
                 unpack_file_path_abs,
             )
 
+        for rarfile_file in self.nested_files(release_unpacker_rar_file):
+            self.unpack_nested(release_unpacker_rar_file, rarfile_file)
+
         return True
 
+    def unpack_nested(self, release_unpacker_rar_file, rarfile_file):
+        """Unpack files in an archive nested in a RAR file.
+
+        The nested archive is read into a buffer instead of being extracted
+        next to the RAR, archives nested in it are unpacked the same way.
+        Files are picked and named by the rules of the RAR file and written
+        straight to unpack_dir.
+        """
+        log.debug(
+            "Archive %s in %s",
+            rarfile_file["name"],
+            release_unpacker_rar_file.rar_file_path_abs,
+        )
+
+        with release_unpacker_rar_file.rar_file.open(
+            str(rarfile_file["name"])
+        ) as fp:
+            for archive, files in self.nested.walk(
+                rarfile_file["name"],
+                fp,
+                rarfile_file["size"],
+                release_unpacker_rar_file.buffer,
+                release_unpacker_rar_file.check_read,
+                throttle=release_unpacker_rar_file.throttle,
+            ):
+                for unpack_name, file in self.rules.apply(
+                    self.section(release_unpacker_rar_file),
+                    release_unpacker_rar_file.name,
+                    files,
+                ):
+                    release_unpacker_rar_file.check_lease()
+                    unpack_file_path = Path(self.unpack_dir, unpack_name)
+                    if self.file_exists_size_match(
+                        unpack_file_path, file["size"]
+                    ):
+                        continue
+
+                    log.info("%s unpack started", unpack_file_path.name)
+                    release_unpacker_rar_file.unpack_nested_file(
+                        archive, file, unpack_file_path
+                    )
+                    log.info("%s unpack done", unpack_file_path.name)
+
+                    if release_unpacker_rar_file.reservation:
+                        release_unpacker_rar_file.reservation.done(
+                            file["size"]
+                        )
+
+        release_unpacker_rar_file.report_progress(rarfile_file["size"])
+
     def unpack_move_rar_file(
         self, release_unpacker_rar_file, rarfile_file_name, unpack_file_path
     ):
         """Unpack and move RAR file.
 
         Extract an individual file from release_unpacker_rar_file to
-        unpack_file_path.
+        unpack_file_path. With a pipeline the file is moved in the background
+        while the next file is extracted.
         """
-        # Extract file to tmp_dir
-        log.debug("Extracting %s to %s", rarfile_file_name, self.tmp_dir)
-
         log.info("%s unpack started", unpack_file_path.name)
         unpack_start = datetime.now().replace(microsecond=0)
 
-        extracted_file_path = release_unpacker_rar_file.extract_file(
-            rarfile_file_name, self.tmp_dir
-        )
+        if self.direct_extract:
+            # Stream file straight to unpack_dir
+            log.debug(
+                "Streaming %s to %s", rarfile_file_name, unpack_file_path
+            )
+            extract_dir = None
+            release_unpacker_rar_file.stream_file(
+                rarfile_file_name, unpack_file_path
+            )
+        else:
+            # Extract file to tmp_dir, waiting for earlier files to be moved
+            # out of it if too many are queued
+            extract_dir = self.extract_dir(release_unpacker_rar_file)
+            if self.pipeline:
+                self.pipeline.wait_room(
+                    release_unpacker_rar_file.file_size(rarfile_file_name)
+                )
+            extract_dir.mkdir()
+            log.debug("Extracting %s to %s", rarfile_file_name, extract_dir)
+
+            try:
+                extracted_file_path = release_unpacker_rar_file.extract_file(
+                    rarfile_file_name, extract_dir
+                )
+            except Exception:
+                # Files of the release waiting to be moved are moved first
+                self.finish(
+                    release_dir(release_unpacker_rar_file.rar_file_path_abs),
+                    extract_dir.rmtree,
+                    always=True,
+                )
+                raise
 
         unpack_end = datetime.now().replace(microsecond=0)
         unpack_time = human(unpack_end - unpack_start, past_tense="{}")
@@ -253,18 +836,134 @@ class ReleaseUnpacker(object):
         else:
             log.info("%s unpack done, %s", unpack_file_path.name, unpack_time)
 
-        # Move file and rename to unpack_dir
+        if not extract_dir:
+            self.unpack_done(release_unpacker_rar_file, unpack_file_path)
+        elif self.pipeline:
+            # The extract dir is removed after the last file of the release
+            self.pipeline.submit(
+                release_dir(release_unpacker_rar_file.rar_file_path_abs),
+                functools.partial(
+                    self.move_extracted_file,
+                    release_unpacker_rar_file,
+                    extracted_file_path,
+                    unpack_file_path,
+                ),
+                size=extracted_file_path.size(),
+            )
+        else:
+            self.move_extracted_file(
+                release_unpacker_rar_file,
+                extracted_file_path,
+                unpack_file_path,
+            )
+            extract_dir.rmtree()
+
+    def move_extracted_file(
+        self, release_unpacker_rar_file, extracted_file_path, unpack_file_path
+    ):
+        """Move and rename file extracted to tmp_dir to unpack_file_path.
+
+        With a throttle a move to another filesystem is copied through it.
+        """
         log.debug("Moving %s to %s", extracted_file_path, unpack_file_path)
 
-        extracted_file_path.move(unpack_file_path)
+        with self.metrics.timer(
+            "move",
+            file=str(unpack_file_path),
+            bytes=extracted_file_path.size(),
+        ):
+            if self.throttle and (
+                os.stat(extracted_file_path).st_dev
+                != os.stat(self.unpack_dir).st_dev
+            ):
+                self.copy_extracted_file(
+                    extracted_file_path,
+                    unpack_file_path,
+                    release_unpacker_rar_file.reservation,
+                )
+            else:
+                extracted_file_path.move(unpack_file_path)
+
+        self.unpack_done(release_unpacker_rar_file, unpack_file_path)
+
+    def copy_extracted_file(
+        self, extracted_file_path, unpack_file_path, reservation=None
+    ):
+        """Copy extracted file to unpack_file_path and remove it.
+
+        The copy is written to a .partial file and renamed when complete,
+        like a streamed file. It has a buffer of its own, moves run beside
+        extractions. With a reservation the blocks of the copy are counted
+        as reserved.
+        """
+        partial_file_path = Path(
+            "{}{}".format(unpack_file_path, PARTIAL_SUFFIX)
+        )
+        if reservation:
+            reservation.writing(partial_file_path)
+
+        try:
+            with open(extracted_file_path, "rb") as src_fp:
+                with open(partial_file_path, "wb") as dst_fp:
+                    if self.preallocate:
+                        preallocate(
+                            dst_fp.fileno(), extracted_file_path.size()
+                        )
+
+                    copy_fileobj(
+                        src_fp,
+                        dst_fp,
+                        bytearray(self.buffer_size),
+                        throttle=self.throttle,
+                    )
+
+            shutil.copystat(extracted_file_path, partial_file_path)
+            os.replace(partial_file_path, unpack_file_path)
+        except Exception:
+            partial_file_path.remove()
+            raise
+
+        extracted_file_path.remove()
+
+    def unpack_done(self, release_unpacker_rar_file, unpack_file_path):
+        """Hand back the reserved space of a file written to unpack_dir."""
+        if release_unpacker_rar_file.reservation:
+            release_unpacker_rar_file.reservation.done(
+                unpack_file_path.size()
+            )
 
 
 class ReleaseUnpackerRarFile(object):
     """Release unpacker RAR file."""
 
-    def __init__(self, rar_file_path):
-        """Initialize and validate rar file path."""
+    def __init__(
+        self,
+        rar_file_path,
+        metrics=None,
+        header_cache=None,
+        progress=None,
+        buffer_size=BUFFER_SIZE,
+        preallocate=True,
+        drop_cache=False,
+        throttle=None,
+    ):
+        """Initialize and validate rar file path.
+
+        Files are written buffer_size bytes at a time. With preallocate the
+        size of each file is allocated on disk before it's written, with
+        drop_cache the volumes and written files are dropped from the page
+        cache. With a throttle every chunk waits for its turn.
+        """
         self.rar_file_path = Path(rar_file_path)
+        self.metrics = metrics or Metrics()
+        self.header_cache = header_cache
+        self.progress = progress
+        self.buffer_size = buffer_size
+        self.preallocate = preallocate
+        self.drop_cache = drop_cache
+        self.throttle = throttle
+        self.reservation = None
+        self.lease = None
 
         if (
             not self.rar_file_path.exists()
@@ -276,7 +975,6 @@ class ReleaseUnpackerRarFile(object):
             )
 
         self.rar_file_path_abs = self.rar_file_path.absolute()
-        self.rar_file = rarfile.RarFile(self.rar_file_path)
 
     def __repr__(self):
         """Return object string representation."""
@@ -300,25 +998,309 @@ class ReleaseUnpackerRarFile(object):
         else:
             return False
 
+    @lazy
+    def rar_file(self):
+        """Return rarfile.RarFile.
+
+        The archive is only opened by rarfile when a file must be extracted
+        with rarfile or the volume headers can't be read.
+        """
+        with self.metrics.timer(
+            "header_parse", file=str(self.rar_file_path_abs), engine="rarfile"
+        ):
+            return rarfile.RarFile(self.rar_file_path)
+
     @lazy
     def file_list(self):
-        """Return file list of RAR file."""
+        """Return file list of RAR file, dirs left out.
+
+        The list is read from the volume headers, which come from the header
+        cache if the volumes didn't change since the last run. rarfile is
+        only used when the volume set isn't complete. Raises
+        ReleaseUnpackerRarFileError if the headers are encrypted.
+        """
+        if self.volumes and self.volumes[0]["headers_encrypted"]:
+            raise ReleaseUnpackerRarFileError(
+                "Headers of {} are encrypted".format(self.rar_file_path)
+            )
+
+        if self.volumes:
+            # Size and hashes of the whole file are in the last part
+            files = {}
+            for volume in self.volumes:
+                for file in volume["files"]:
+                    if file["directory"]:
+                        continue
+
+                    files[file["name"]] = {
+                        "name": Path(file["name"]),
+                        "size": file["size"],
+                        "crc": file["crc"],
+                        "blake2sp": file["blake2sp"],
+                        "stored": file["stored"],
+                        "encrypted": file["encrypted"],
+                    }
+
+            return list(files.values())
+
         files = []
         for file in self.rar_file.infolist():
-            files.append({"name": Path(file.filename), "size": file.file_size})
+            if file.is_dir():
+                continue
+
+            blake2sp = getattr(file, "blake2sp_hash", None)
+            files.append(
+                {
+                    "name": Path(file.filename),
+                    "size": file.file_size,
+                    "crc": file.CRC,
+                    "blake2sp": blake2sp.hex() if blake2sp else None,
+                    "stored": file.compress_type == rarfile.RAR_M0,
+                    "encrypted": file.needs_password(),
+                }
+            )
 
         return files
 
+    @lazy
+    def volumes(self):
+        """Return parsed headers of all volumes.
+
+        Return None if the volume set isn't complete. Volume sets with
+        encrypted headers have the first volume, file_list refuses them.
+        """
+        with self.metrics.timer(
+            "header_parse",
+            file=str(self.rar_file_path_abs),
+            engine="rarheader",
+        ) as fields:
+            volume_set = VolumeSet(
+                self.rar_file_path, header_cache=self.header_cache
+            )
+            fields["status"] = volume_set.status
+            if volume_set.status != COMPLETE:
+                if volume_set.headers_encrypted:
+                    return volume_set.volumes
+
+                return None
+
+            return volume_set.volumes
+
+    def stored_file(self, file_name):
+        """Return stored parts of file_name.
+
+        Return None if file_name must be extracted with rarfile.
+        """
+        if not self.volumes:
+            return None
+
+        return stored_parts(self.volumes, file_name)
+
+    def file_size(self, file_name):
+        """Return unpacked size of file_name, 0 if it's not in the list."""
+        for rarfile_file in self.file_list:
+            if rarfile_file["name"] == file_name:
+                return rarfile_file["size"]
+
+        return 0
+
+    def report_progress(self, size):
+        """Report size bytes unpacked to the release progress."""
+        if self.progress:
+            self.progress.update(size)
+
+    def check_lease(self):
+        """Raise ReleaseClaimsError if the claim on the release was lost."""
+        if self.lease:
+            self.lease.check()
+
     def extract_file(self, file_name, unpack_dir):
-        """Extract file_name and return extracted file path."""
-        self.rar_file.extract(file_name, path=unpack_dir)
-        self.extracted_file_path = Path(unpack_dir, file_name)
+        """Extract file_name and return extracted file path.
+
+        Stored files are copied straight from the volumes, everything else is
+        decompressed with rarfile.
+        """
+        with self.metrics.timer("extract", file=str(file_name)) as fields:
+            self.extracted_file_path = Path(unpack_dir, file_name)
+            self.extracted_file_path.parent.mkdir(parents=True)
+            self.writing(self.extracted_file_path)
+            stored = self.stored_file(file_name)
+            if stored:
+                fields["engine"] = "store"
+                checkpoint = Checkpoint(self.extracted_file_path, stored)
+                try:
+                    copy_stored_file(
+                        stored,
+                        self.extracted_file_path,
+                        self.buffer,
+                        checkpoint=checkpoint,
+                        progress=self.report_progress,
+                        preallocate_dst=self.preallocate,
+                        drop_cache=self.drop_cache,
+                        throttle=self.throttle,
+                    )
+                except Exception:
+                    checkpoint.remove()
+                    raise
+                checkpoint.remove()
+                fields["resumed_bytes"] = checkpoint.resumed
+            else:
+                fields["engine"] = "rarfile"
+                try:
+                    self.copy_rar_file(file_name, self.extracted_file_path)
+                except Exception:
+                    self.extracted_file_path.remove()
+                    raise
+            fields["bytes"] = self.extracted_file_path.size()
 
         # Set the mtime to current time
         self.set_mtime()
 
         return self.extracted_file_path
 
+    @lazy
+    def buffer(self):
+        """Return buffer reused for all files in the RAR."""
+        return bytearray(self.buffer_size)
+
+    def copy_rar_file(self, file_name, dst_path):
+        """Decompress file_name with rarfile to dst_path.
+
+        Return bytes written. Raises rarfile.BadRarFile if the data is short
+        or the hash doesn't match.
+        """
+        size = self.rar_file.getinfo(file_name).file_size
+        with self.rar_file.open(file_name) as rar_fp:
+            with open(dst_path, "wb") as dst_fp:
+                if self.preallocate:
+                    preallocate(dst_fp.fileno(), size)
+
+                copied = copy_fileobj(
+                    rar_fp,
+                    dst_fp,
+                    self.buffer,
+                    progress=self.report_progress,
+                    throttle=self.throttle,
+                )
+
+                self.check_read(file_name, rar_fp, copied, size)
+
+                if self.drop_cache:
+                    dst_fp.flush()
+                    fdatasync(dst_fp.fileno())
+                    fadvise_dontneed(dst_fp.fileno())
+
+        if self.drop_cache:
+            for volume_path in self.rar_file.volumelist():
+                fadvise_dontneed_file(volume_path)
+
+        return copied
+
+    def check_read(self, file_name, rar_fp, copied, size):
+        """Raise rarfile.BadRarFile if copied isn't size or the hash is bad.
+
+        rarfile only checks size and hash at the end of read, not readinto.
+        """
+        if copied != size:
+            raise rarfile.BadRarFile(
+                "Failed the read enough data: req={} got={}".format(
+                    size, copied
+                )
+            )
+        rar_fp._check()
+
+    def unpack_nested_file(self, archive, file, unpack_file_path):
+        """Write file in nested archive to unpack_file_path.
+
+        The data is written to a .partial file beside unpack_file_path and
+        renamed when complete, like stream_file.
+        """
+        partial_file_path = Path(
+            "{}{}".format(unpack_file_path, PARTIAL_SUFFIX)
+        )
+        self.writing(partial_file_path)
+
+        try:
+            with self.metrics.timer(
+                "extract",
+                file=str(file["name"]),
+                engine="nested",
+                bytes=file["size"],
+            ):
+                with archive.open(file["name"]) as fp:
+                    with open(partial_file_path, "wb") as dst_fp:
+                        if self.preallocate:
+                            preallocate(dst_fp.fileno(), file["size"])
+
+                        copied = copy_fileobj(
+                            fp, dst_fp, self.buffer, throttle=self.throttle
+                        )
+                        archive.check(file["name"], fp, copied, file["size"])
+
+                os.replace(partial_file_path, unpack_file_path)
+        except Exception:
+            partial_file_path.remove()
+            raise
+
+    def stream_file(self, file_name, unpack_file_path):
+        """Stream file_name to unpack_file_path and return the path.
+
+        The data is written to a .partial file beside unpack_file_path and
+        renamed when complete, a half written file never has the final name.
+        Stored files are resumed from the last checkpoint of a killed run.
+        """
+        unpack_file_path = Path(unpack_file_path)
+        partial_file_path = Path(
+            "{}{}".format(unpack_file_path, PARTIAL_SUFFIX)
+        )
+        self.writing(partial_file_path)
+        checkpoint = None
+
+        try:
+            with self.metrics.timer("extract", file=str(file_name)) as fields:
+                stored = self.stored_file(file_name)
+                if stored:
+                    fields["engine"] = "store"
+                    checkpoint = Checkpoint(partial_file_path, stored)
+                    fields["bytes"] = copy_stored_file(
+                        stored,
+                        partial_file_path,
+                        self.buffer,
+                        checkpoint=checkpoint,
+                        progress=self.report_progress,
+                        preallocate_dst=self.preallocate,
+                        drop_cache=self.drop_cache,
+                        throttle=self.throttle,
+                    )
+                    fields["resumed_bytes"] = checkpoint.resumed
+                else:
+                    fields["engine"] = "rarfile"
+                    fields["bytes"] = self.copy_rar_file(
+                        file_name, partial_file_path
+                    )
+
+                os.replace(partial_file_path, unpack_file_path)
+        except Exception:
+            partial_file_path.remove()
+            if checkpoint:
+                checkpoint.remove()
+            raise
+
+        if checkpoint:
+            checkpoint.remove()
+
+        self.extracted_file_path = unpack_file_path
+
+        # Set the mtime to current time
+        self.set_mtime()
+
+        return self.extracted_file_path
+
+    def writing(self, path):
+        """Count the blocks of path, about to be written, as reserved."""
+        if self.reservation:
+            self.reservation.writing(path)
+
     def set_mtime(self):
         """Set mtime of extracted file path to current time."""
         os.utime(self.extracted_file_path, None)
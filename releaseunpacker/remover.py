@@ -0,0 +1,237 @@
+"""ReleaseUnpacker background release dir removal."""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from unipath import Path
+
+from .metrics import Metrics
+
+log = logging.getLogger(__name__)
+
+JOBS = 2
+
+
+class ReleaseRemoverError(Exception):
+    """ReleaseRemover error."""
+
+    pass
+
+
+def raise_error(error):
+    """Raise error, os.walk ignores errors by default."""
+    raise error
+
+
+class ReleaseRemover(object):
+    """Remove release dirs in the background on a small worker pool.
+
+    A release dir is renamed to trash_dir first if given, a rename on the
+    same filesystem is instant so the unpacker can go on with the next
+    release while the files are removed. At most rate bytes are removed
+    per second over all workers, every file is charged with its size. Pending
+    dirs are saved in queue_file and dirs left in queue_file or trash_dir
+    are removed again by resume.
+    """
+
+    def __init__(
+        self,
+        jobs=JOBS,
+        rate=None,
+        trash_dir=None,
+        queue_file=None,
+        metrics=None,
+    ):
+        """Initialize and validate ReleaseRemover."""
+        self.jobs = jobs
+        self.rate = rate
+        self.trash_dir = Path(trash_dir) if trash_dir else None
+        self.queue_file = Path(queue_file) if queue_file else None
+        self.metrics = metrics or Metrics()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.queued = set()
+        self.failed = []
+        self.next_unlink = 0
+
+        if self.jobs < 1:
+            raise ReleaseRemoverError(
+                "Remove jobs must be 1 or more, got {}".format(self.jobs)
+            )
+        elif self.rate is not None and self.rate <= 0:
+            raise ReleaseRemoverError(
+                "Remove rate must be above 0, got {}".format(self.rate)
+            )
+        elif self.trash_dir and not self.trash_dir.isdir():
+            raise ReleaseRemoverError(
+                "Trash dir {} is not a dir".format(self.trash_dir)
+            )
+
+        self.executor = ThreadPoolExecutor(max_workers=self.jobs)
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<ReleaseRemover: {} jobs ({})>".format(
+            self.jobs, self.trash_dir
+        )
+
+    def load_queue(self):
+        """Return dirs saved in queue_file."""
+        try:
+            with open(self.queue_file) as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            log.warning("Can't read remove queue %s: %s", self.queue_file, e)
+            return []
+
+    def save_queue(self):
+        """Write pending dirs to queue_file, call with lock held."""
+        if not self.queue_file:
+            return
+
+        tmp_path = "{}.{}.tmp".format(self.queue_file, os.getpid())
+        try:
+            with open(tmp_path, "w") as fp:
+                json.dump(sorted(self.queued), fp)
+            os.replace(tmp_path, self.queue_file)
+        except OSError as e:
+            log.warning("Can't save remove queue %s: %s", self.queue_file, e)
+
+    def resume(self):
+        """Remove dirs left in queue_file and trash_dir by an earlier run."""
+        dirs = self.load_queue() if self.queue_file else []
+        if self.trash_dir:
+            dirs.extend(sorted(self.trash_dir.listdir()))
+
+        for dir in dirs:
+            if os.path.lexists(dir):
+                log.info("Resuming removal of %s", dir)
+                self.submit(dir)
+
+    def pending(self, dir):
+        """Return True if dir is queued for removal."""
+        with self.lock:
+            return str(dir) in self.queued
+
+    def remove(self, dir):
+        """Queue dir for removal, moving it to trash_dir first if given."""
+        dir = Path(dir)
+        if self.trash_dir:
+            trash_path = Path(
+                self.trash_dir, "{}.{}".format(dir.name, time.time_ns())
+            )
+            try:
+                os.rename(dir, trash_path)
+                log.debug("Moved %s to %s", dir, trash_path)
+                dir = trash_path
+            except OSError as e:
+                log.warning(
+                    "Can't move %s to trash, removing in place: %s", dir, e
+                )
+
+        self.submit(dir)
+
+    def submit(self, dir):
+        """Queue dir for removal by a worker."""
+        dir = str(dir)
+        with self.lock:
+            if dir in self.queued:
+                return
+
+            self.queued.add(dir)
+            self.save_queue()
+
+        self.executor.submit(self.remove_tree, dir)
+
+    def throttle(self, size):
+        """Wait for the next unlink slot and charge size bytes to it."""
+        if not self.rate:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_unlink - now
+            self.next_unlink = max(now, self.next_unlink) + size / self.rate
+
+        if wait > 0:
+            self.stopping.wait(wait)
+
+    def remove_tree(self, dir):
+        """Remove dir bottom up, file by file.
+
+        Dirs that fail or are stopped midway stay in the queue.
+        """
+        with self.metrics.timer("rmtree", dir=dir) as fields:
+            fields["files"] = fields["bytes"] = 0
+            try:
+                for root, dir_names, file_names in os.walk(
+                    dir, topdown=False, onerror=raise_error
+                ):
+                    for name in file_names:
+                        if self.stopping.is_set():
+                            fields["stopped"] = True
+                            return
+
+                        path = os.path.join(root, name)
+                        size = os.lstat(path).st_size
+                        self.throttle(size)
+                        fields["bytes"] += size
+                        os.unlink(path)
+                        fields["files"] += 1
+
+                    for name in dir_names:
+                        path = os.path.join(root, name)
+                        if os.path.islink(path):
+                            os.unlink(path)
+                        else:
+                            os.rmdir(path)
+
+                os.rmdir(dir)
+            except FileNotFoundError:
+                log.debug("%s already removed", dir)
+            except OSError as e:
+                log.error("Removal of %s failed: %s", dir, e)
+                fields["error"] = str(e)
+                with self.lock:
+                    self.failed.append((dir, e))
+                return
+
+        log.debug("Removed %s", dir)
+        with self.lock:
+            self.queued.discard(dir)
+            self.save_queue()
+
+    def close(self):
+        """Wait for all queued dirs to be removed."""
+        self.executor.shutdown(wait=True)
+
+    def persistent(self):
+        """Return True if pending dirs are resumed by the next run."""
+        return bool(self.queue_file or self.trash_dir)
+
+    def shutdown(self):
+        """Stop if pending dirs are resumed by the next run, else close.
+
+        Without queue_file or trash_dir nothing would remember the pending
+        dirs, they're removed before it returns.
+        """
+        if not self.persistent():
+            self.close()
+            return
+
+        self.stop()
+        with self.lock:
+            if self.queued:
+                log.info(
+                    "%s removal(s) left for the next run", len(self.queued)
+                )
+
+    def stop(self):
+        """Stop removing, unfinished dirs stay in queue_file."""
+        self.stopping.set()
+        self.executor.shutdown(wait=True, cancel_futures=True)
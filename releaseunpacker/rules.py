@@ -0,0 +1,227 @@
+"""ReleaseUnpacker extension and naming rules."""
+import fnmatch
+import json
+import logging
+import re
+import string
+
+from unipath import Path
+
+log = logging.getLogger(__name__)
+
+ACTIONS = ("unpack", "skip")
+SECTIONS = ("files", "subs")
+NAME = "{release}{ext}"
+NAME_FIELDS = ("release", "name", "ext")
+UNPACK_EXTS = (".avi", ".mkv", ".img", ".iso", ".mp4")
+
+# Same files as the old extension whitelist, everything in a Subs RAR
+DEFAULT_RULES = {
+    "files": [{"match": "*{}".format(ext)} for ext in UNPACK_EXTS],
+    "subs": [{"match": "*"}],
+}
+
+
+class RulesError(Exception):
+    """Rules error."""
+
+    pass
+
+
+class Rule(object):
+    """A compiled rule, a glob or regex with an action and name template."""
+
+    def __init__(self, rule):
+        """Initialize and validate Rule."""
+        if not isinstance(rule, dict):
+            raise RulesError("Invalid rule {!r}".format(rule))
+
+        if ("match" in rule) == ("regex" in rule):
+            raise RulesError(
+                "Rule {!r} needs either match or regex".format(rule)
+            )
+
+        self.pattern = rule.get("match", rule.get("regex"))
+        self.action = rule.get("action", "unpack")
+        self.name = rule.get("name", NAME)
+
+        if self.action not in ACTIONS:
+            raise RulesError(
+                "Invalid action {} in rule {!r}".format(self.action, rule)
+            )
+
+        try:
+            if "match" in rule:
+                self.regex = re.compile(fnmatch.translate(self.pattern))
+            else:
+                self.regex = re.compile(self.pattern)
+        except (re.error, TypeError) as e:
+            raise RulesError(
+                "Invalid pattern in rule {!r}: {}".format(rule, e)
+            )
+
+        fields = set(NAME_FIELDS) | set(self.regex.groupindex)
+        try:
+            names = [
+                field
+                for _, field, _, _ in string.Formatter().parse(self.name)
+                if field is not None
+            ]
+        except (ValueError, TypeError) as e:
+            raise RulesError(
+                "Invalid name in rule {!r}: {}".format(rule, e)
+            )
+
+        for field in names:
+            if field not in fields:
+                raise RulesError(
+                    "Unknown field {{{}}} in name of rule {!r}".format(
+                        field, rule
+                    )
+                )
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<Rule: {} {} ({})>".format(
+            self.action, self.pattern, self.name
+        )
+
+    def match(self, file_name):
+        """Return re.Match if the rule matches file_name, else None."""
+        return self.regex.fullmatch(file_name)
+
+
+class Rules(object):
+    """Decide which files in a RAR are unpacked and what they're named.
+
+    Rules are read from a JSON file with a list of rules for files in
+    release RARs and one for files in Subs RARs:
+
+        {"files": [{"match": "*.mkv"}], "subs": [{"match": "*"}]}
+
+    A rule has a glob in match or a regular expression in regex, both
+    matched against the whole file name in the RAR. action is unpack or
+    skip, name is a template for the unpacked file with {release},
+    {name}, {ext} and the named groups of the regex. The first rule that
+    matches a file is used, files no rule matches are skipped. Rules are
+    compiled once when they're loaded.
+    """
+
+    def __init__(self, rules=None):
+        """Initialize and compile rules, the default rules if None."""
+        if rules is None:
+            rules = DEFAULT_RULES
+        elif not isinstance(rules, dict):
+            raise RulesError("Rules must be an object, got {!r}".format(rules))
+
+        unknown = set(rules) - set(SECTIONS)
+        if unknown:
+            raise RulesError(
+                "Unknown rule section(s) {}".format(", ".join(sorted(unknown)))
+            )
+
+        self.sections = {}
+        for section in SECTIONS:
+            section_rules = rules.get(section, DEFAULT_RULES[section])
+            if not isinstance(section_rules, list):
+                raise RulesError(
+                    "Rules in {} must be a list, got {!r}".format(
+                        section, section_rules
+                    )
+                )
+
+            self.sections[section] = [Rule(rule) for rule in section_rules]
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<Rules: {}>".format(
+            ", ".join(
+                "{} {}".format(len(rules), section)
+                for section, rules in self.sections.items()
+            )
+        )
+
+    @classmethod
+    def load(cls, rules_file):
+        """Return Rules read from JSON rules_file."""
+        try:
+            with open(rules_file) as fp:
+                rules = json.load(fp)
+        except (OSError, ValueError) as e:
+            raise RulesError("Can't read rules {}: {}".format(rules_file, e))
+
+        return cls(rules)
+
+    def unpack_name(self, section, release, file_name):
+        """Return unpacked file name for file_name or None if skipped."""
+        for rule in self.sections[section]:
+            match = rule.match(file_name)
+            if not match:
+                continue
+
+            if rule.action == "skip":
+                log.info("Skipping %s, skip rule %s", file_name, rule.pattern)
+                return None
+
+            name = rule.name.format(
+                release=release,
+                name=Path(file_name).stem,
+                ext=Path(file_name).ext,
+                **{
+                    field: value or ""
+                    for field, value in match.groupdict().items()
+                }
+            )
+            if not name or "/" in name or name in (".", ".."):
+                raise RulesError(
+                    "Rule {} names {} {!r}, not a file name".format(
+                        rule.pattern, file_name, name
+                    )
+                )
+
+            return name
+
+        log.info("Skipping %s, unwanted ext", file_name)
+
+        return None
+
+    def apply(self, section, release, rarfile_files):
+        """Return (unpack name, rarfile_file) of files to unpack.
+
+        Files that would get the same name get the name of the file in the
+        RAR added, and a number if that's taken as well.
+        """
+        unpack_files = []
+        names = set()
+        for rarfile_file in rarfile_files:
+            name = self.unpack_name(section, release, rarfile_file["name"])
+            if not name:
+                continue
+
+            if name in names:
+                unpack_name = Path(name)
+                name = "{}.{}{}".format(
+                    unpack_name.stem,
+                    rarfile_file["name"].stem,
+                    unpack_name.ext,
+                )
+                number = 2
+                while name in names:
+                    name = "{}.{}.{}{}".format(
+                        unpack_name.stem,
+                        rarfile_file["name"].stem,
+                        number,
+                        unpack_name.ext,
+                    )
+                    number += 1
+
+                log.info(
+                    "%s is unpacked as %s, name is taken",
+                    rarfile_file["name"],
+                    name,
+                )
+
+            names.add(name)
+            unpack_files.append((name, rarfile_file))
+
+        return unpack_files
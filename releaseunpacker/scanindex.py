@@ -0,0 +1,157 @@
+"""ReleaseUnpacker scan index."""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from unipath import Path
+
+from .discovery import iter_rar_files, list_dir
+
+log = logging.getLogger(__name__)
+
+# Dirs modified this close to the scan can change again within the same
+# mtime tick, they are listed again on the next scan
+RACY_MTIME_NS = 2 * 1000000000
+
+SCHEMA_VERSION = 2
+
+
+class ScanIndexError(Exception):
+    """ScanIndex error."""
+
+    pass
+
+
+class ScanIndex(object):
+    """Persistent index of scanned dirs.
+
+    Each dir is stored with its mtime and inode, its sub dir names and the
+    first .rar file in it. A dir only changes mtime when entries are added,
+    removed or renamed, so dirs with an unchanged mtime and inode are not
+    listed again.
+    """
+
+    def __init__(self, index_file, rebuild=False):
+        """Initialize and open ScanIndex."""
+        self.index_file = Path(index_file)
+        self.lock = threading.Lock()
+
+        try:
+            self.db = sqlite3.connect(
+                str(self.index_file), check_same_thread=False
+            )
+            (version,) = self.db.execute("PRAGMA user_version").fetchone()
+            if version != SCHEMA_VERSION:
+                self.db.execute("DROP TABLE IF EXISTS dirs")
+                self.db.execute(
+                    "PRAGMA user_version = {}".format(SCHEMA_VERSION)
+                )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS dirs ("
+                " path TEXT PRIMARY KEY,"
+                " mtime_ns INTEGER NOT NULL,"
+                " inode INTEGER NOT NULL,"
+                " subdirs TEXT NOT NULL,"
+                " rar_file TEXT"
+                ")"
+            )
+            if rebuild:
+                log.info("Rebuilding scan index %s", self.index_file)
+                self.db.execute("DELETE FROM dirs")
+            self.db.commit()
+        except sqlite3.Error as e:
+            raise ScanIndexError(
+                "Can't open scan index {}: {}".format(self.index_file, e)
+            )
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<ScanIndex: {}>".format(self.index_file)
+
+    def close(self):
+        """Close index database."""
+        self.db.close()
+
+    def lookup(self, dir, stat):
+        """Return indexed (subdirs, rar_file) for dir or None if changed."""
+        row = self.db.execute(
+            "SELECT mtime_ns, inode, subdirs, rar_file FROM dirs"
+            " WHERE path = ?",
+            (dir,),
+        ).fetchone()
+        if row and row[0] == stat.st_mtime_ns and row[1] == stat.st_ino:
+            return json.loads(row[2]), row[3]
+
+        return None
+
+    def listing(self, dir):
+        """Return sub dirs and first .rar file in dir like list_dir.
+
+        The dir is only listed if it changed since it was indexed.
+        """
+        stat = os.stat(dir)
+        self.seen_dirs.add(dir)
+
+        indexed = self.lookup(dir, stat)
+        if indexed:
+            return indexed
+
+        subdirs, rar_file = list_dir(dir)
+        self.listed += 1
+
+        mtime_ns = stat.st_mtime_ns
+        if self.scan_time_ns - mtime_ns < RACY_MTIME_NS:
+            mtime_ns = -1
+
+        self.db.execute(
+            "INSERT OR REPLACE INTO dirs"
+            " (path, mtime_ns, inode, subdirs, rar_file)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (dir, mtime_ns, stat.st_ino, json.dumps(subdirs), rar_file),
+        )
+
+        return subdirs, rar_file
+
+    def scan(self, top):
+        """Scan top and return a list of the first .rar file in each dir.
+
+        Only dirs changed since the last scan are listed. The order is the
+        same as ReleaseUnpacker.scan_rars.
+        """
+        top = str(top)
+
+        with self.lock:
+            self.scan_time_ns = time.time_ns()
+            self.seen_dirs = set()
+            self.listed = 0
+
+            try:
+                rar_files = list(iter_rar_files(top, self.listing))
+                self.prune(top, self.seen_dirs)
+                self.db.commit()
+            except Exception:
+                self.db.rollback()
+                raise
+
+            log.debug(
+                "Scanned %s dirs in %s, %s listed",
+                len(self.seen_dirs),
+                top,
+                self.listed,
+            )
+
+        return rar_files
+
+    def prune(self, top, seen_dirs):
+        """Remove dirs below top that were not seen in the last scan."""
+        prefix = top.rstrip(os.sep) + os.sep
+        rows = self.db.execute(
+            "SELECT path FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?",
+            (top, len(prefix), prefix),
+        ).fetchall()
+
+        removed = [(path,) for path, in rows if path not in seen_dirs]
+        self.db.executemany("DELETE FROM dirs WHERE path = ?", removed)
@@ -0,0 +1,170 @@
+"""ReleaseUnpacker scheduler."""
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+log = logging.getLogger(__name__)
+
+
+class ReleaseSchedulerError(Exception):
+    """ReleaseScheduler error."""
+
+    pass
+
+
+class ReleaseScheduler(object):
+    """Unpack releases in parallel on a bounded worker pool.
+
+    Every release found by the ReleaseUnpackers is a job of its own. Jobs are
+    only started when the device of their release dir has a free slot, so no
+    more than device_jobs releases are read from one device at a time. Tmp
+    dir and unpack dir are shared by every job, so their devices have a cap
+    of their own, output_jobs, and no more than output_jobs releases are
+    written to one device at a time. A failing release is logged and
+    recorded in failed, the other releases are still unpacked.
+    """
+
+    def __init__(self, jobs=1, device_jobs=1, output_jobs=2, priority=None):
+        """Initialize and validate ReleaseScheduler.
+
+        With priority jobs are started in the order it decides, else in the
+        order the releases were found.
+        """
+        self.jobs = jobs
+        self.device_jobs = device_jobs
+        self.output_jobs = output_jobs
+        self.priority = priority
+        self.failed = []
+
+        if self.jobs < 1:
+            raise ReleaseSchedulerError(
+                "Jobs must be 1 or more, got {}".format(self.jobs)
+            )
+        elif self.device_jobs < 1:
+            raise ReleaseSchedulerError(
+                "Device jobs must be 1 or more, got {}".format(
+                    self.device_jobs
+                )
+            )
+        elif self.output_jobs < 1:
+            raise ReleaseSchedulerError(
+                "Output jobs must be 1 or more, got {}".format(
+                    self.output_jobs
+                )
+            )
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<ReleaseScheduler: {} jobs ({} per device)>".format(
+            self.jobs, self.device_jobs
+        )
+
+    def devices(self, release_unpacker, release):
+        """Return the set of devices a release job reads from."""
+        return {os.stat(release["dir"]).st_dev}
+
+    def output_devices(self, release_unpacker):
+        """Return the set of devices a release job writes to.
+
+        Tmp dir and unpack dir on the same device take a single slot.
+        """
+        return {
+            os.stat(path).st_dev
+            for path in (release_unpacker.tmp_dir, release_unpacker.unpack_dir)
+        }
+
+    def scan_jobs(self, release_unpackers):
+        """Return a list of jobs for all releases found.
+
+        Releases whose dir is gone by the time its device is looked up are
+        skipped.
+        """
+        releases = [
+            (release_unpacker, release)
+            for release_unpacker in release_unpackers
+            for release in release_unpacker.scan_releases()
+        ]
+        if self.priority:
+            releases = self.priority.sort(releases)
+
+        jobs = []
+        for release_unpacker, release in releases:
+            try:
+                devices = self.devices(release_unpacker, release)
+            except FileNotFoundError:
+                log.info("Release %s is gone, skipping", release["dir"])
+                continue
+
+            jobs.append(
+                {
+                    "release_unpacker": release_unpacker,
+                    "release": release,
+                    "devices": devices,
+                    "output_devices": self.output_devices(release_unpacker),
+                }
+            )
+
+        return jobs
+
+    def slots(self, job):
+        """Return a list of (usage key, limit) for the slots a job takes."""
+        return [
+            (("read", device), self.device_jobs) for device in job["devices"]
+        ] + [
+            (("write", device), self.output_jobs)
+            for device in job["output_devices"]
+        ]
+
+    def run(self, release_unpackers):
+        """Unpack all releases found by release_unpackers.
+
+        Return True if all releases were unpacked, False otherwise.
+        """
+        pending = self.scan_jobs(release_unpackers)
+        if not pending:
+            log.debug("No releases found")
+            return True
+
+        self.failed = []
+        device_usage = {}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while pending or running:
+                # Start jobs as long as there are free workers and devices
+                for job in list(pending):
+                    if len(running) >= self.jobs:
+                        break
+
+                    if any(
+                        device_usage.get(key, 0) >= limit
+                        for key, limit in self.slots(job)
+                    ):
+                        continue
+
+                    pending.remove(job)
+                    for key, _ in self.slots(job):
+                        device_usage[key] = device_usage.get(key, 0) + 1
+
+                    log.debug("Starting unpack of %s", job["release"]["dir"])
+                    future = executor.submit(
+                        job["release_unpacker"].unpack_release, job["release"]
+                    )
+                    running[future] = job
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    for key, _ in self.slots(job):
+                        device_usage[key] -= 1
+
+                    exception = future.exception()
+                    if exception:
+                        log.error(
+                            "Unpack of %s failed: %s",
+                            job["release"]["dir"],
+                            exception,
+                        )
+                        self.failed.append((job["release"], exception))
+
+        return not self.failed
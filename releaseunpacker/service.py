@@ -0,0 +1,186 @@
+"""ReleaseUnpacker batch unpack service."""
+import logging
+import threading
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+
+from unipath import Path
+
+from .headercache import HeaderCache
+from .metrics import Metrics
+from .releaseunpacker import ReleaseUnpacker
+from .verify import Verifier
+
+log = logging.getLogger(__name__)
+
+JOBS = 2
+
+
+class UnpackServiceError(Exception):
+    """UnpackService error."""
+
+    pass
+
+
+class UnpackCancelledError(Exception):
+    """Unpack cancelled error."""
+
+    pass
+
+
+class UnpackService(object):
+    """Unpack releases for programs that embed releaseunpacker.
+
+    Release dirs are unpacked on one worker pool that lives as long as the
+    service, jobs releases at a time. Every release gets a Future, its result
+    is True if the release was unpacked and False if it was deferred or no
+    RARs were found. Wrap it with asyncio.wrap_future to await it.
+
+    progress is called with the release dir, bytes done and bytes total
+    while a release is unpacked, from the worker thread. Cancelling a
+    future stops its unpack at the next chunk, the future doesn't enter the
+    running state so it can be cancelled until it's done.
+
+    The header cache, verifier and metrics are shared by all releases, an
+    in memory header cache is used if none is given. Other keyword arguments
+    are passed on to ReleaseUnpacker.
+    """
+
+    def __init__(
+        self,
+        tmp_dir,
+        unpack_dir,
+        jobs=JOBS,
+        header_cache=None,
+        metrics=None,
+        verifier=None,
+        **release_unpacker_kwargs
+    ):
+        """Initialize and validate UnpackService."""
+        self.tmp_dir = Path(tmp_dir)
+        self.unpack_dir = Path(unpack_dir)
+        self.jobs = jobs
+
+        if self.jobs < 1:
+            raise UnpackServiceError(
+                "Jobs must be 1 or more, got {}".format(self.jobs)
+            )
+        for name, dir in (("Tmp", self.tmp_dir), ("Unpack", self.unpack_dir)):
+            if not dir.isdir():
+                raise UnpackServiceError(
+                    "{} dir {} is not a dir".format(name, dir)
+                )
+
+        # Header cache made here is closed with the service
+        self.header_cache = None
+        if not header_cache:
+            header_cache = self.header_cache = HeaderCache(":memory:")
+
+        self.release_unpacker_kwargs = dict(
+            release_unpacker_kwargs,
+            header_cache=header_cache,
+            metrics=metrics or Metrics(),
+            verifier=verifier or Verifier(sidecar_dir=self.tmp_dir),
+        )
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.jobs, thread_name_prefix="releaseunpacker"
+        )
+        self.lock = threading.Lock()
+        self.futures = set()
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<UnpackService: {} jobs ({}) ({})>".format(
+            self.jobs, self.tmp_dir, self.unpack_dir
+        )
+
+    def __enter__(self):
+        """Return self."""
+        return self
+
+    def __exit__(self, *args):
+        """Close service."""
+        self.close()
+
+    def submit(self, release_dir, progress=None):
+        """Queue release_dir for unpack and return its Future."""
+        future = Future()
+        with self.lock:
+            self.futures.add(future)
+        future.add_done_callback(self.discard_future)
+        self.executor.submit(self.run, future, release_dir, progress)
+
+        return future
+
+    def discard_future(self, future):
+        """Forget future when it's done."""
+        with self.lock:
+            self.futures.discard(future)
+
+    def unpack(self, release_dirs, progress=None):
+        """Queue all release_dirs and return a list of their Futures."""
+        return [
+            self.submit(release_dir, progress) for release_dir in release_dirs
+        ]
+
+    def release_progress(self, future, progress):
+        """Return progress callback that stops cancelled unpacks."""
+
+        def release_progress(release_dir, done, total):
+            if future.cancelled():
+                raise UnpackCancelledError(
+                    "Unpack of {} cancelled".format(release_dir)
+                )
+
+            if progress:
+                progress(release_dir, done, total)
+
+        return release_progress
+
+    def run(self, future, release_dir, progress):
+        """Unpack releases in release_dir and set result of future."""
+        if future.cancelled():
+            return
+
+        try:
+            release_unpacker = ReleaseUnpacker(
+                release_dir,
+                self.tmp_dir,
+                self.unpack_dir,
+                progress=self.release_progress(future, progress),
+                **self.release_unpacker_kwargs
+            )
+            results = [
+                release_unpacker.unpack_release(release)
+                for release in release_unpacker.iter_releases()
+            ]
+        except UnpackCancelledError:
+            log.info("Unpack of %s cancelled", release_dir)
+            return
+        except Exception as e:
+            log.error("Unpack of %s failed: %s", release_dir, e)
+            try:
+                future.set_exception(e)
+            except InvalidStateError:
+                pass
+            return
+
+        try:
+            future.set_result(bool(results) and all(results))
+        except InvalidStateError:
+            pass
+
+    def close(self, cancel=False):
+        """Wait for queued releases and shut down the worker pool.
+
+        With cancel all releases are cancelled, unpacks already started stop
+        at the next chunk.
+        """
+        if cancel:
+            with self.lock:
+                futures = list(self.futures)
+            for future in futures:
+                future.cancel()
+
+        self.executor.shutdown(wait=True, cancel_futures=cancel)
+        if self.header_cache:
+            self.header_cache.close()
@@ -0,0 +1,244 @@
+"""Copy stored (uncompressed) files straight out of RAR volumes."""
+import errno
+import os
+import zlib
+
+from .lib import fadvise_dontneed, fdatasync, preallocate
+from .verify import Blake2sp
+
+# copy_file_range and sendfile errors meaning the kernel can't copy between
+# these two files, fall back to the next method
+COPY_FALLBACK_ERRORS = (
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+)
+
+
+class StoreCopyError(Exception):
+    """Store copy error."""
+
+    pass
+
+
+def stored_parts(volumes, file_name):
+    """Return data parts of file_name if it can be copied byte for byte.
+
+    volumes are parsed volume headers in volume order. Return a dict with the
+    (volume path, data offset, size) parts, the file size and CRC32 or
+    BLAKE2sp of the whole file. Return None if file_name is compressed,
+    encrypted, not found, not complete in volumes or has no hash to check.
+    """
+    parts = []
+    last_file = None
+    for volume in volumes:
+        if volume["headers_encrypted"]:
+            return None
+
+        for file in volume["files"]:
+            if file["name"] != file_name:
+                continue
+
+            if (
+                not file["stored"]
+                or file["encrypted"]
+                or file["directory"]
+                or file["split_before"] != bool(parts)
+            ):
+                return None
+
+            parts.append(
+                (volume["path"], file["data_offset"], file["packed_size"])
+            )
+            last_file = file
+
+    if (
+        not last_file
+        or last_file["split_after"]
+        or sum(size for _, _, size in parts) != last_file["size"]
+        or (last_file["crc"] is None and not last_file["blake2sp"])
+    ):
+        return None
+
+    # The last part has the hash of the whole file
+    return {
+        "parts": parts,
+        "size": last_file["size"],
+        "crc": last_file["crc"],
+        "blake2sp": last_file["blake2sp"],
+    }
+
+
+def copy_range(src_fd, dst_fd, offset, count):
+    """Copy count bytes at offset in src_fd to dst_fd in kernel space.
+
+    Data is written at the current position of dst_fd. Try copy_file_range
+    first and sendfile second. Return bytes copied or None if neither can
+    copy between these files.
+    """
+    if hasattr(os, "copy_file_range"):
+        try:
+            return os.copy_file_range(src_fd, dst_fd, count, offset)
+        except OSError as e:
+            if e.errno not in COPY_FALLBACK_ERRORS:
+                raise
+
+    try:
+        return os.sendfile(dst_fd, src_fd, offset, count)
+    except OSError as e:
+        if e.errno not in COPY_FALLBACK_ERRORS:
+            raise
+
+    return None
+
+
+def write_all(fd, data):
+    """Write all of data to fd."""
+    while data:
+        data = data[os.write(fd, data) :]
+
+
+def hash_resumed(path, size, blake2sp, buffer):
+    """Update blake2sp with the first size bytes of path.
+
+    A BLAKE2sp can't be saved in a checkpoint, the bytes written before it
+    are hashed again when a copy is resumed.
+    """
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as fp:
+        while size:
+            done = fp.readinto(view[: min(len(view), size)])
+            if not done:
+                raise StoreCopyError(
+                    "{} ended before {} resumed bytes".format(path, size)
+                )
+
+            blake2sp.update(view[:done])
+            size -= done
+
+
+def copy_stored_file(
+    stored,
+    dst_path,
+    buffer,
+    verify=True,
+    checkpoint=None,
+    progress=None,
+    preallocate_dst=True,
+    drop_cache=False,
+    throttle=None,
+):
+    """Copy the parts of a stored file to dst_path and return bytes copied.
+
+    The data is copied with copy_range and read back in buffer sized chunks
+    from the page cache to update the CRC32, or the BLAKE2sp of RAR5 files
+    without a CRC32, buffer is never written to
+    dst_path. If the kernel can't copy between the files the chunks read are
+    written instead. With a checkpoint the copy goes on from the last saved
+    checkpoint and progress is saved as the copy goes. progress is called
+    with the bytes of every chunk copied, bytes resumed included.
+    throttle.consume is called with the size of every chunk before it's
+    copied.
+
+    The size of the file is allocated on disk up front with preallocate_dst.
+    With drop_cache the pages of each volume part are dropped from the page
+    cache when copied and dst_path is synced and dropped when done. Raises
+    StoreCopyError if a volume is short or the hash doesn't match.
+    """
+    view = memoryview(buffer)
+    copied, crc = checkpoint.load() if checkpoint else (0, 0)
+    blake2sp = None
+    if verify and stored["crc"] is None:
+        blake2sp = Blake2sp()
+        if copied:
+            hash_resumed(dst_path, copied, blake2sp, buffer)
+    if progress and copied:
+        progress(copied)
+    flags = os.O_WRONLY | os.O_CREAT
+    if not copied:
+        flags |= os.O_TRUNC
+    dst_fd = os.open(dst_path, flags, 0o666)
+    try:
+        # Drop anything written after the checkpoint
+        if copied:
+            os.ftruncate(dst_fd, copied)
+            os.lseek(dst_fd, copied, os.SEEK_SET)
+
+        if preallocate_dst:
+            preallocate(dst_fd, stored["size"])
+
+        skip = copied
+        for volume_path, offset, size in stored["parts"]:
+            if skip >= size:
+                skip -= size
+                continue
+
+            src_fd = os.open(volume_path, os.O_RDONLY)
+            try:
+                start = offset
+                end = offset + size
+                offset += skip
+                skip = 0
+                while offset < end:
+                    count = min(len(view), end - offset)
+                    if throttle:
+                        throttle.consume(count)
+                    done = copy_range(src_fd, dst_fd, offset, count)
+                    if done is None:
+                        done = os.preadv(src_fd, [view[:count]], offset)
+                        write_all(dst_fd, view[:done])
+                    elif done and verify:
+                        done = os.preadv(src_fd, [view[:done]], offset)
+
+                    if not done:
+                        raise StoreCopyError(
+                            "{} ended at {}, expected {} bytes".format(
+                                volume_path, offset, end
+                            )
+                        )
+
+                    if blake2sp:
+                        blake2sp.update(view[:done])
+                    elif verify:
+                        crc = zlib.crc32(view[:done], crc)
+                    offset += done
+                    copied += done
+                    if progress:
+                        progress(done)
+
+                    if checkpoint and checkpoint.due(copied):
+                        checkpoint.save(
+                            dst_fd, copied, crc, volume_path, offset
+                        )
+                        if drop_cache:
+                            fadvise_dontneed(dst_fd, 0, copied)
+
+                if drop_cache:
+                    fadvise_dontneed(src_fd, start, size)
+            finally:
+                os.close(src_fd)
+
+        if drop_cache:
+            fdatasync(dst_fd)
+            fadvise_dontneed(dst_fd)
+    finally:
+        os.close(dst_fd)
+
+    if blake2sp:
+        digest = blake2sp.hexdigest()
+        if digest != stored["blake2sp"]:
+            raise StoreCopyError(
+                "BLAKE2sp mismatch for {}, expected {}, got {}".format(
+                    dst_path, stored["blake2sp"], digest
+                )
+            )
+    elif verify and crc != stored["crc"]:
+        raise StoreCopyError(
+            "CRC mismatch for {}, expected {:08x}, got {:08x}".format(
+                dst_path, stored["crc"], crc
+            )
+        )
+
+    return copied
@@ -0,0 +1,277 @@
+"""Build store mode (uncompressed) RAR4 and RAR5 archives for tests.
+
+Creating compressed RARs needs the proprietary rar tool. Scene releases are
+stored with -m0 anyway, so store mode archives written here are close to the
+real thing and can be read by rarfile without unrar.
+"""
+import os
+import struct
+import zlib
+
+from releaseunpacker.verify import Blake2sp
+
+MARKER = b"Rar!\x1a\x07\x00"
+RAR5_MARKER = b"Rar!\x1a\x07\x01\x00"
+
+MHD_VOLUME = 0x0001
+MHD_NEWNUMBERING = 0x0010
+MHD_FIRSTVOLUME = 0x0100
+
+LHD_SPLIT_BEFORE = 0x0001
+LHD_SPLIT_AFTER = 0x0002
+LHD_LARGE = 0x0100
+LONG_BLOCK = 0x8000
+
+EARC_NEXT_VOLUME = 0x0001
+EARC_VOLNUMBER = 0x0008
+
+DOS_TIME = 0x50E8_6000  # 2020-07-08 12:00:00
+
+
+def volume_names(path, volumes, new_naming=False):
+    """Return volume file names for a volume set starting with path."""
+    base = path[: -len(".rar")]
+    if new_naming:
+        digits = max(2, len(str(volumes)))
+        return [
+            "{}.part{}.rar".format(base, str(number).zfill(digits))
+            for number in range(1, volumes + 1)
+        ]
+
+    names = [path]
+    for number in range(volumes - 1):
+        letter = "rstuvwxyz"[number // 100]
+        names.append("{}.{}{:02d}".format(base, letter, number % 100))
+
+    return names
+
+
+def block(head_type, flags, body=b""):
+    """Return a RAR4 block with header CRC."""
+    header = struct.pack("<BHH", head_type, flags, 7 + len(body)) + body
+    crc = zlib.crc32(header) & 0xFFFF
+
+    return struct.pack("<H", crc) + header
+
+
+def main_header(flags):
+    """Return RAR4 main archive header."""
+    return block(0x73, flags, b"\x00" * 6)
+
+
+def file_header(name, data, unpacked_size, crc, flags):
+    """Return RAR4 file header followed by data."""
+    name = name.encode("utf-8")
+    flags |= LONG_BLOCK
+    if len(data) > 0xFFFFFFFF or unpacked_size > 0xFFFFFFFF:
+        flags |= LHD_LARGE
+
+    body = struct.pack(
+        "<IIBIIBBHI",
+        len(data) & 0xFFFFFFFF,
+        unpacked_size & 0xFFFFFFFF,
+        3,
+        crc,
+        DOS_TIME,
+        29,
+        0x30,
+        len(name),
+        0x81A4 << 16,
+    )
+    if flags & LHD_LARGE:
+        body += struct.pack("<II", len(data) >> 32, unpacked_size >> 32)
+
+    return block(0x74, flags, body + name) + data
+
+
+def end_header(volume_number, more_volumes):
+    """Return RAR4 end of archive header."""
+    flags = EARC_VOLNUMBER
+    if more_volumes:
+        flags |= EARC_NEXT_VOLUME
+
+    return block(0x7B, flags, struct.pack("<H", volume_number))
+
+
+def vint(value):
+    """Return RAR5 variable length integer."""
+    data = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            data.append(byte | 0x80)
+        else:
+            data.append(byte)
+            return bytes(data)
+
+
+def rar5_block(header_type, header_flags, body, data_size=None, extra=b""):
+    """Return a RAR5 header with CRC and extra area extra."""
+    if extra:
+        header_flags |= 0x0001
+    header = vint(header_type) + vint(header_flags)
+    if extra:
+        header += vint(len(extra))
+    if data_size is not None:
+        header += vint(data_size)
+    header += body + extra
+    header = vint(len(header)) + header
+
+    return struct.pack("<I", zlib.crc32(header)) + header
+
+
+def rar5_main_header(number, volume):
+    """Return RAR5 main archive header."""
+    if not volume:
+        return rar5_block(1, 0, vint(0))
+    elif number == 0:
+        return rar5_block(1, 0, vint(0x0001))
+
+    return rar5_block(1, 0, vint(0x0003) + vint(number))
+
+
+def rar5_file_header(name, data, unpacked_size, crc, flags, blake2sp=None):
+    """Return RAR5 file header followed by data.
+
+    With blake2sp the file has a BLAKE2sp hash record instead of a CRC32.
+    """
+    name = name.encode("utf-8")
+    header_flags = 0x0002
+    if flags & LHD_SPLIT_BEFORE:
+        header_flags |= 0x0008
+    if flags & LHD_SPLIT_AFTER:
+        header_flags |= 0x0010
+
+    extra = b""
+    if blake2sp:
+        record = vint(0x02) + vint(0) + blake2sp
+        extra = vint(len(record)) + record
+        body = vint(0)
+    else:
+        body = vint(0x0004)
+
+    body += vint(unpacked_size) + vint(0o100644)
+    if not blake2sp:
+        body += struct.pack("<I", crc)
+    body += vint(0) + vint(1) + vint(len(name)) + name
+
+    return rar5_block(2, header_flags, body, len(data), extra) + data
+
+
+def rar5_end_header(more_volumes):
+    """Return RAR5 end of archive header."""
+    return rar5_block(5, 0, vint(0x0001 if more_volumes else 0))
+
+
+def write_rar(
+    path, files, volume_size=None, new_naming=False, rar5=False, blake2=False
+):
+    """Write files to a store mode RAR at path and return volume paths.
+
+    files is a list of (name, data) tuples. With volume_size the data is
+    split over volumes holding at most volume_size bytes of file data each.
+    RAR5 volume sets always use new naming. With blake2 RAR5 files get a
+    BLAKE2sp hash instead of a CRC32.
+    """
+    if rar5 and volume_size:
+        new_naming = True
+
+    path = str(path)
+
+    # Split data in volume parts, a part is (file index, name, data, full
+    # data)
+    volumes = [[]]
+    room = volume_size
+    for file_index, (name, data) in enumerate(files):
+        offset = 0
+        while True:
+            if volume_size and not room:
+                volumes.append([])
+                room = volume_size
+
+            size = len(data) - offset
+            if volume_size:
+                size = min(size, room)
+                room -= size
+
+            volumes[-1].append(
+                (file_index, name, data[offset : offset + size], data)
+            )
+            offset += size
+
+            if offset >= len(data):
+                break
+
+    flags = 0
+    if len(volumes) > 1:
+        flags = MHD_VOLUME | (MHD_NEWNUMBERING if new_naming else 0)
+
+    volume_paths = volume_names(path, len(volumes), new_naming)
+    for number, (volume_path, parts) in enumerate(zip(volume_paths, volumes)):
+        volume_flags = flags
+        if number == 0 and flags:
+            volume_flags |= MHD_FIRSTVOLUME
+
+        with open(volume_path, "wb") as fp:
+            if rar5:
+                fp.write(RAR5_MARKER)
+                fp.write(rar5_main_header(number, bool(flags)))
+            else:
+                fp.write(MARKER)
+                fp.write(main_header(volume_flags))
+
+            for index, (file_index, name, data, full_data) in enumerate(parts):
+                part_flags = 0
+                if (
+                    index == 0
+                    and number > 0
+                    and volumes[number - 1][-1][0] == file_index
+                ):
+                    part_flags |= LHD_SPLIT_BEFORE
+
+                if (
+                    index == len(parts) - 1
+                    and number < len(volumes) - 1
+                    and volumes[number + 1][0][0] == file_index
+                ):
+                    part_flags |= LHD_SPLIT_AFTER
+                    hash_data = data
+                else:
+                    hash_data = full_data
+                crc = zlib.crc32(hash_data)
+
+                if rar5 and blake2:
+                    blake2sp = Blake2sp()
+                    blake2sp.update(hash_data)
+                    fp.write(
+                        rar5_file_header(
+                            name,
+                            data,
+                            len(full_data),
+                            crc,
+                            part_flags,
+                            bytes.fromhex(blake2sp.hexdigest()),
+                        )
+                    )
+                    continue
+
+                write_header = rar5_file_header if rar5 else file_header
+                fp.write(
+                    write_header(name, data, len(full_data), crc, part_flags)
+                )
+
+            if rar5:
+                fp.write(rar5_end_header(number < len(volumes) - 1))
+            else:
+                fp.write(end_header(number, number < len(volumes) - 1))
+
+    return volume_paths
+
+
+def truncate(path, size):
+    """Truncate file at path to size bytes, like a volume still copying."""
+    with open(path, "r+b") as fp:
+        fp.truncate(size)
+
+    return os.path.getsize(path)
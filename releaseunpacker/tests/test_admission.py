@@ -0,0 +1,212 @@
+"""Test SpaceAdmission."""
+import os
+import threading
+import unittest
+from unittest import mock
+
+from unipath import Path
+
+from releaseunpacker.admission import (
+    Reservation,
+    SpaceAdmission,
+    SpaceAdmissionError,
+)
+from releaseunpacker.releaseunpacker import ReleaseUnpacker
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+
+
+class TestSpaceAdmission(ReleaseUnpackerTestCase, unittest.TestCase):
+    """SpaceAdmission test case."""
+
+    def test_repr(self):
+        """Test object string representation."""
+        self.assertEqual(
+            SpaceAdmission(2 * 1024 * 1024).__repr__(),
+            "<SpaceAdmission: 2 MB headroom (0 reserved)>",
+        )
+
+    def test_invalid_headroom(self):
+        """Test invalid headroom raises exception."""
+        with self.assertRaises(SpaceAdmissionError) as cm:
+            SpaceAdmission(-1)
+
+        self.assertEqual(
+            str(cm.exception), "Headroom must be 0 or more, got -1"
+        )
+
+    def test_free(self):
+        """Test free space is read from statvfs."""
+        stat = os.statvfs(self.tmp_dir)
+
+        self.assertEqual(
+            SpaceAdmission().free(self.tmp_dir),
+            stat.f_bavail * stat.f_frsize,
+        )
+
+    def test_admit(self):
+        """Test space is summed per filesystem and reserved."""
+        admission = SpaceAdmission(100)
+        with mock.patch.object(admission, "free", return_value=1000):
+            reservation = admission.admit(
+                "Release-Group", {self.tmp_dir: 400, self.unpack_dir: 400}
+            )
+            self.assertIsNotNone(reservation)
+            self.assertEqual(
+                reservation.needs, {os.stat(self.tmp_dir).st_dev: 800}
+            )
+
+            # Doesn't fit at all
+            self.assertIsNone(
+                admission.admit("Big-Group", {self.tmp_dir: 901})
+            )
+
+            # Fits once written files are handed back
+            reservation.done(400)
+            self.assertIsNotNone(
+                admission.admit("Small-Group", {self.tmp_dir: 500})
+            )
+
+            reservation.release()
+            self.assertEqual(len(admission.reservations), 1)
+
+    def test_admit_wait(self):
+        """Test release waits for space reserved by unpacks in flight."""
+        admission = SpaceAdmission(0)
+        admitted = threading.Event()
+        with mock.patch.object(admission, "free", return_value=1000):
+            reservation = admission.admit("First-Group", {self.tmp_dir: 600})
+
+            def admit():
+                if admission.admit("Second-Group", {self.tmp_dir: 600}):
+                    admitted.set()
+
+            thread = threading.Thread(target=admit)
+            thread.start()
+            self.assertFalse(admitted.wait(0.2))
+
+            reservation.release()
+            thread.join(5)
+
+        self.assertTrue(admitted.is_set())
+        self.assertEqual(
+            [reservation.name for reservation in admission.reservations],
+            ["Second-Group"],
+        )
+
+    def test_reserved_allocated(self):
+        """Test blocks allocated to files being written aren't reserved."""
+        admission = SpaceAdmission(0)
+        device = os.stat(self.tmp_dir).st_dev
+        with mock.patch.object(admission, "free", return_value=10 ** 9):
+            reservation = admission.admit(
+                "Release-Group", {self.tmp_dir: 100000}
+            )
+
+        path = Path(self.tmp_dir, "movie.mkv.partial")
+        with open(path, "wb") as fp:
+            fp.write(os.urandom(40000))
+        reservation.writing(path)
+
+        allocated = os.stat(path).st_blocks * 512
+        self.assertGreater(allocated, 0)
+        self.assertEqual(admission.reserved(device), 100000 - allocated)
+
+        # Never less than nothing
+        reservation.needs[device] = 100
+        self.assertEqual(admission.reserved(device), 0)
+
+        # Renamed files are handed back with done
+        reservation.needs[device] = 100000
+        path.rename(Path(self.tmp_dir, "movie.mkv"))
+        self.assertEqual(admission.reserved(device), 100000)
+        self.assertEqual(reservation.paths, set())
+
+    def test_unpack_release_no_space(self):
+        """Test release that doesn't fit is deferred."""
+        self.write_release_rar("Store-Group", [("movie.mkv", b"movie")])
+
+        admission = SpaceAdmission(0)
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir,
+            self.tmp_dir,
+            self.unpack_dir,
+            admission=admission,
+        )
+        with mock.patch.object(admission, "free", return_value=4):
+            release_unpacker.unpack_release_dir_rars()
+
+        self.assertEqual(Path(self.unpack_dir).listdir(), [])
+        self.assertTrue(Path(self.search_dir, "Store-Group").exists())
+
+    def test_unpack_release(self):
+        """Test space is reserved while a release is unpacked."""
+        self.write_release_rar(
+            "Store-Group",
+            [("movie.mkv", b"movie"), ("extra.avi", b"a"), ("x.nfo", b"nfo")],
+        )
+
+        admission = SpaceAdmission(0)
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir,
+            self.tmp_dir,
+            self.unpack_dir,
+            extract_mode="tmp",
+            admission=admission,
+        )
+        with mock.patch.object(
+            admission, "admit", wraps=admission.admit
+        ) as admit:
+            release_unpacker.unpack_release_dir_rars()
+
+        admit.assert_called_once_with(
+            str(Path(self.search_dir, "Store-Group")), {self.tmp_dir: 6}
+        )
+        self.assertEqual(admission.reservations, [])
+        self.assertTrue(Path(self.unpack_dir, "Store-Group.mkv").exists())
+
+    def test_unpack_release_writing(self):
+        """Test files being written are added to the reservation."""
+        self.write_release_rar("Store-Group", [("movie.mkv", b"movie")])
+
+        admission = SpaceAdmission(0)
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir,
+            self.tmp_dir,
+            self.unpack_dir,
+            extract_mode="direct",
+            admission=admission,
+        )
+        with mock.patch.object(
+            Reservation, "writing", autospec=True
+        ) as writing:
+            release_unpacker.unpack_release_dir_rars()
+
+        self.assertEqual(
+            [call.args[1] for call in writing.call_args_list],
+            [Path(self.unpack_dir, "Store-Group.mkv.partial")],
+        )
+
+    def test_space_needed(self):
+        """Test files unpacked already don't need space."""
+        self.write_release_rar("Store-Group", [("movie.mkv", b"movie")])
+        with open(Path(self.unpack_dir, "Store-Group.mkv"), "wb") as fp:
+            fp.write(b"movie")
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir, extract_mode="tmp"
+        )
+        rar_file = release_unpacker.open_rar_file(
+            Path(self.search_dir, "Store-Group", "store-group.rar")
+        )
+
+        self.assertEqual(
+            release_unpacker.space_needed([rar_file]), {self.tmp_dir: 0}
+        )
+
+        release_unpacker.extract_mode = "direct"
+        del release_unpacker.direct_extract
+        with open(Path(self.unpack_dir, "Store-Group.mkv"), "wb") as fp:
+            fp.write(b"old")
+        self.assertEqual(
+            release_unpacker.space_needed([rar_file]), {self.unpack_dir: 5}
+        )
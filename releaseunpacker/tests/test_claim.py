@@ -0,0 +1,243 @@
+"""Test ReleaseClaims."""
+import json
+import os
+import time
+import unittest
+from unittest import mock
+
+from unipath import Path
+
+from releaseunpacker.claim import (
+    ReleaseClaims,
+    ReleaseClaimsError,
+    claim_path,
+    is_claim_file,
+    read_claim,
+)
+from releaseunpacker.releaseunpacker import ReleaseUnpacker
+from releaseunpacker.remover import ReleaseRemover
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+
+
+class TestReleaseClaims(ReleaseUnpackerTestCase, unittest.TestCase):
+    """ReleaseClaims test case."""
+
+    def setUp(self):
+        """Test setup."""
+        super().setUp()
+        self.release_dir = Path(self.search_dir, "Release-Group")
+        self.release_dir.mkdir()
+        self.claims = ReleaseClaims(owner="host1.1")
+        self.other_claims = ReleaseClaims(owner="host2.1")
+
+    def tearDown(self):
+        """Test cleanup."""
+        self.claims.close()
+        self.other_claims.close()
+        super().tearDown()
+
+    def expire(self, path):
+        """Make claim at path look like its worker died."""
+        old = time.time() - 2 * self.claims.lease_time
+        os.utime(path, (old, old))
+
+    def test_repr(self):
+        """Test object string representation."""
+        self.assertEqual(
+            self.claims.__repr__(), "<ReleaseClaims: host1.1 (0 leases)>"
+        )
+
+    def test_invalid_lease_time(self):
+        """Test invalid lease time raises exception."""
+        with self.assertRaises(ReleaseClaimsError) as cm:
+            ReleaseClaims(0)
+
+        self.assertEqual(
+            str(cm.exception), "Lease time must be more than 0, got 0"
+        )
+
+    def test_claim_path(self):
+        """Test claim file is next to the release dir."""
+        path = claim_path(self.release_dir)
+
+        self.assertEqual(
+            path,
+            Path(self.search_dir, ".Release-Group.releaseunpacker-claim"),
+        )
+        self.assertTrue(is_claim_file(path.name))
+        self.assertFalse(is_claim_file("Release-Group"))
+
+    def test_claim(self):
+        """Test a release can only be claimed once."""
+        lease = self.claims.claim(self.release_dir)
+
+        self.assertIsNotNone(lease)
+        with open(lease.path) as fp:
+            self.assertEqual(json.load(fp)["owner"], "host1.1")
+        self.assertIsNone(self.other_claims.claim(self.release_dir))
+
+        self.claims.release(lease)
+        self.assertFalse(lease.path.exists())
+        self.assertIsNotNone(self.other_claims.claim(self.release_dir))
+
+    def test_break_expired(self):
+        """Test claim of a dead worker is broken."""
+        lease = self.claims.claim(self.release_dir)
+        self.expire(lease.path)
+
+        other_lease = self.other_claims.claim(self.release_dir)
+
+        self.assertIsNotNone(other_lease)
+        self.assertFalse(lease.held())
+        self.assertEqual(self.search_dir_claim_files(), [lease.path.name])
+
+        # The dead worker doesn't remove the new claim
+        self.claims.release(lease)
+        self.assertTrue(other_lease.held())
+
+    def test_break_expired_race(self):
+        """Test a new claim renamed away by a late worker is put back."""
+        lease = self.claims.claim(self.release_dir)
+        self.expire(lease.path)
+        rename = os.rename
+
+        def rename_after_new_claim(src, dst):
+            # Another worker breaks the claim and claims the release first
+            with open(dst, "w") as fp:
+                json.dump({"owner": "host3.1"}, fp)
+            os.replace(dst, src)
+            rename(src, dst)
+
+        with mock.patch(
+            "releaseunpacker.claim.os.rename",
+            side_effect=rename_after_new_claim,
+        ):
+            self.assertIsNone(self.other_claims.claim(self.release_dir))
+
+        with open(lease.path) as fp:
+            self.assertEqual(json.load(fp)["owner"], "host3.1")
+        self.assertEqual(self.search_dir_claim_files(), [lease.path.name])
+
+    def test_beat(self):
+        """Test heartbeat renews claims and drops lost claims."""
+        lease = self.claims.claim(self.release_dir)
+        self.expire(lease.path)
+
+        self.claims.beat()
+        self.assertIsNone(self.other_claims.claim(self.release_dir))
+
+        lease.path.remove()
+        self.claims.beat()
+        self.assertEqual(self.claims.leases, [])
+        self.assertTrue(lease.lost.is_set())
+        with self.assertRaises(ReleaseClaimsError) as cm:
+            lease.check()
+        self.assertEqual(
+            str(cm.exception), "Lost claim of {}".format(self.release_dir)
+        )
+
+    def test_release_linger(self):
+        """Test claim is held until the release dir is gone."""
+        lease = self.claims.claim(self.release_dir)
+
+        self.claims.release(lease, linger=True)
+        self.claims.beat()
+        self.assertTrue(lease.held())
+
+        self.release_dir.rmdir()
+        self.claims.beat()
+        self.assertFalse(lease.path.exists())
+        self.assertEqual(self.claims.leases, [])
+
+    def test_close(self):
+        """Test close releases all claims."""
+        lease = self.claims.claim(self.release_dir)
+        self.claims.close()
+
+        self.assertFalse(lease.path.exists())
+        self.assertFalse(self.claims.thread.is_alive())
+
+    def test_unpack_release(self):
+        """Test only the worker that claims a release unpacks it."""
+        self.release_dir.rmdir()
+        self.write_release_rar("Release-Group", [("movie.mkv", b"movie")])
+        lease = self.other_claims.claim(self.release_dir)
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir, claims=self.claims
+        )
+        release_unpacker.unpack_release_dir_rars()
+        self.assertEqual(Path(self.unpack_dir).listdir(), [])
+
+        self.other_claims.release(lease)
+        release_unpacker.unpack_release_dir_rars()
+        self.assertEqual(
+            Path(self.unpack_dir).listdir(),
+            [Path(self.unpack_dir, "Release-Group.mkv")],
+        )
+        self.assertEqual(self.search_dir_claim_files(), [])
+
+    def test_unpack_release_removed(self):
+        """Test release removed by another worker since the scan is skipped."""
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir, claims=self.claims
+        )
+        release = {"dir": Path(self.search_dir, "Gone-Group"), "rar_files": []}
+
+        self.assertFalse(release_unpacker.unpack_release(release))
+        self.assertEqual(self.search_dir_claim_files(), [])
+
+    def test_unpack_release_lost(self):
+        """Test release isn't removed when its claim is lost while unpacked."""
+        self.release_dir.rmdir()
+        self.write_release_rar("Release-Group", [("movie.mkv", b"movie")])
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir, claims=self.claims
+        )
+        unpack_move_rar_file = release_unpacker.unpack_move_rar_file
+
+        def take_over(*args):
+            unpack_move_rar_file(*args)
+            (lease,) = self.claims.leases
+            self.expire(lease.path)
+            self.assertIsNotNone(self.other_claims.claim(self.release_dir))
+            self.claims.beat()
+            self.assertTrue(lease.lost.is_set())
+
+        release = list(release_unpacker.iter_releases())[0]
+        with mock.patch.object(
+            release_unpacker, "unpack_move_rar_file", side_effect=take_over
+        ):
+            self.assertFalse(release_unpacker.unpack_release(release))
+
+        self.assertTrue(self.release_dir.exists())
+        self.assertEqual(read_claim(claim_path(self.release_dir)), "host2.1")
+
+    def test_unpack_release_remover(self):
+        """Test claim is held while the release dir is removed."""
+        self.release_dir.rmdir()
+        self.write_release_rar("Release-Group", [("movie.mkv", b"movie")])
+
+        remover = ReleaseRemover()
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir,
+            self.tmp_dir,
+            self.unpack_dir,
+            remover=remover,
+            claims=self.claims,
+        )
+        with mock.patch.object(remover.executor, "submit"):
+            release_unpacker.unpack_release_dir_rars()
+
+        (lease,) = self.claims.leases
+        self.assertTrue(lease.linger)
+        self.assertTrue(lease.held())
+        remover.close()
+
+    def search_dir_claim_files(self):
+        """Return names of claim files in search dir."""
+        return sorted(
+            name
+            for name in os.listdir(self.search_dir)
+            if is_claim_file(name)
+        )
@@ -0,0 +1,141 @@
+"""Test release discovery."""
+import os
+import unittest
+from unittest import mock
+
+from unipath import Path
+
+from releaseunpacker.discovery import (
+    iter_rar_files,
+    iter_releases,
+    list_dir,
+    release_dir,
+)
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+
+
+class TestDiscovery(ReleaseUnpackerTestCase, unittest.TestCase):
+    """Release discovery test case."""
+
+    def test_list_dir(self):
+        """Test listing of sub dirs and first RAR file."""
+        self.copy_test_directory_to_search_dir("Release-Group")
+        release = Path(self.search_dir, "Release-Group")
+        Path(release, "b.rar").write_file("")
+        Path(release, "Sample").mkdir()
+        Path(release, "dir.rar").mkdir()
+        os.symlink(Path(release, "Sample"), Path(release, "Link"))
+
+        self.assertEqual(
+            list_dir(release),
+            (
+                [("Link", True), ("Sample", False), ("dir.rar", False)],
+                "b.rar",
+            ),
+        )
+        self.assertEqual(list_dir(Path(release, "Sample")), ([], None))
+
+    def test_iter_rar_files(self):
+        """Test RAR files are found in scan order with top last."""
+        for release in ("Release-Group", "Release.with.subs-Group"):
+            self.copy_test_directory_to_search_dir(release)
+        Path(self.search_dir, "top.rar").write_file("")
+
+        self.assertEqual(
+            list(iter_rar_files(self.search_dir)),
+            [
+                Path(self.search_dir, "Release-Group/rar_file.rar"),
+                Path(
+                    self.search_dir,
+                    "Release.with.subs-Group/release.with.subs-group.rar",
+                ),
+                Path(self.search_dir, "Release.with.subs-Group/Subs/subs.rar"),
+                Path(self.search_dir, "top.rar"),
+            ],
+        )
+
+    def test_iter_rar_files_symlinks(self):
+        """Test symlinked dirs are followed once and loops are skipped."""
+        self.copy_test_directory_to_search_dir("Release-Group")
+        outside = Path(self.tmp_dir, "Outside-Group")
+        outside.mkdir()
+        Path(outside, "outside.rar").write_file("")
+
+        os.symlink(self.search_dir, Path(self.search_dir, "Loop"))
+        os.symlink(outside, Path(self.search_dir, "Link1"))
+        os.symlink(outside, Path(self.search_dir, "Link2"))
+
+        self.assertEqual(
+            list(iter_rar_files(self.search_dir)),
+            [
+                Path(self.search_dir, "Link1/outside.rar"),
+                Path(self.search_dir, "Release-Group/rar_file.rar"),
+            ],
+        )
+
+    def test_release_dir(self):
+        """Test release dir of RAR files in release and Subs dirs."""
+        self.assertEqual(
+            release_dir(Path("/search/Release-Group/rar_file.rar")),
+            Path("/search/Release-Group"),
+        )
+        self.assertEqual(
+            release_dir(Path("/search/Release-Group/Sub/subs.rar")),
+            Path("/search/Release-Group"),
+        )
+
+    def test_iter_releases(self):
+        """Test releases are grouped and yielded when walked."""
+        self.copy_test_directory_to_search_dir("Release.with.subs-Group")
+        # Release inside a release, sorted before Subs
+        self.copy_test_directory_to_search_dir("Release-Group")
+        Path(self.search_dir, "Release-Group").move(
+            Path(self.search_dir, "Release.with.subs-Group", "Release-Group")
+        )
+
+        self.assertEqual(
+            list(iter_releases(self.search_dir)),
+            [
+                {
+                    "dir": Path(
+                        self.search_dir,
+                        "Release.with.subs-Group",
+                        "Release-Group",
+                    ),
+                    "rar_files": [
+                        Path(
+                            self.search_dir,
+                            "Release.with.subs-Group/Release-Group/"
+                            "rar_file.rar",
+                        )
+                    ],
+                },
+                {
+                    "dir": Path(self.search_dir, "Release.with.subs-Group"),
+                    "rar_files": [
+                        Path(
+                            self.search_dir,
+                            "Release.with.subs-Group/"
+                            "release.with.subs-group.rar",
+                        ),
+                        Path(
+                            self.search_dir,
+                            "Release.with.subs-Group/Subs/subs.rar",
+                        ),
+                    ],
+                },
+            ],
+        )
+
+    def test_iter_releases_lazy(self):
+        """Test first release is yielded before the walk is done."""
+        for release in ("Release-Group", "Release.with.subs-Group"):
+            self.copy_test_directory_to_search_dir(release)
+
+        listing = mock.Mock(wraps=list_dir)
+        releases = iter_releases(self.search_dir, listing)
+
+        self.assertEqual(
+            next(releases)["dir"], Path(self.search_dir, "Release-Group")
+        )
+        self.assertEqual(listing.call_count, 2)
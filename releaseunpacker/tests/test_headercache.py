@@ -0,0 +1,188 @@
+"""Test HeaderCache."""
+import os
+import unittest
+from unittest import mock
+
+from unipath import Path
+
+from releaseunpacker.headercache import HeaderCache, HeaderCacheError
+from releaseunpacker.rarheader import read_volume
+from releaseunpacker.releaseunpacker import ReleaseUnpacker
+from releaseunpacker.tests.rarbuilder import write_rar
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+from releaseunpacker.volumes import COMPLETE, VolumeSet
+
+
+@mock.patch("releaseunpacker.headercache.RACY_MTIME_NS", 0)
+class TestHeaderCache(ReleaseUnpackerTestCase, unittest.TestCase):
+    """HeaderCache test case."""
+
+    def setUp(self):
+        """Test setup."""
+        super().setUp()
+        self.cache_file = Path(self.tmp_dir, "header_cache.db")
+        self.header_cache = HeaderCache(self.cache_file)
+
+    def tearDown(self):
+        """Test cleanup."""
+        self.header_cache.close()
+        super().tearDown()
+
+    def test_repr(self):
+        """Test object string representation."""
+        self.assertEqual(
+            self.header_cache.__repr__(),
+            "<HeaderCache: {}>".format(self.cache_file),
+        )
+
+    def test_invalid_cache_file(self):
+        """Test cache file that can't be opened raises exception."""
+        with self.assertRaises(HeaderCacheError):
+            HeaderCache(Path(self.tmp_dir, "missing", "header_cache.db"))
+
+    def test_read_volume_cached(self):
+        """Test unchanged volumes are only read once."""
+        volume_paths = self.write_release_rar(
+            "Store-Group", [("movie.mkv", os.urandom(25000))]
+        )
+
+        with mock.patch(
+            "releaseunpacker.headercache.read_volume", wraps=read_volume
+        ) as read_volume_mock:
+            volume = self.header_cache.read_volume(volume_paths[0])
+            self.assertEqual(
+                self.header_cache.read_volume(volume_paths[0]), volume
+            )
+
+        self.assertEqual(read_volume_mock.call_count, 1)
+        self.assertEqual(volume, read_volume(str(volume_paths[0])))
+
+    def test_read_volume_changed(self):
+        """Test changed volumes are read again."""
+        volume_paths = self.write_release_rar(
+            "Store-Group", [("movie.mkv", os.urandom(25000))]
+        )
+        self.header_cache.read_volume(volume_paths[0])
+
+        write_rar(volume_paths[0], [("movie.mkv", os.urandom(10000))])
+        volume = self.header_cache.read_volume(volume_paths[0])
+
+        self.assertEqual(volume["files"][0]["size"], 10000)
+        self.assertEqual(self.header_cache.misses, 2)
+
+    def test_read_volume_racy(self):
+        """Test volumes modified just now are not cached."""
+        volume_paths = self.write_release_rar(
+            "Store-Group", [("movie.mkv", os.urandom(25000))]
+        )
+
+        with mock.patch(
+            "releaseunpacker.headercache.RACY_MTIME_NS", 60 * 1000000000
+        ), mock.patch(
+            "releaseunpacker.headercache.read_volume", wraps=read_volume
+        ) as read_volume_mock:
+            self.header_cache.read_volume(volume_paths[0])
+            self.header_cache.read_volume(volume_paths[0])
+
+        self.assertEqual(read_volume_mock.call_count, 2)
+
+    def test_persistent(self):
+        """Test cached volumes are used by the next run."""
+        volume_paths = self.write_release_rar(
+            "Store-Group",
+            [("movie.mkv", os.urandom(25000))],
+            volume_size=10000,
+        )
+        self.assertEqual(
+            VolumeSet(volume_paths[0], header_cache=self.header_cache).status,
+            COMPLETE,
+        )
+        self.header_cache.close()
+
+        self.header_cache = HeaderCache(self.cache_file)
+        with mock.patch(
+            "releaseunpacker.headercache.read_volume"
+        ) as read_volume_mock:
+            volume_set = VolumeSet(
+                volume_paths[0], header_cache=self.header_cache
+            )
+            self.assertEqual(volume_set.status, COMPLETE)
+
+        read_volume_mock.assert_not_called()
+        self.assertEqual(len(volume_set.volumes), 3)
+        self.assertEqual(self.header_cache.hits, 3)
+
+    def test_no_open_transaction(self):
+        """Test the database isn't left locked after volumes are read."""
+        volume_paths = self.write_release_rar(
+            "Store-Group", [("movie.mkv", os.urandom(25000))]
+        )
+        self.header_cache.read_volume(volume_paths[0])
+        self.assertFalse(self.header_cache.db.in_transaction)
+
+        self.header_cache.read_volume(volume_paths[0])
+        self.assertFalse(self.header_cache.db.in_transaction)
+        used = self.header_cache.used[str(volume_paths[0])]
+
+        other_cache = HeaderCache(self.cache_file)
+        other_cache.db.execute("BEGIN IMMEDIATE")
+        other_cache.db.rollback()
+        other_cache.close()
+
+        self.header_cache.commit()
+        ((last_used,),) = self.header_cache.db.execute(
+            "SELECT last_used FROM volumes"
+        )
+        self.assertEqual(last_used, used)
+        self.assertEqual(self.header_cache.used, {})
+
+    def test_prune(self):
+        """Test gone volumes and least recently used volumes are evicted."""
+        volume_paths = self.write_release_rar(
+            "Store-Group",
+            [("movie.mkv", os.urandom(25000))],
+            volume_size=10000,
+        )
+        for volume_path in volume_paths:
+            self.header_cache.read_volume(volume_path)
+
+        volume_paths[2].remove()
+        self.header_cache.max_entries = 1
+        self.header_cache.read_volume(volume_paths[0])
+        self.header_cache.prune()
+
+        paths = [
+            path
+            for path, in self.header_cache.db.execute(
+                "SELECT path FROM volumes"
+            )
+        ]
+        self.assertEqual(paths, [volume_paths[0]])
+
+    def test_no_op_run_never_opens_archive(self):
+        """Test skipped releases are checked from the cache."""
+        movie = os.urandom(25000)
+        self.write_release_rar(
+            "Store-Group", [("movie.mkv", movie)], volume_size=10000
+        )
+        with open(Path(self.unpack_dir, "Store-Group.mkv"), "wb") as fp:
+            fp.write(movie)
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir,
+            self.tmp_dir,
+            self.unpack_dir,
+            no_remove=True,
+            header_cache=self.header_cache,
+        )
+        release_unpacker.unpack_release_dir_rars()
+
+        with mock.patch(
+            "releaseunpacker.headercache.read_volume"
+        ) as read_volume_mock, mock.patch(
+            "releaseunpacker.releaseunpacker.rarfile.RarFile"
+        ) as rar_file_mock:
+            release_unpacker.unpack_release_dir_rars()
+
+        read_volume_mock.assert_not_called()
+        rar_file_mock.assert_not_called()
@@ -0,0 +1,216 @@
+"""Test checkpoint journal."""
+import json
+import os
+import unittest
+from unittest import mock
+
+from unipath import Path
+
+from releaseunpacker.journal import (
+    TMP_PREFIX,
+    Checkpoint,
+    journal_path,
+    sweep_tmp_artifacts,
+)
+from releaseunpacker.releaseunpacker import (
+    ReleaseUnpacker,
+    ReleaseUnpackerRarFile,
+)
+from releaseunpacker.storecopy import copy_range
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+
+
+def kill_after(calls):
+    """Return copy_range replacement interrupted after calls copies."""
+    done = []
+
+    def copy_range_kill(*args):
+        if len(done) == calls:
+            raise KeyboardInterrupt()
+        done.append(args)
+
+        return copy_range(*args)
+
+    return copy_range_kill
+
+
+@mock.patch("releaseunpacker.journal.CHECKPOINT_BYTES", 4096)
+class TestJournal(ReleaseUnpackerTestCase, unittest.TestCase):
+    """Checkpoint journal test case."""
+
+    def setUp(self):
+        """Test setup."""
+        super().setUp()
+        self.movie = os.urandom(25000)
+        self.volume_paths = self.write_release_rar(
+            "Store-Group", [("movie.mkv", self.movie)], volume_size=10000
+        )
+
+    def rar_file(self):
+        """Return ReleaseUnpackerRarFile with a small buffer."""
+        rar_file = ReleaseUnpackerRarFile(self.volume_paths[0])
+        rar_file.buffer = bytearray(4096)
+
+        return rar_file
+
+    def test_repr(self):
+        """Test object string representation."""
+        dst_path = Path(self.unpack_dir, "movie.mkv")
+        checkpoint = Checkpoint(
+            dst_path, self.rar_file().stored_file("movie.mkv")
+        )
+
+        self.assertEqual(
+            checkpoint.__repr__(),
+            "<Checkpoint: {} (0 bytes)>".format(dst_path),
+        )
+
+    def test_resume_stream_file(self):
+        """Test killed stream goes on from the last checkpoint."""
+        unpack_file_path = Path(self.unpack_dir, "Store-Group.mkv")
+        partial_file_path = Path("{}.partial".format(unpack_file_path))
+
+        with mock.patch(
+            "releaseunpacker.storecopy.copy_range", side_effect=kill_after(4)
+        ), self.assertRaises(KeyboardInterrupt):
+            self.rar_file().stream_file("movie.mkv", unpack_file_path)
+
+        with open(journal_path(partial_file_path)) as fp:
+            journal = json.load(fp)
+        self.assertEqual(journal["copied"], 14096)
+        self.assertEqual(journal["volume"], self.volume_paths[1])
+
+        with mock.patch(
+            "releaseunpacker.storecopy.copy_range", wraps=copy_range
+        ) as copy_range_mock:
+            self.rar_file().stream_file("movie.mkv", unpack_file_path)
+
+        # Only the bytes after the checkpoint are copied again
+        self.assertEqual(
+            sum(call.args[3] for call in copy_range_mock.call_args_list),
+            25000 - 14096,
+        )
+        with open(unpack_file_path, "rb") as fp:
+            self.assertEqual(fp.read(), self.movie)
+        self.assertEqual(Path(self.unpack_dir).listdir(), [unpack_file_path])
+
+    def test_resume_blake2sp(self):
+        """Test resumed BLAKE2sp files hash the bytes before the checkpoint."""
+        volume_paths = self.write_release_rar(
+            "Blake2-Group",
+            [("movie.mkv", self.movie)],
+            volume_size=10000,
+            rar5=True,
+            blake2=True,
+        )
+        unpack_file_path = Path(self.unpack_dir, "Blake2-Group.mkv")
+
+        def rar_file():
+            rar_file = ReleaseUnpackerRarFile(volume_paths[0])
+            rar_file.buffer = bytearray(4096)
+
+            return rar_file
+
+        with mock.patch(
+            "releaseunpacker.storecopy.copy_range", side_effect=kill_after(4)
+        ), self.assertRaises(KeyboardInterrupt):
+            rar_file().stream_file("movie.mkv", unpack_file_path)
+
+        rar_file().stream_file("movie.mkv", unpack_file_path)
+
+        with open(unpack_file_path, "rb") as fp:
+            self.assertEqual(fp.read(), self.movie)
+
+    def test_resume_volume_changed(self):
+        """Test checkpoint isn't used when a volume changed."""
+        unpack_file_path = Path(self.unpack_dir, "Store-Group.mkv")
+
+        with mock.patch(
+            "releaseunpacker.storecopy.copy_range", side_effect=kill_after(4)
+        ), self.assertRaises(KeyboardInterrupt):
+            self.rar_file().stream_file("movie.mkv", unpack_file_path)
+
+        os.utime(self.volume_paths[0], ns=(0, 0))
+        rar_file = self.rar_file()
+        checkpoint = Checkpoint(
+            "{}.partial".format(unpack_file_path),
+            rar_file.stored_file("movie.mkv"),
+        )
+
+        self.assertEqual(checkpoint.load(), (0, 0))
+
+        rar_file.stream_file("movie.mkv", unpack_file_path)
+        with open(unpack_file_path, "rb") as fp:
+            self.assertEqual(fp.read(), self.movie)
+
+    def test_resume_extract_tmp(self):
+        """Test killed extract to tmp dir is resumed by the next run."""
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir, extract_mode="tmp"
+        )
+
+        with mock.patch(
+            "releaseunpacker.storecopy.copy_range", side_effect=kill_after(2)
+        ), self.assertRaises(KeyboardInterrupt):
+            release_unpacker.unpack_release_dir_rars()
+
+        # Resumable files survive the startup sweep
+        self.assertEqual(
+            sweep_tmp_artifacts(self.tmp_dir, self.unpack_dir), 0
+        )
+        extract_dir = Path(self.tmp_dir, TMP_PREFIX + "Store-Group")
+        self.assertEqual(
+            extract_dir.listdir(),
+            [
+                Path(extract_dir, "movie.mkv"),
+                Path(extract_dir, "movie.mkv.journal"),
+            ],
+        )
+
+        release_unpacker.unpack_release_dir_rars()
+
+        with open(Path(self.unpack_dir, "Store-Group.mkv"), "rb") as fp:
+            self.assertEqual(fp.read(), self.movie)
+        self.assertEqual(Path(self.tmp_dir).listdir(), [])
+
+    def test_sweep_tmp_artifacts(self):
+        """Test stale files are removed and resumable files kept."""
+        with mock.patch(
+            "releaseunpacker.storecopy.copy_range", side_effect=kill_after(4)
+        ), self.assertRaises(KeyboardInterrupt):
+            self.rar_file().stream_file(
+                "movie.mkv", Path(self.unpack_dir, "Store-Group.mkv")
+            )
+
+        stale_paths = [
+            Path(self.tmp_dir, TMP_PREFIX + "Old-Group", "movie.mkv"),
+            Path(self.tmp_dir, TMP_PREFIX + "abc123", "Subs", "subs.idx"),
+            Path(self.unpack_dir, "Old-Group.mkv.partial"),
+            Path(self.unpack_dir, "Gone-Group.mkv.partial.journal"),
+        ]
+        for path in stale_paths:
+            path.parent.mkdir(parents=True)
+            with open(path, "w") as fp:
+                fp.write("stale")
+        keep_path = Path(self.tmp_dir, "other.mkv")
+        with open(keep_path, "w") as fp:
+            fp.write("keep")
+
+        self.assertEqual(
+            sweep_tmp_artifacts(self.tmp_dir, self.unpack_dir), 4
+        )
+        self.assertEqual(Path(self.tmp_dir).listdir(), [keep_path])
+        self.assertEqual(
+            Path(self.unpack_dir).listdir(),
+            [
+                Path(self.unpack_dir, "Store-Group.mkv.partial"),
+                Path(self.unpack_dir, "Store-Group.mkv.partial.journal"),
+            ],
+        )
+
+        # Gone volumes make the checkpoint stale
+        self.volume_paths[2].remove()
+        self.assertEqual(
+            sweep_tmp_artifacts(self.tmp_dir, self.unpack_dir), 2
+        )
+        self.assertEqual(Path(self.unpack_dir).listdir(), [])
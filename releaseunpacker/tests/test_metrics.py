@@ -0,0 +1,172 @@
+"""Test Metrics."""
+import json
+import os
+import unittest
+
+from unipath import Path
+
+from releaseunpacker.metrics import (
+    JsonLinesHook,
+    Metrics,
+    MetricsHook,
+    PrometheusHook,
+)
+from releaseunpacker.releaseunpacker import ReleaseUnpacker
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+
+
+class ListHook(MetricsHook):
+    """Hook collecting all measurements in a list."""
+
+    def __init__(self):
+        """Initialize ListHook."""
+        self.measurements = []
+
+    def emit(self, stage, seconds, fields):
+        """Collect measurement."""
+        self.measurements.append((stage, seconds, fields))
+
+
+class TestMetrics(ReleaseUnpackerTestCase, unittest.TestCase):
+    """Metrics test case."""
+
+    def test_repr(self):
+        """Test object string representation."""
+        stats_file = Path(self.tmp_dir, "stats.jsonl")
+        hook = JsonLinesHook(stats_file)
+        self.addCleanup(hook.close)
+
+        self.assertEqual(
+            Metrics([hook]).__repr__(),
+            "<Metrics: [<JsonLinesHook: {}>]>".format(stats_file),
+        )
+
+    def test_timer(self):
+        """Test timer emits fields and bytes per second."""
+        hook = ListHook()
+        metrics = Metrics([hook])
+
+        with metrics.timer("extract", file="movie.mkv") as fields:
+            fields["bytes"] = 1000
+
+        stage, seconds, fields = hook.measurements[0]
+        self.assertEqual(stage, "extract")
+        self.assertGreater(seconds, 0)
+        self.assertEqual(fields["file"], "movie.mkv")
+        self.assertEqual(fields["bytes"], 1000)
+        self.assertIn("bytes_per_second", fields)
+
+    def test_timer_error(self):
+        """Test timer emits the error and reraises it."""
+        hook = ListHook()
+        metrics = Metrics([hook])
+
+        with self.assertRaises(OSError):
+            with metrics.timer("rmtree"):
+                raise OSError("Failed")
+
+        self.assertEqual(hook.measurements[0][2], {"error": "OSError"})
+
+    def test_hook_error(self):
+        """Test a failing hook doesn't break the unpack."""
+        hook = ListHook()
+        hook.emit = None
+
+        with Metrics([hook]).timer("move"):
+            pass
+
+    def test_json_lines_hook(self):
+        """Test measurements are appended as JSON lines."""
+        stats_file = Path(self.tmp_dir, "stats.jsonl")
+        metrics = Metrics([JsonLinesHook(stats_file)])
+        metrics.emit("move", 0.5, file="movie.mkv", bytes=100)
+        metrics.emit("rmtree", 0.25, dir="Release")
+        metrics.close()
+
+        with open(stats_file) as fp:
+            lines = [json.loads(line) for line in fp]
+
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]["stage"], "move")
+        self.assertEqual(lines[0]["seconds"], 0.5)
+        self.assertEqual(lines[0]["bytes"], 100)
+        self.assertEqual(lines[0]["bytes_per_second"], 200)
+        self.assertIn("time", lines[0])
+        self.assertEqual(lines[1]["dir"], "Release")
+
+    def test_prometheus_hook(self):
+        """Test totals are written in textfile collector format."""
+        prometheus_file = Path(self.tmp_dir, "releaseunpacker.prom")
+        metrics = Metrics([PrometheusHook(prometheus_file)])
+        metrics.emit("extract", 1.5, bytes=100)
+        metrics.emit("extract", 0.5, bytes=50)
+
+        # Written after every release
+        self.assertFalse(prometheus_file.exists())
+        metrics.emit("release", 2.0)
+
+        with open(prometheus_file) as fp:
+            lines = fp.read().splitlines()
+
+        self.assertIn(
+            "# TYPE releaseunpacker_stage_count_total counter", lines
+        )
+        self.assertIn(
+            'releaseunpacker_stage_count_total{stage="extract"} 2', lines
+        )
+        self.assertIn(
+            'releaseunpacker_stage_seconds_total{stage="extract"} 2.0', lines
+        )
+        self.assertIn(
+            'releaseunpacker_stage_bytes_total{stage="extract"} 150', lines
+        )
+        self.assertIn(
+            'releaseunpacker_stage_last_seconds{stage="release"} 2.0', lines
+        )
+
+        # No tmp files left behind
+        self.assertEqual(
+            Path(self.tmp_dir).listdir(), [Path(prometheus_file)]
+        )
+
+    def test_unpack_stages(self):
+        """Test every unpack stage is measured."""
+        movie = os.urandom(100000)
+        self.write_release_rar(
+            "Metrics-Group", [("movie.mkv", movie)], volume_size=30000
+        )
+
+        hook = ListHook()
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir,
+            self.tmp_dir,
+            self.unpack_dir,
+            extract_mode="tmp",
+            metrics=Metrics([hook]),
+        )
+        release_unpacker.unpack_release_dir_rars()
+
+        stages = [stage for stage, _, _ in hook.measurements]
+        self.assertEqual(
+            stages,
+            [
+                "volume_check",
+                "header_parse",
+                "extract",
+                "move",
+                "rmtree",
+                "release",
+                "scan",
+            ],
+        )
+
+        fields = {stage: fields for stage, _, fields in hook.measurements}
+        self.assertEqual(fields["extract"]["bytes"], len(movie))
+        self.assertEqual(fields["move"]["bytes"], len(movie))
+        self.assertEqual(fields["volume_check"]["status"], "complete")
+        self.assertEqual(
+            fields["release"]["release"],
+            Path(self.search_dir, "Metrics-Group"),
+        )
+        self.assertGreaterEqual(fields["release"]["latency_seconds"], 0)
+        self.assertEqual(fields["scan"]["rar_files"], 1)
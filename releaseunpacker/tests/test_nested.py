@@ -0,0 +1,223 @@
+"""Test NestedArchives."""
+import io
+import os
+import unittest
+import zipfile
+from unittest import mock
+
+from unipath import Path
+
+from releaseunpacker.nested import (
+    NestedArchiveError,
+    NestedArchives,
+    load_py7zr,
+)
+from releaseunpacker.releaseunpacker import ReleaseUnpacker
+from releaseunpacker.tests.rarbuilder import write_rar
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+
+
+class TestNestedArchives(ReleaseUnpackerTestCase, unittest.TestCase):
+    """NestedArchives test case."""
+
+    def rar_data(self, files):
+        """Return data of a store mode RAR with files."""
+        rar_file_path = Path(self.tmp_dir, "nested.rar")
+        write_rar(rar_file_path, files)
+        with open(rar_file_path, "rb") as fp:
+            data = fp.read()
+        rar_file_path.remove()
+
+        return data
+
+    def zip_data(self, files):
+        """Return data of a zip with files."""
+        fp = io.BytesIO()
+        with zipfile.ZipFile(fp, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            for file_name, data in files:
+                zip_file.writestr(file_name, data)
+
+        return fp.getvalue()
+
+    def unpack(self, files, throttle=None, **kwargs):
+        """Unpack release with files in its RAR, return unpack dir files."""
+        self.write_release_rar("Release-Group", files)
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir,
+            self.tmp_dir,
+            self.unpack_dir,
+            nested=NestedArchives(spool_dir=self.tmp_dir, **kwargs),
+            throttle=throttle,
+        )
+        release_unpacker.unpack_release_dir_rars()
+
+        return sorted(path.name for path in Path(self.unpack_dir).listdir())
+
+    def read_unpacked(self, file_name):
+        """Return data of file_name in unpack dir."""
+        with open(Path(self.unpack_dir, file_name), "rb") as fp:
+            return fp.read()
+
+    def test_repr(self):
+        """Test object string representation."""
+        self.assertEqual(
+            NestedArchives(2, 1024).__repr__(),
+            "<NestedArchives: 2 deep (1024 bytes in memory)>",
+        )
+
+    def test_invalid_arguments(self):
+        """Test invalid depth and memory size raise exception."""
+        with self.assertRaises(NestedArchiveError) as cm:
+            NestedArchives(-1)
+        self.assertEqual(
+            str(cm.exception), "Max depth must be 0 or more, got -1"
+        )
+
+        with self.assertRaises(NestedArchiveError) as cm:
+            NestedArchives(memory_size=-1)
+        self.assertEqual(
+            str(cm.exception), "Memory size must be 0 or more, got -1"
+        )
+
+    def test_unpack_nested_rar(self):
+        """Test files in a RAR in a RAR are unpacked without temp files."""
+        movie = os.urandom(1000)
+        inner = self.rar_data([("movie.mkv", movie)])
+
+        self.assertEqual(
+            self.unpack([("inner.rar", inner), ("release.nfo", b"nfo")]),
+            ["Release-Group.mkv"],
+        )
+        self.assertEqual(self.read_unpacked("Release-Group.mkv"), movie)
+        self.assertEqual(Path(self.tmp_dir).listdir(), [])
+
+    def test_unpack_nested_zip(self):
+        """Test files in a zip in a RAR in a RAR are unpacked."""
+        movie = os.urandom(1000)
+        inner = self.rar_data(
+            [("movie.zip", self.zip_data([("movie.mkv", movie)]))]
+        )
+
+        self.assertEqual(
+            self.unpack([("inner.rar", inner)]), ["Release-Group.mkv"]
+        )
+        self.assertEqual(self.read_unpacked("Release-Group.mkv"), movie)
+
+    @unittest.skipUnless(load_py7zr(), "py7zr isn't installed")
+    def test_unpack_nested_7z(self):
+        """Test files in a 7z in a RAR are unpacked."""
+        py7zr = load_py7zr()
+        movie = os.urandom(1000)
+        fp = io.BytesIO()
+        with py7zr.SevenZipFile(fp, "w") as seven_zip_file:
+            seven_zip_file.writestr(movie, "movie.mkv")
+
+        self.assertEqual(
+            self.unpack([("movie.7z", fp.getvalue())]), ["Release-Group.mkv"]
+        )
+        self.assertEqual(self.read_unpacked("Release-Group.mkv"), movie)
+
+    def test_max_depth(self):
+        """Test archives nested deeper than max depth raise exception."""
+        inner = self.rar_data(
+            [("movie.zip", self.zip_data([("movie.mkv", b"movie")]))]
+        )
+
+        with self.assertRaises(NestedArchiveError) as cm:
+            self.unpack([("inner.rar", inner)], max_depth=1)
+        self.assertEqual(
+            str(cm.exception), "movie.zip is nested more than 1 deep"
+        )
+        self.assertTrue(Path(self.search_dir, "Release-Group").exists())
+
+    def test_max_depth_off(self):
+        """Test nested archives are skipped with max depth 0."""
+        inner = self.rar_data([("movie.mkv", b"movie")])
+
+        self.assertEqual(self.unpack([("inner.rar", inner)], max_depth=0), [])
+
+    def test_spool_to_disk(self):
+        """Test archives larger than memory size are spooled to a file."""
+        nested = NestedArchives(memory_size=10, spool_dir=self.tmp_dir)
+        spool = nested.buffer_file()
+        spool.write(os.urandom(100))
+        self.assertTrue(spool._rolled)
+        spool.close()
+
+        movie = os.urandom(1000)
+        inner = self.rar_data([("movie.mkv", movie)])
+
+        self.assertEqual(
+            self.unpack([("inner.rar", inner)], memory_size=0),
+            ["Release-Group.mkv"],
+        )
+        self.assertEqual(self.read_unpacked("Release-Group.mkv"), movie)
+
+    def test_corrupt_nested_file(self):
+        """Test files in nested archives are checked against their CRC."""
+        movie = os.urandom(1000)
+        inner = bytearray(self.rar_data([("movie.mkv", movie)]))
+        inner[inner.find(movie[100:120])] ^= 0xFF
+
+        with self.assertRaises(NestedArchiveError) as cm:
+            self.unpack([("inner.rar", bytes(inner))])
+        self.assertTrue(
+            str(cm.exception).startswith(
+                "CRC mismatch for movie.mkv in inner.rar"
+            )
+        )
+        self.assertEqual(Path(self.unpack_dir).listdir(), [])
+        self.assertTrue(Path(self.search_dir, "Release-Group").exists())
+
+    def test_throttle(self):
+        """Test nested archives and their files are read through throttle."""
+        movie = os.urandom(1000)
+        inner = self.rar_data([("movie.mkv", movie)])
+        throttle = mock.Mock()
+
+        self.assertEqual(
+            self.unpack([("inner.rar", inner)], throttle=throttle),
+            ["Release-Group.mkv"],
+        )
+        self.assertEqual(
+            sum(call.args[0] for call in throttle.consume.call_args_list),
+            len(inner) + len(movie),
+        )
+
+    def test_bad_nested_archive(self):
+        """Test archives that can't be opened raise exception."""
+        with self.assertRaises(NestedArchiveError) as cm:
+            self.unpack([("inner.zip", b"not a zip"), ("movie.mkv", b"m")])
+        self.assertTrue(str(cm.exception).startswith("Can't open inner.zip:"))
+        self.assertTrue(Path(self.search_dir, "Release-Group").exists())
+
+    def test_no_py7zr(self):
+        """Test 7z archives raise exception without py7zr."""
+        with mock.patch(
+            "releaseunpacker.nested.load_py7zr", return_value=None
+        ), self.assertRaises(NestedArchiveError) as cm:
+            self.unpack([("movie.7z", b"7z")])
+        self.assertEqual(
+            str(cm.exception), "Can't open movie.7z, py7zr isn't installed"
+        )
+        self.assertTrue(Path(self.search_dir, "Release-Group").exists())
+
+    def test_subs(self):
+        """Test RARs in a Subs RAR are unpacked with the subs rules."""
+        inner = self.rar_data([("subs.idx", b"idx"), ("subs.sub", b"sub")])
+        self.write_release_rar("Release-Group", [("movie.mkv", b"movie")])
+        release_dir = Path(self.search_dir, "Release-Group")
+        Path(release_dir, "Subs").mkdir()
+        write_rar(Path(release_dir, "Subs", "subs.rar"), [("subs.rar", inner)])
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir
+        )
+        release_unpacker.unpack_release_dir_rars()
+
+        self.assertEqual(
+            sorted(path.name for path in Path(self.unpack_dir).listdir()),
+            ["Release-Group.idx", "Release-Group.mkv", "Release-Group.sub"],
+        )
+        self.assertFalse(release_dir.exists())
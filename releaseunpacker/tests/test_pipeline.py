@@ -0,0 +1,153 @@
+"""Test ReleasePipeline."""
+import threading
+import unittest
+
+from unipath import Path
+
+from releaseunpacker.pipeline import ReleasePipeline, ReleasePipelineError
+from releaseunpacker.releaseunpacker import ReleaseUnpacker
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+
+
+class TestReleasePipeline(ReleaseUnpackerTestCase, unittest.TestCase):
+    """ReleasePipeline test case."""
+
+    def setUp(self):
+        """Test setup."""
+        super().setUp()
+        self.pipeline = ReleasePipeline(1024)
+        self.blocked = threading.Event()
+
+    def tearDown(self):
+        """Test cleanup."""
+        self.blocked.set()
+        self.pipeline.close()
+        super().tearDown()
+
+    def block(self, size=0):
+        """Queue a job that blocks the pipeline until blocked is set."""
+        self.pipeline.submit("/blocker", self.blocked.wait, size=size)
+
+    def release_unpacker(self):
+        """Return ReleaseUnpacker extracting to tmp dir with pipeline."""
+        return ReleaseUnpacker(
+            self.search_dir,
+            self.tmp_dir,
+            self.unpack_dir,
+            extract_mode="tmp",
+            pipeline=self.pipeline,
+        )
+
+    def test_repr(self):
+        """Test object string representation."""
+        self.assertEqual(
+            self.pipeline.__repr__(),
+            "<ReleasePipeline: 1024 bytes in tmp dir (0 waiting)>",
+        )
+
+    def test_invalid_max_tmp_bytes(self):
+        """Test max tmp bytes below 1 raises exception."""
+        with self.assertRaises(ReleasePipelineError) as cm:
+            ReleasePipeline(0)
+        self.assertEqual(
+            str(cm.exception), "Max tmp bytes must be 1 or more, got 0"
+        )
+
+    def test_moves_overlap_extraction(self):
+        """Test releases are extracted while earlier files wait to move."""
+        self.write_release_rar("Movie.A-Group", [("a.mkv", b"a" * 100)])
+        self.write_release_rar("Movie.B-Group", [("b.mkv", b"b" * 100)])
+        self.block()
+
+        self.release_unpacker().unpack_release_dir_rars()
+
+        # Both releases are extracted, nothing is moved or removed yet
+        self.assertEqual(Path(self.unpack_dir).listdir(), [])
+        self.assertEqual(len(Path(self.tmp_dir).listdir()), 2)
+        self.assertEqual(len(Path(self.search_dir).listdir()), 2)
+        self.assertTrue(
+            self.pipeline.pending(Path(self.search_dir, "Movie.A-Group"))
+        )
+
+        self.blocked.set()
+        self.assertEqual(self.pipeline.join(), {})
+
+        self.assertEqual(
+            sorted(path.name for path in Path(self.unpack_dir).listdir()),
+            ["Movie.A-Group.mkv", "Movie.B-Group.mkv"],
+        )
+        self.assertEqual(Path(self.tmp_dir).listdir(), [])
+        self.assertEqual(Path(self.search_dir).listdir(), [])
+        self.assertFalse(self.pipeline.pending(self.search_dir))
+
+    def test_pending_release_deferred(self):
+        """Test a release with moves pending isn't unpacked again."""
+        self.write_release_rar("Movie-Group", [("movie.mkv", b"movie")])
+        self.block()
+        release_unpacker = self.release_unpacker()
+        release = list(release_unpacker.iter_releases())[0]
+
+        self.assertTrue(release_unpacker.unpack_release(release))
+        self.assertEqual(release_unpacker.deferred, [])
+        self.assertFalse(release_unpacker.unpack_release(release))
+        self.assertEqual(release_unpacker.deferred, [release["dir"]])
+
+    def test_wait_room(self):
+        """Test extraction waits while tmp dir is full of queued files."""
+        self.block(size=1000)
+        waited = threading.Event()
+
+        def wait():
+            self.pipeline.wait_room(100)
+            waited.set()
+
+        thread = threading.Thread(target=wait)
+        thread.start()
+        self.assertFalse(waited.wait(0.2))
+
+        self.blocked.set()
+        thread.join(5)
+        self.assertTrue(waited.is_set())
+        self.assertEqual(self.pipeline.pending_bytes, 0)
+
+    def test_wait_room_large_file(self):
+        """Test a file larger than the backlog fits in an empty tmp dir."""
+        self.pipeline.wait_room(4096)
+
+    def test_failed_move_keeps_release(self):
+        """Test release dirs aren't removed when a move fails."""
+        self.write_release_rar("Movie-Group", [("movie.mkv", b"movie")])
+        self.block()
+        self.release_unpacker().unpack_release_dir_rars()
+
+        # Unpack dir is gone when the file is moved
+        Path(self.unpack_dir).rmtree()
+        self.blocked.set()
+        failed = self.pipeline.join()
+        Path(self.unpack_dir).mkdir()
+
+        self.assertEqual(
+            list(failed), [str(Path(self.search_dir, "Movie-Group"))]
+        )
+        self.assertTrue(Path(self.search_dir, "Movie-Group").exists())
+        self.assertEqual(self.pipeline.join(), {})
+
+    def test_always_jobs_run_after_failure(self):
+        """Test jobs that must always run aren't skipped after a failure."""
+        ran = []
+
+        def fail():
+            raise OSError("move failed")
+
+        self.pipeline.submit("/release", fail)
+        self.pipeline.submit("/release", lambda: ran.append("skipped"))
+        self.pipeline.submit(
+            "/release", lambda: ran.append("always"), always=True
+        )
+        self.pipeline.submit("/other", lambda: ran.append("other"))
+
+        failed = self.pipeline.join()
+
+        self.assertEqual(ran, ["always", "other"])
+        self.assertEqual(list(failed), ["/release"])
+        self.assertEqual(str(failed["/release"]), "move failed")
@@ -0,0 +1,216 @@
+"""Test ReleasePlanner."""
+import os
+import threading
+import unittest
+from unittest import mock
+
+from unipath import Path
+
+from releaseunpacker.plan import ReleasePlanner, ReleasePlannerError
+from releaseunpacker.priority import ReleasePriority
+from releaseunpacker.releaseunpacker import ReleaseUnpacker
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+
+
+class TestReleasePlanner(ReleaseUnpackerTestCase, unittest.TestCase):
+    """ReleasePlanner test case."""
+
+    def release_planner(self, **kwargs):
+        """Return ReleasePlanner for search dir."""
+        return ReleasePlanner(
+            [
+                ReleaseUnpacker(
+                    self.search_dir,
+                    self.tmp_dir,
+                    self.unpack_dir,
+                    extract_mode="tmp",
+                )
+            ],
+            **kwargs
+        )
+
+    def release_plans(self, plan):
+        """Return release plans by release dir name."""
+        return {
+            Path(release_plan["release"]).name: release_plan
+            for release_plan in plan["releases"]
+        }
+
+    def test_repr(self):
+        """Test object string representation."""
+        self.assertEqual(
+            self.release_planner(jobs=2).__repr__(),
+            "<ReleasePlanner: 1 release dirs (2 jobs)>",
+        )
+
+    def test_invalid_arguments(self):
+        """Test invalid jobs and sample size raise exception."""
+        with self.assertRaises(ReleasePlannerError) as cm:
+            self.release_planner(jobs=0)
+        self.assertEqual(str(cm.exception), "Jobs must be 1 or more, got 0")
+
+        with self.assertRaises(ReleasePlannerError) as cm:
+            self.release_planner(sample_size=-1)
+        self.assertEqual(
+            str(cm.exception), "Sample size must be 0 or more, got -1"
+        )
+
+    def test_plan(self):
+        """Test plan lists files, targets and bytes to write."""
+        self.write_release_rar(
+            "Movie-Group",
+            [("movie.mkv", os.urandom(3000)), ("movie.nfo", b"nfo")],
+        )
+
+        plan = self.release_planner(sample_size=0).plan()
+
+        self.assertEqual(
+            plan["releases"],
+            [
+                {
+                    "release": str(Path(self.search_dir, "Movie-Group")),
+                    "unpack": True,
+                    "skip_reason": None,
+                    "files": [
+                        {
+                            "rar": str(
+                                Path(
+                                    self.search_dir,
+                                    "Movie-Group",
+                                    "movie-group.rar",
+                                )
+                            ),
+                            "member": "movie.mkv",
+                            "target": str(
+                                Path(self.unpack_dir, "Movie-Group.mkv")
+                            ),
+                            "bytes": 3000,
+                            "stored": True,
+                            "action": "unpack",
+                        }
+                    ],
+                    "bytes": {self.tmp_dir: 3000},
+                    "seconds": None,
+                }
+            ],
+        )
+        self.assertEqual(plan["unpack"], 1)
+        self.assertEqual(plan["skip"], 0)
+        self.assertEqual(plan["bytes"], {self.tmp_dir: 3000})
+        self.assertEqual(plan["throughput"], [])
+        self.assertIsNone(plan["seconds"])
+
+    def test_skip_reasons(self):
+        """Test releases that wouldn't be unpacked get the reason."""
+        self.write_release_rar(
+            "Incomplete-Group",
+            [("movie.mkv", os.urandom(25000))],
+            volume_size=10000,
+        )[2].remove()
+        self.write_release_rar("Nfo-Group", [("movie.nfo", b"nfo")])
+        self.write_release_rar("Done-Group", [("movie.mkv", b"movie")])
+        with open(Path(self.unpack_dir, "Done-Group.mkv"), "wb") as fp:
+            fp.write(b"movie")
+
+        release_plans = self.release_plans(
+            self.release_planner(sample_size=0).plan()
+        )
+
+        self.assertEqual(
+            {
+                name: release_plan["skip_reason"]
+                for name, release_plan in release_plans.items()
+            },
+            {
+                "Incomplete-Group": "Volume set incomplete: Volume"
+                " incomplete-group.r01 is missing",
+                "Nfo-Group": "No files picked by the rules",
+                "Done-Group": "Already unpacked",
+            },
+        )
+        self.assertEqual(
+            release_plans["Done-Group"]["files"][0]["action"], "exists"
+        )
+
+    def test_no_probes_by_default(self):
+        """Test throughput is only measured when asked for."""
+        self.write_release_rar("Movie-Group", [("movie.mkv", b"movie")])
+
+        with mock.patch.object(
+            ReleasePlanner, "measure_read"
+        ) as measure_read, mock.patch.object(
+            ReleasePlanner, "measure_write"
+        ) as measure_write:
+            plan = self.release_planner().plan()
+
+        measure_read.assert_not_called()
+        measure_write.assert_not_called()
+        self.assertEqual(plan["throughput"], [])
+        self.assertIsNone(plan["seconds"])
+
+    def test_smallest_sizes_in_jobs(self):
+        """Test release sizes for the smallest order are read in the jobs."""
+        for release, size in (("Big-Group", 3000), ("Small-Group", 1000)):
+            self.write_release_rar(release, [("movie.mkv", os.urandom(size))])
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir,
+            self.tmp_dir,
+            self.unpack_dir,
+            priority=ReleasePriority("smallest"),
+        )
+        release_size = release_unpacker.release_size
+        threads = []
+
+        def record_thread(release):
+            threads.append(threading.current_thread())
+            return release_size(release)
+
+        with mock.patch.object(
+            release_unpacker, "release_size", side_effect=record_thread
+        ):
+            plan = ReleasePlanner([release_unpacker], jobs=2).plan()
+
+        self.assertEqual(
+            [
+                Path(release_plan["release"]).name
+                for release_plan in plan["releases"]
+            ],
+            ["Small-Group", "Big-Group"],
+        )
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_nothing_written_or_removed(self):
+        """Test a plan leaves all dirs as they were."""
+        self.write_release_rar("Movie-Group", [("movie.mkv", b"movie")])
+        before = [
+            sorted(Path(dir).walk())
+            for dir in (self.search_dir, self.tmp_dir, self.unpack_dir)
+        ]
+
+        plan = self.release_planner(sample_size=4096).plan()
+
+        self.assertEqual(
+            [
+                sorted(Path(dir).walk())
+                for dir in (self.search_dir, self.tmp_dir, self.unpack_dir)
+            ],
+            before,
+        )
+        self.assertTrue(plan["releases"][0]["unpack"])
+
+    def test_estimate(self):
+        """Test time is estimated from the measured throughput."""
+        self.write_release_rar("Movie-Group", [("movie.mkv", b"movie")])
+
+        plan = self.release_planner(sample_size=4096).plan()
+
+        for rates in plan["throughput"]:
+            self.assertGreater(rates.get("write", 1), 0)
+        self.assertIn(
+            str(Path(self.search_dir, "Movie-Group", "movie-group.rar")),
+            [rates["path"] for rates in plan["throughput"]],
+        )
+        self.assertIsNotNone(plan["seconds"])
+        self.assertEqual(plan["releases"][0]["seconds"], plan["seconds"])
@@ -0,0 +1,233 @@
+"""Test ReleasePriority."""
+import os
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from unipath import Path
+
+from releaseunpacker.priority import (
+    ReleasePriority,
+    ReleasePriorityError,
+    parse_category,
+)
+from releaseunpacker.releaseunpacker import ReleaseUnpacker
+from releaseunpacker.scheduler import ReleaseScheduler
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+
+
+class TestReleasePriority(ReleaseUnpackerTestCase, unittest.TestCase):
+    """ReleasePriority test case."""
+
+    def setUp(self):
+        """Test setup."""
+        super().setUp()
+        now = time.time()
+        for release, size, age in (
+            ("Big.Movie-Group", 3000, 60),
+            ("Show.S01E01-Group", 2000, 120),
+            ("Small.Movie-Group", 1000, 30),
+        ):
+            for volume_path in self.write_release_rar(
+                release, [("movie.mkv", os.urandom(size))]
+            ):
+                os.utime(volume_path, (now - age, now - age))
+
+    def release_unpacker(self, priority):
+        """Return ReleaseUnpacker for search dir with priority."""
+        return ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir, priority=priority
+        )
+
+    def order(self, priority):
+        """Return release dir names in the order priority unpacks them."""
+        release_unpacker = self.release_unpacker(priority)
+
+        return [
+            release["dir"].name
+            for release in release_unpacker.iter_releases()
+        ]
+
+    def test_repr(self):
+        """Test object string representation."""
+        self.assertEqual(
+            ReleasePriority("oldest", [("*", 1)]).__repr__(),
+            "<ReleasePriority: oldest (1 categories)>",
+        )
+
+    def test_invalid_arguments(self):
+        """Test invalid order and aging time raise exception."""
+        with self.assertRaises(ReleasePriorityError) as cm:
+            ReleasePriority("random")
+        self.assertEqual(str(cm.exception), "Invalid order random")
+
+        with self.assertRaises(ReleasePriorityError) as cm:
+            ReleasePriority(aging_time=-1)
+        self.assertEqual(
+            str(cm.exception), "Aging time must be 0 or more, got -1"
+        )
+
+    def test_parse_category(self):
+        """Test categories are parsed from PATTERN=PRIORITY."""
+        self.assertEqual(parse_category("*.S??E??*=10"), ("*.S??E??*", 10))
+        self.assertEqual(parse_category("a=b=-1"), ("a=b", -1))
+
+        for category in ("*.mkv", "=1", "*=high"):
+            with self.assertRaises(ReleasePriorityError):
+                parse_category(category)
+
+    def test_smallest(self):
+        """Test smallest releases are unpacked first."""
+        self.assertEqual(
+            self.order(ReleasePriority("smallest")),
+            ["Small.Movie-Group", "Show.S01E01-Group", "Big.Movie-Group"],
+        )
+
+    def test_smallest_executor(self):
+        """Test release sizes are read in parallel with an executor."""
+        release_unpacker = self.release_unpacker(None)
+        releases = [
+            (release_unpacker, release)
+            for release in release_unpacker.scan_releases()
+        ]
+
+        with ThreadPoolExecutor(2) as executor:
+            releases = ReleasePriority("smallest").sort(
+                releases, executor=executor
+            )
+
+        self.assertEqual(
+            [release["dir"].name for _, release in releases],
+            ["Small.Movie-Group", "Show.S01E01-Group", "Big.Movie-Group"],
+        )
+
+    def test_oldest(self):
+        """Test oldest releases are unpacked first."""
+        self.assertEqual(
+            self.order(ReleasePriority("oldest")),
+            ["Show.S01E01-Group", "Big.Movie-Group", "Small.Movie-Group"],
+        )
+
+    def test_found(self):
+        """Test releases are unpacked in the order they're found."""
+        self.assertEqual(
+            self.order(ReleasePriority("found")),
+            ["Big.Movie-Group", "Show.S01E01-Group", "Small.Movie-Group"],
+        )
+
+    def test_category(self):
+        """Test higher priority categories are unpacked first."""
+        priority = ReleasePriority(
+            "smallest",
+            [("*.s??e??-*", 10), ("*", 0), ("big.*", 20)],
+        )
+
+        self.assertEqual(
+            self.order(priority),
+            ["Show.S01E01-Group", "Small.Movie-Group", "Big.Movie-Group"],
+        )
+
+    def test_aging(self):
+        """Test releases queued for aging time are unpacked first."""
+        priority = ReleasePriority("smallest", aging_time=50)
+
+        # Written to long ago but only queued now
+        self.assertEqual(
+            self.order(priority),
+            ["Small.Movie-Group", "Show.S01E01-Group", "Big.Movie-Group"],
+        )
+
+        now = time.time()
+        priority.queued[Path(self.search_dir, "Big.Movie-Group")] = now - 60
+        priority.queued[Path(self.search_dir, "Show.S01E01-Group")] = now - 90
+        self.assertEqual(
+            self.order(priority),
+            ["Show.S01E01-Group", "Big.Movie-Group", "Small.Movie-Group"],
+        )
+
+    def test_queue_prune(self):
+        """Test queue times are kept until the release dir is gone."""
+        priority = ReleasePriority()
+        release_dir = Path(self.search_dir, "Big.Movie-Group")
+        self.order(priority)
+
+        queued = priority.queue(release_dir)
+        self.order(priority)
+        self.assertEqual(priority.queue(release_dir), queued)
+
+        release_dir.rmtree()
+        self.order(priority)
+        self.assertNotIn(release_dir, priority.queued)
+        self.assertEqual(len(priority.queued), 2)
+
+    def test_unreadable_size(self):
+        """Test releases with headers that can't be read are unpacked last."""
+        Path(self.search_dir, "Broken-Group").mkdir()
+        with open(Path(self.search_dir, "Broken-Group", "b.rar"), "wb") as fp:
+            fp.write(b"not a rar")
+
+        with self.assertLogs("releaseunpacker.priority", "WARNING") as cm:
+            self.assertEqual(
+                self.order(ReleasePriority("smallest")),
+                [
+                    "Small.Movie-Group",
+                    "Show.S01E01-Group",
+                    "Big.Movie-Group",
+                    "Broken-Group",
+                ],
+            )
+
+        self.assertEqual(len(cm.output), 1)
+        self.assertTrue(
+            cm.output[0].startswith(
+                "WARNING:releaseunpacker.priority:Unpacking {} last: "
+                "Can't read size of".format(
+                    Path(self.search_dir, "Broken-Group")
+                )
+            )
+        )
+
+    def test_release_gone(self):
+        """Test releases removed since they were found are unpacked last."""
+        release_unpacker = self.release_unpacker(None)
+        releases = [
+            (release_unpacker, release)
+            for release in release_unpacker.scan_releases()
+        ]
+        Path(self.search_dir, "Small.Movie-Group").rmtree()
+
+        with self.assertLogs("releaseunpacker.priority", "WARNING"):
+            releases = ReleasePriority("smallest").sort(releases)
+
+        self.assertEqual(
+            [release["dir"].name for _, release in releases],
+            ["Show.S01E01-Group", "Big.Movie-Group", "Small.Movie-Group"],
+        )
+
+    def test_scheduler(self):
+        """Test scheduler starts jobs in priority order."""
+        release_scheduler = ReleaseScheduler(
+            priority=ReleasePriority("smallest")
+        )
+
+        jobs = release_scheduler.scan_jobs([self.release_unpacker(None)])
+
+        self.assertEqual(
+            [job["release"]["dir"].name for job in jobs],
+            ["Small.Movie-Group", "Show.S01E01-Group", "Big.Movie-Group"],
+        )
+
+    def test_unpack_release_dir_rars(self):
+        """Test all releases are unpacked with a priority."""
+        self.release_unpacker(
+            ReleasePriority("smallest")
+        ).unpack_release_dir_rars()
+
+        self.assertEqual(
+            sorted(path.name for path in Path(self.unpack_dir).listdir()),
+            [
+                "Big.Movie-Group.mkv",
+                "Show.S01E01-Group.mkv",
+                "Small.Movie-Group.mkv",
+            ],
+        )
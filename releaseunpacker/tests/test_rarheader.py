@@ -0,0 +1,292 @@
+"""Test RAR header reader."""
+import os
+import unittest
+import zlib
+
+from unipath import Path
+
+from releaseunpacker.rarheader import (
+    RAR4_LHD_DIRECTORY,
+    RAR4_LHD_PASSWORD,
+    RAR4_MHD_PASSWORD,
+    RarHeaderError,
+    RarHeaderTruncatedError,
+    decode_rar4_name,
+    read_buffer,
+    read_volume,
+)
+from releaseunpacker.releaseunpacker import (
+    ReleaseUnpacker,
+    ReleaseUnpackerRarFileError,
+)
+from releaseunpacker.tests.rarbuilder import (
+    MARKER,
+    end_header,
+    file_header,
+    main_header,
+    truncate,
+    write_rar,
+)
+from releaseunpacker.tests.test_releaseunpacker import (
+    TEST_FILES,
+    ReleaseUnpackerTestCase,
+)
+
+
+def rar_data(*file_headers, flags=0):
+    """Return RAR4 data with file_headers."""
+    return (
+        MARKER + main_header(flags) + b"".join(file_headers) + end_header(0, 0)
+    )
+
+
+def movie_header(flags=0):
+    """Return RAR4 file header of movie.mkv with flags."""
+    return file_header("movie.mkv", b"movie", 5, zlib.crc32(b"movie"), flags)
+
+
+class TestRarHeader(ReleaseUnpackerTestCase, unittest.TestCase):
+    """RAR header reader test case."""
+
+    def test_read_volume_compressed(self):
+        """Test reading headers of a compressed RAR."""
+        volume = read_volume(TEST_FILES.child("Release-Group", "rar_file.rar"))
+
+        self.assertEqual(volume["format"], 4)
+        self.assertFalse(volume["volume"])
+        self.assertFalse(volume["more_volumes"])
+        self.assertEqual(volume["end_offset"], volume["size"])
+        self.assertEqual(len(volume["files"]), 1)
+        self.assertEqual(volume["files"][0]["name"], "movie.mkv")
+        self.assertEqual(volume["files"][0]["size"], 6)
+        self.assertEqual(volume["files"][0]["crc"], 4022805672)
+        self.assertFalse(volume["files"][0]["stored"])
+
+    def test_decode_rar4_name(self):
+        """Test RAR4 unicode file names."""
+        # 8-bit run, 16-bit char, 8-bit run
+        self.assertEqual(
+            decode_rar4_name(
+                b"File_o.mkv\0" + bytes((0x00, 0xEC, 0x03, 0xF6, 0x00, 0x02))
+            ),
+            "File_\xf6.mkv",
+        )
+
+        # 8-bit run with high byte and correction
+        self.assertEqual(
+            decode_rar4_name(b"\x10\x11\x12\0" + bytes((0x04, 0xC0, 0x81, 0))),
+            "\u0410\u0411\u0412",
+        )
+
+        # UTF-8 without zero byte
+        self.assertEqual(
+            decode_rar4_name("Fil\xf6.mkv".encode("utf-8")), "Fil\xf6.mkv"
+        )
+
+        # Broken encoded name falls back to the 8-bit name
+        self.assertEqual(
+            decode_rar4_name(b"File.mkv\0" + bytes((0x00, 0xC0, 0x80))),
+            "File.mkv",
+        )
+
+    def test_read_volume_set(self):
+        """Test reading headers of RAR4 and RAR5 volume sets."""
+        movie = os.urandom(25000)
+        for rar5 in (False, True):
+            volume_paths = self.write_release_rar(
+                "Store{}-Group".format(rar5),
+                [("movie.mkv", movie), ("store.nfo", b"nfo")],
+                volume_size=10000,
+                rar5=rar5,
+            )
+            volumes = [read_volume(path) for path in volume_paths]
+
+            self.assertEqual(
+                [volume["format"] for volume in volumes],
+                [5 if rar5 else 4] * 3,
+            )
+            self.assertEqual(
+                [volume["more_volumes"] for volume in volumes],
+                [True, True, False],
+            )
+            self.assertEqual(
+                [volume["volume_number"] for volume in volumes],
+                [None if rar5 else 0, 1, 2],
+            )
+
+            parts = [
+                (file["name"], file["split_before"], file["split_after"])
+                for volume in volumes
+                for file in volume["files"]
+            ]
+            self.assertEqual(
+                parts,
+                [
+                    ("movie.mkv", False, True),
+                    ("movie.mkv", True, True),
+                    ("movie.mkv", True, False),
+                    ("store.nfo", False, False),
+                ],
+            )
+
+            # Data offsets point at the stored data
+            data = b""
+            for volume in volumes:
+                file = volume["files"][0]
+                with open(volume["path"], "rb") as fp:
+                    fp.seek(file["data_offset"])
+                    data += fp.read(file["packed_size"])
+            self.assertEqual(data, movie)
+
+            last_file = volumes[2]["files"][0]
+            self.assertTrue(last_file["stored"])
+            self.assertEqual(last_file["size"], len(movie))
+            self.assertEqual(last_file["crc"], zlib.crc32(movie))
+
+    def test_read_volume_truncated(self):
+        """Test volume shorter than its headers raises exception."""
+        volume_paths = self.write_release_rar(
+            "Store-Group", [("movie.mkv", os.urandom(1000))]
+        )
+        truncate(volume_paths[0], 500)
+
+        with self.assertRaises(RarHeaderTruncatedError):
+            read_volume(volume_paths[0])
+
+    def test_read_volume_not_a_rar(self):
+        """Test file that is not a RAR raises exception."""
+        path = Path(self.search_dir, "not_a_rar.rar")
+        path.write_file("Not a RAR file")
+
+        with self.assertRaises(RarHeaderError) as cm:
+            read_volume(path)
+
+        self.assertEqual(str(cm.exception), "Not a RAR file {}".format(path))
+
+    def test_read_volume_zero_filled(self):
+        """Test preallocated zero filled volume raises exception."""
+        path = Path(self.search_dir, "zero.rar")
+        with open(path, "wb") as fp:
+            fp.write(b"Rar!\x1a\x07\x00" + b"\0" * 1000)
+
+        with self.assertRaises(RarHeaderError):
+            read_volume(path)
+
+    def test_read_buffer(self):
+        """Test headers are read from data in memory."""
+        path = Path(self.tmp_dir, "movie.rar")
+        write_rar(path, [("movie.mkv", b"movie")], rar5=True)
+        with open(path, "rb") as fp:
+            data = fp.read()
+
+        self.assertEqual(read_buffer(data), dict(read_volume(path), path=None))
+        with self.assertRaises(RarHeaderTruncatedError):
+            read_buffer(data[:20])
+
+    def test_read_buffer_flags(self):
+        """Test dir, encryption and stored flags are read."""
+        volume = read_buffer(
+            rar_data(
+                file_header("Sample", b"", 0, 0, RAR4_LHD_DIRECTORY),
+                movie_header(RAR4_LHD_PASSWORD),
+            )
+        )
+
+        sample, movie = volume["files"]
+        self.assertTrue(sample["directory"])
+        self.assertFalse(movie["directory"])
+        self.assertTrue(movie["encrypted"])
+        self.assertTrue(movie["stored"])
+
+        volume = read_buffer(rar_data(flags=RAR4_MHD_PASSWORD))
+        self.assertTrue(volume["headers_encrypted"])
+
+    def test_file_list_from_headers(self):
+        """Test file list is read from the headers without dirs."""
+        Path(self.search_dir, "Release-Group").mkdir()
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir
+        )
+        rar_file_path = Path(
+            self.search_dir, "Release-Group", "release-group.rar"
+        )
+        with open(rar_file_path, "wb") as fp:
+            fp.write(
+                rar_data(
+                    file_header("Sample", b"", 0, 0, RAR4_LHD_DIRECTORY),
+                    movie_header(),
+                )
+            )
+
+        release_unpacker_rar_file = release_unpacker.open_rar_file(
+            rar_file_path
+        )
+        self.assertEqual(
+            release_unpacker_rar_file.file_list,
+            [
+                {
+                    "name": Path("movie.mkv"),
+                    "size": 5,
+                    "crc": zlib.crc32(b"movie"),
+                    "blake2sp": None,
+                    "stored": True,
+                    "encrypted": False,
+                }
+            ],
+        )
+        self.assertNotIn("rar_file", release_unpacker_rar_file.__dict__)
+
+    def test_unpack_encrypted(self):
+        """Test releases with encrypted files fail before unpacking.
+
+        Volumes with encrypted headers can't be checked, without the volume
+        check they fail too.
+        """
+        release_dir = Path(self.search_dir, "Release-Group")
+        release_dir.mkdir()
+
+        for data, message, check_volumes in (
+            (
+                rar_data(movie_header(RAR4_LHD_PASSWORD)),
+                "movie.mkv in {} is encrypted",
+                True,
+            ),
+            (
+                rar_data(flags=RAR4_MHD_PASSWORD),
+                "Headers of {} are encrypted",
+                False,
+            ),
+        ):
+            release_unpacker = ReleaseUnpacker(
+                self.search_dir,
+                self.tmp_dir,
+                self.unpack_dir,
+                check_volumes=check_volumes,
+            )
+            rar_file_path = Path(release_dir, "release-group.rar")
+            with open(rar_file_path, "wb") as fp:
+                fp.write(data)
+
+            with self.assertRaises(ReleaseUnpackerRarFileError) as cm:
+                release_unpacker.unpack_release_dir_rars()
+
+            self.assertEqual(
+                str(cm.exception), message.format(rar_file_path.absolute())
+            )
+            self.assertTrue(release_dir.exists())
+            self.assertEqual(Path(self.unpack_dir).listdir(), [])
+
+    def test_unpack_encrypted_headers_deferred(self):
+        """Test releases with encrypted headers are deferred."""
+        release_dir = Path(self.search_dir, "Release-Group")
+        release_dir.mkdir()
+        with open(Path(release_dir, "release-group.rar"), "wb") as fp:
+            fp.write(rar_data(flags=RAR4_MHD_PASSWORD))
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir
+        )
+        release_unpacker.unpack_release_dir_rars()
+
+        self.assertEqual(release_unpacker.deferred, [release_dir])
+        self.assertEqual(Path(self.unpack_dir).listdir(), [])
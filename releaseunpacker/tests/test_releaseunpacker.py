@@ -6,6 +6,7 @@ import unittest
 from tempfile import mkdtemp
 from unittest import mock
 
+import rarfile
 from unipath import Path
 
 from releaseunpacker.releaseunpacker import (
@@ -14,6 +15,7 @@ from releaseunpacker.releaseunpacker import (
     ReleaseUnpackerRarFile,
     ReleaseUnpackerRarFileError,
 )
+from releaseunpacker.tests.rarbuilder import truncate, write_rar
 
 TEST_FILES = Path(os.path.dirname(os.path.abspath(__file__)), "files")
 
@@ -45,6 +47,23 @@ class ReleaseUnpackerTestCase:
             Path(TEST_FILES, source), Path(self.search_dir, source)
         )
 
+    def write_release_rar(self, release, files, **kwargs):
+        """Write a store mode RAR release to search dir.
+
+        Return the volume paths.
+        """
+        release_dir = Path(self.search_dir, release)
+        release_dir.mkdir(parents=True)
+
+        return [
+            Path(volume_path)
+            for volume_path in write_rar(
+                Path(release_dir, "{}.rar".format(release.lower())),
+                files,
+                **kwargs
+            )
+        ]
+
     def copy_test_file_to_tmp_dir(self, file_name):
         """Copy test file to tmp dir."""
         return TEST_FILES.child(file_name).copy(Path(self.tmp_dir, file_name))
@@ -74,6 +93,60 @@ class TestReleaseUnpacker(ReleaseUnpackerTestCase, unittest.TestCase):
             ),
         )
 
+    def test_invalid_extract_mode(self):
+        """Test invalid extract mode raises exception."""
+        with self.assertRaises(ReleaseUnpackerError) as cm:
+            ReleaseUnpacker(
+                self.search_dir,
+                self.tmp_dir,
+                self.unpack_dir,
+                extract_mode="invalid",
+            )
+
+        self.assertEqual(str(cm.exception), "Invalid extract mode invalid")
+
+    def test_invalid_buffer_size(self):
+        """Test invalid buffer size raises exception."""
+        with self.assertRaises(ReleaseUnpackerError) as cm:
+            ReleaseUnpacker(
+                self.search_dir, self.tmp_dir, self.unpack_dir, buffer_size=0
+            )
+
+        self.assertEqual(
+            str(cm.exception), "Buffer size must be 1 or more, got 0"
+        )
+
+    def test_direct_extract(self):
+        """Test extract route is picked from extract mode and devices."""
+        for extract_mode, direct_extract in (("direct", True), ("tmp", False)):
+            release_unpacker = ReleaseUnpacker(
+                self.search_dir,
+                self.tmp_dir,
+                self.unpack_dir,
+                extract_mode=extract_mode,
+            )
+            self.assertEqual(release_unpacker.direct_extract, direct_extract)
+
+        # tmp_dir and unpack_dir on the same device
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir
+        )
+        self.assertFalse(release_unpacker.direct_extract)
+
+        # tmp_dir and unpack_dir on different devices
+        stat_results = {
+            self.tmp_dir: mock.Mock(st_dev=1),
+            self.unpack_dir: mock.Mock(st_dev=2),
+        }
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir
+        )
+        with mock.patch(
+            "releaseunpacker.releaseunpacker.os.stat",
+            side_effect=lambda path: stat_results[path],
+        ):
+            self.assertTrue(release_unpacker.direct_extract)
+
     def test_release_search_dir_does_not_exist(self):
         """Test non existing search dir raises exception."""
         search_dir = Path("/non_existing_release_search_dir")
@@ -180,6 +253,41 @@ class TestReleaseUnpacker(ReleaseUnpackerTestCase, unittest.TestCase):
             ],
         )
 
+    def test_scan_releases(self):
+        """Test RAR files are grouped by release dir."""
+        for release in ("Release-Group", "Release.with.subs-Group"):
+            self.copy_test_directory_to_search_dir(release)
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir
+        )
+
+        self.assertEqual(
+            release_unpacker.scan_releases(),
+            [
+                {
+                    "dir": Path(self.search_dir, "Release-Group"),
+                    "rar_files": [
+                        Path(self.search_dir, "Release-Group/rar_file.rar")
+                    ],
+                },
+                {
+                    "dir": Path(self.search_dir, "Release.with.subs-Group"),
+                    "rar_files": [
+                        Path(
+                            self.search_dir,
+                            "Release.with.subs-Group/"
+                            "release.with.subs-group.rar",
+                        ),
+                        Path(
+                            self.search_dir,
+                            "Release.with.subs-Group/Subs/subs.rar",
+                        ),
+                    ],
+                },
+            ],
+        )
+
     def test_unpack_release_dir_rars_no_rars_found(self):
         """Test unpack release dir without RAR files."""
         release_unpacker = ReleaseUnpacker(
@@ -223,6 +331,100 @@ class TestReleaseUnpacker(ReleaseUnpackerTestCase, unittest.TestCase):
             Path(self.search_dir, "Release.with.subs-Group").exists()
         )
 
+    def test_unpack_store_release(self):
+        """Test unpack of a store mode multi volume release."""
+        movie = os.urandom(100000)
+        self.write_release_rar(
+            "Store-Group",
+            [("movie.mkv", movie), ("store-group.nfo", b"nfo")],
+            volume_size=30000,
+        )
+
+        for extract_mode in ("tmp", "direct"):
+            release_unpacker = ReleaseUnpacker(
+                self.search_dir,
+                self.tmp_dir,
+                self.unpack_dir,
+                no_remove=True,
+                extract_mode=extract_mode,
+            )
+            release_unpacker.unpack_release_dir_rars()
+
+            self.assertEqual(
+                Path(self.unpack_dir).listdir(),
+                [Path(self.unpack_dir, "Store-Group.mkv")],
+            )
+            with open(Path(self.unpack_dir, "Store-Group.mkv"), "rb") as fp:
+                self.assertEqual(fp.read(), movie)
+
+            # Nothing left behind in tmp dir
+            self.assertEqual(Path(self.tmp_dir).listdir(), [])
+
+            Path(self.unpack_dir, "Store-Group.mkv").remove()
+
+    def test_unpack_incomplete_release_deferred(self):
+        """Test release with incomplete volume set is not unpacked."""
+        volume_paths = self.write_release_rar(
+            "Store-Group",
+            [("movie.mkv", os.urandom(25000))],
+            volume_size=10000,
+        )
+        volume_paths[-1].remove()
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir
+        )
+        with self.assertLogs(self.LOGGER_NAME) as cm:
+            release_unpacker.unpack_release_dir_rars()
+
+        self.assertIn(
+            "INFO:releaseunpacker.releaseunpacker:Deferring {}, volume set "
+            "incomplete: Volume store-group.r01 is missing".format(
+                Path(self.search_dir, "Store-Group")
+            ),
+            cm.output,
+        )
+        self.assertEqual(Path(self.unpack_dir).listdir(), [])
+        self.assertTrue(Path(self.search_dir, "Store-Group").exists())
+
+    def test_unpack_release_dir_rars_keep_going(self):
+        """Test a failing release doesn't stop the others with keep_going."""
+        for release in ("Store-Group", "Other-Group"):
+            self.write_release_rar(release, [("movie.mkv", os.urandom(5000))])
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir
+        )
+        unpack_release = release_unpacker.unpack_release
+
+        def fail_store_group(release):
+            if release["dir"].name == "Store-Group":
+                raise ValueError("Bad RAR")
+            unpack_release(release)
+
+        with mock.patch.object(
+            release_unpacker, "unpack_release", side_effect=fail_store_group
+        ):
+            with self.assertRaises(ValueError):
+                release_unpacker.unpack_release_dir_rars()
+
+            with self.assertLogs(self.LOGGER_NAME) as cm:
+                release_unpacker.unpack_release_dir_rars(keep_going=True)
+
+        self.assertEqual(
+            [
+                (release["dir"], str(e))
+                for release, e in release_unpacker.failed
+            ],
+            [(Path(self.search_dir, "Store-Group"), "Bad RAR")],
+        )
+        self.assertIn(
+            "ERROR:releaseunpacker.releaseunpacker:Unpack of {} failed: "
+            "Bad RAR".format(Path(self.search_dir, "Store-Group")),
+            cm.output,
+        )
+        self.assertTrue(Path(self.unpack_dir, "Other-Group.mkv").exists())
+
     def test_unpack_release_with_unpack_time(self):
         """Test unpack of releases with unpack time mocked for logging."""
         self.copy_test_directory_to_search_dir("Release-Group")
@@ -297,7 +499,7 @@ class TestReleaseUnpacker(ReleaseUnpackerTestCase, unittest.TestCase):
         )
         release_unpacker.unpack_release_dir_rars()
 
-        # Validate extract of releases and subs
+        # Validate extract of releases and subs, existing files are verified
         self.assertEqual(
             Path(self.unpack_dir).listdir(),
             [
@@ -307,6 +509,9 @@ class TestReleaseUnpacker(ReleaseUnpackerTestCase, unittest.TestCase):
                 Path(self.unpack_dir, "Release.with.subs-Group.sub"),
             ],
         )
+        self.assertTrue(
+            Path(self.tmp_dir, ".releaseunpacker-verified.json").exists()
+        )
 
         # Make sure the unpacked subs rar file is removed
         self.assertFalse(
@@ -351,6 +556,110 @@ class TestReleaseUnpackerRarFile(ReleaseUnpackerTestCase, unittest.TestCase):
             str(cm.exception), "Invalid RAR file {}".format(rar_file_path)
         )
 
+    def test_stream_file(self):
+        """Test streaming a file from a RAR to a destination path."""
+        movie = os.urandom(100000)
+        volume_paths = self.write_release_rar(
+            "Store-Group", [("movie.mkv", movie)], volume_size=30000
+        )
+        unpack_file_path = Path(self.unpack_dir, "Store-Group.mkv")
+
+        rar_file = ReleaseUnpackerRarFile(volume_paths[0])
+        self.assertEqual(
+            rar_file.stream_file("movie.mkv", unpack_file_path),
+            unpack_file_path,
+        )
+        with open(unpack_file_path, "rb") as fp:
+            self.assertEqual(fp.read(), movie)
+
+    def test_stream_file_error_removes_partial(self):
+        """Test a failing stream doesn't leave a .partial file behind."""
+        volume_paths = self.write_release_rar(
+            "Store-Group", [("movie.mkv", os.urandom(1000))]
+        )
+        unpack_file_path = Path(self.unpack_dir, "Store-Group.mkv")
+
+        rar_file = ReleaseUnpackerRarFile(volume_paths[0])
+
+        # Store copy
+        with mock.patch(
+            "releaseunpacker.storecopy.copy_range",
+            side_effect=OSError("No space left on device"),
+        ):
+            with self.assertRaises(OSError):
+                rar_file.stream_file("movie.mkv", unpack_file_path)
+
+        self.assertEqual(Path(self.unpack_dir).listdir(), [])
+
+        # rarfile
+        with mock.patch.object(
+            rar_file, "stored_file", return_value=None
+        ), mock.patch(
+            "releaseunpacker.releaseunpacker.copy_fileobj",
+            side_effect=OSError("No space left on device"),
+        ):
+            with self.assertRaises(OSError):
+                rar_file.stream_file("movie.mkv", unpack_file_path)
+
+        self.assertEqual(Path(self.unpack_dir).listdir(), [])
+
+    def test_copy_rar_file(self):
+        """Test file written through rarfile is checked."""
+        movie = os.urandom(25000)
+        volume_paths = self.write_release_rar(
+            "Store-Group", [("movie.mkv", movie)], volume_size=10000
+        )
+        dst_path = Path(self.unpack_dir, "movie.mkv")
+
+        rar_file = ReleaseUnpackerRarFile(volume_paths[0], drop_cache=True)
+        self.assertEqual(rar_file.copy_rar_file("movie.mkv", dst_path), 25000)
+        with open(dst_path, "rb") as fp:
+            self.assertEqual(fp.read(), movie)
+
+        # Flip a byte in the last volume
+        with open(volume_paths[2], "r+b") as fp:
+            fp.seek(-100, os.SEEK_END)
+            byte = fp.read(1)
+            fp.seek(-100, os.SEEK_END)
+            fp.write(bytes([byte[0] ^ 0xFF]))
+
+        rar_file = ReleaseUnpackerRarFile(volume_paths[0])
+        with self.assertRaises(rarfile.BadRarFile):
+            rar_file.copy_rar_file("movie.mkv", dst_path)
+
+    def test_stream_file_corrupt(self):
+        """Test a corrupt or short file streamed by rarfile isn't renamed."""
+        volume_paths = self.write_release_rar(
+            "Store-Group",
+            [("movie.mkv", os.urandom(25000))],
+            volume_size=10000,
+        )
+        unpack_file_path = Path(self.unpack_dir, "Store-Group.mkv")
+
+        # Flip a byte in the last volume
+        with open(volume_paths[2], "r+b") as fp:
+            fp.seek(-100, os.SEEK_END)
+            byte = fp.read(1)
+            fp.seek(-100, os.SEEK_END)
+            fp.write(bytes([byte[0] ^ 0xFF]))
+
+        rar_file = ReleaseUnpackerRarFile(volume_paths[0])
+        with mock.patch.object(rar_file, "stored_file", return_value=None):
+            with self.assertRaises(rarfile.BadRarFile):
+                rar_file.stream_file("movie.mkv", unpack_file_path)
+
+        self.assertEqual(Path(self.unpack_dir).listdir(), [])
+
+        # Cut the data short in the last volume
+        truncate(volume_paths[2], volume_paths[2].size() - 1000)
+
+        rar_file = ReleaseUnpackerRarFile(volume_paths[0])
+        with mock.patch.object(rar_file, "stored_file", return_value=None):
+            with self.assertRaises(rarfile.Error):
+                rar_file.stream_file("movie.mkv", unpack_file_path)
+
+        self.assertEqual(Path(self.unpack_dir).listdir(), [])
+
     def test_subs_dir(self):
         """Test RAR in Subs dir detected correctly."""
         for release in ("Release-Group", "Release.with.subs-Group"):
@@ -0,0 +1,216 @@
+"""Test ReleaseRemover."""
+import json
+import os
+import unittest
+from unittest import mock
+
+from unipath import Path
+
+from releaseunpacker.releaseunpacker import ReleaseUnpacker
+from releaseunpacker.remover import ReleaseRemover, ReleaseRemoverError
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+
+
+class TestReleaseRemover(ReleaseUnpackerTestCase, unittest.TestCase):
+    """ReleaseRemover test case."""
+
+    def setUp(self):
+        """Test setup."""
+        super().setUp()
+        self.trash_dir = Path(self.tmp_dir, "trash")
+        self.trash_dir.mkdir()
+        self.queue_file = Path(self.tmp_dir, "remove.json")
+
+    def write_release_dir(self, release):
+        """Write a release dir with Subs and a symlink and return it."""
+        release_dir = Path(self.search_dir, release)
+        Path(release_dir, "Subs").mkdir(parents=True)
+        for name in ("release.rar", "release.r00", "Subs/subs.rar"):
+            with open(Path(release_dir, name), "wb") as fp:
+                fp.write(os.urandom(1000))
+        os.symlink(self.unpack_dir, Path(release_dir, "link"))
+
+        return release_dir
+
+    def test_repr(self):
+        """Test object string representation."""
+        remover = ReleaseRemover(3, trash_dir=self.trash_dir)
+        self.assertEqual(
+            remover.__repr__(),
+            "<ReleaseRemover: 3 jobs ({})>".format(self.trash_dir),
+        )
+        remover.close()
+
+    def test_invalid_arguments(self):
+        """Test invalid jobs, rate and trash dir raise exception."""
+        for kwargs in (
+            {"jobs": 0},
+            {"rate": 0},
+            {"trash_dir": Path(self.tmp_dir, "missing")},
+        ):
+            with self.assertRaises(ReleaseRemoverError):
+                ReleaseRemover(**kwargs)
+
+    def test_remove(self):
+        """Test release dir is removed in place."""
+        release_dir = self.write_release_dir("Release-Group")
+
+        remover = ReleaseRemover()
+        remover.remove(release_dir)
+        remover.close()
+
+        self.assertFalse(release_dir.exists())
+        self.assertEqual(remover.queued, set())
+
+        # Symlinked dirs aren't followed
+        self.assertTrue(Path(self.unpack_dir).exists())
+
+    def test_remove_trash_dir(self):
+        """Test release dir is moved to trash before it's removed."""
+        release_dir = self.write_release_dir("Release-Group")
+
+        remover = ReleaseRemover(
+            trash_dir=self.trash_dir, queue_file=self.queue_file
+        )
+        with mock.patch.object(remover.executor, "submit"):
+            remover.remove(release_dir)
+
+        self.assertFalse(release_dir.exists())
+        (trash_path,) = self.trash_dir.listdir()
+        self.assertTrue(trash_path.name.startswith("Release-Group."))
+        with open(self.queue_file) as fp:
+            self.assertEqual(json.load(fp), [trash_path])
+        remover.close()
+
+    def test_resume(self):
+        """Test dirs left in queue file and trash dir are removed."""
+        release_dir = self.write_release_dir("Release-Group")
+        trash_path = self.write_release_dir("Trash-Group")
+        trash_path.rename(Path(self.trash_dir, "Trash-Group.1"))
+        with open(self.queue_file, "w") as fp:
+            json.dump([release_dir, Path(self.search_dir, "Gone-Group")], fp)
+
+        remover = ReleaseRemover(
+            trash_dir=self.trash_dir, queue_file=self.queue_file
+        )
+        remover.resume()
+        remover.close()
+
+        self.assertFalse(release_dir.exists())
+        self.assertEqual(self.trash_dir.listdir(), [])
+        with open(self.queue_file) as fp:
+            self.assertEqual(json.load(fp), [])
+
+    def test_stop(self):
+        """Test stopped removals stay in queue file."""
+        release_dir = self.write_release_dir("Release-Group")
+
+        remover = ReleaseRemover(queue_file=self.queue_file)
+        remover.stopping.set()
+        remover.remove(release_dir)
+        remover.stop()
+
+        self.assertTrue(release_dir.exists())
+        with open(self.queue_file) as fp:
+            self.assertEqual(json.load(fp), [release_dir])
+
+    def test_shutdown(self):
+        """Test exit only waits for removals nothing would resume."""
+        release_dir = self.write_release_dir("Release-Group")
+
+        remover = ReleaseRemover(queue_file=self.queue_file)
+        with mock.patch.object(remover, "close") as close:
+            remover.stopping.set()
+            remover.remove(release_dir)
+            with self.assertLogs("releaseunpacker.remover", "INFO") as cm:
+                remover.shutdown()
+
+        close.assert_not_called()
+        self.assertEqual(
+            cm.output,
+            [
+                "INFO:releaseunpacker.remover:1 removal(s) left for the next "
+                "run"
+            ],
+        )
+        with open(self.queue_file) as fp:
+            self.assertEqual(json.load(fp), [release_dir])
+
+        remover = ReleaseRemover()
+        remover.remove(release_dir)
+        remover.shutdown()
+
+        self.assertFalse(release_dir.exists())
+
+    def test_rate(self):
+        """Test unlinks are spaced by the bytes removed."""
+        release_dir = self.write_release_dir("Release-Group")
+
+        remover = ReleaseRemover(rate=10000)
+        with mock.patch(
+            "releaseunpacker.remover.time.monotonic", return_value=100
+        ), mock.patch.object(remover.stopping, "wait") as wait:
+            remover.remove(release_dir)
+            remover.close()
+
+        self.assertEqual(
+            [round(call.args[0], 6) for call in wait.call_args_list],
+            [0.1, 0.2],
+        )
+
+    def test_unpack_release_dir_rars(self):
+        """Test release dirs are removed in the background."""
+        self.write_release_rar("Store-Group", [("movie.mkv", b"movie")])
+
+        remover = ReleaseRemover(trash_dir=self.trash_dir)
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir, remover=remover
+        )
+        release_unpacker.unpack_release_dir_rars()
+        self.assertFalse(Path(self.search_dir, "Store-Group").exists())
+        remover.close()
+
+        self.assertEqual(
+            Path(self.unpack_dir).listdir(),
+            [Path(self.unpack_dir, "Store-Group.mkv")],
+        )
+        self.assertEqual(self.trash_dir.listdir(), [])
+
+    def test_remove_release_dirs_subs(self):
+        """Test Subs dir is left to the release dir removal."""
+        release_dir = self.write_release_dir("Release-Group")
+
+        remover = ReleaseRemover()
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir, remover=remover
+        )
+        with mock.patch.object(remover, "submit") as submit:
+            release_unpacker.remove_release_dirs(
+                [
+                    Path(release_dir, "release.rar"),
+                    Path(release_dir, "Subs", "subs.rar"),
+                ]
+            )
+
+        submit.assert_called_once_with(release_dir)
+        remover.close()
+
+    def test_unpack_release_pending(self):
+        """Test releases pending removal aren't unpacked again."""
+        self.write_release_rar("Store-Group", [("movie.mkv", b"movie")])
+
+        remover = ReleaseRemover()
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir, remover=remover
+        )
+        release = {
+            "dir": Path(self.search_dir, "Store-Group"),
+            "rar_files": [
+                Path(self.search_dir, "Store-Group", "store-group.rar")
+            ],
+        }
+        remover.queued.add(str(release["dir"]))
+
+        self.assertFalse(release_unpacker.unpack_release(release))
+        self.assertEqual(Path(self.unpack_dir).listdir(), [])
+        remover.close()
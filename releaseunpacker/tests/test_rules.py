@@ -0,0 +1,166 @@
+"""Test Rules."""
+import json
+import os
+import unittest
+
+from unipath import Path
+
+from releaseunpacker.releaseunpacker import ReleaseUnpacker
+from releaseunpacker.rules import Rules, RulesError
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+
+
+def rarfile_files(*names):
+    """Return file list entries for names."""
+    return [{"name": Path(name), "size": 1} for name in names]
+
+
+class TestRules(ReleaseUnpackerTestCase, unittest.TestCase):
+    """Rules test case."""
+
+    def apply(self, rules, *names, section="files"):
+        """Return unpack names of names in release Release-Group."""
+        return [
+            unpack_name
+            for unpack_name, _ in rules.apply(
+                section, "Release-Group", rarfile_files(*names)
+            )
+        ]
+
+    def test_repr(self):
+        """Test object string representation."""
+        self.assertEqual(Rules().__repr__(), "<Rules: 5 files, 1 subs>")
+
+    def test_invalid_rules(self):
+        """Test invalid rules raise exception."""
+        for rules in (
+            [],
+            {"other": []},
+            {"files": {}},
+            {"files": ["*.mkv"]},
+            {"files": [{"name": "{release}"}]},
+            {"files": [{"match": "*.mkv", "regex": ".*"}]},
+            {"files": [{"match": "*.mkv", "action": "move"}]},
+            {"files": [{"regex": "("}]},
+            {"files": [{"match": "*.mkv", "name": "{disc}{ext}"}]},
+            {"files": [{"match": "*.mkv", "name": "{release"}]},
+        ):
+            with self.assertRaises(RulesError):
+                Rules(rules)
+
+    def test_default_rules(self):
+        """Test default rules unpack the whitelisted extensions."""
+        self.assertEqual(
+            self.apply(Rules(), "movie.mkv", "release.nfo", "movie.MKV"),
+            ["Release-Group.mkv"],
+        )
+        self.assertEqual(
+            self.apply(Rules(), "subs.idx", "subs.sub", section="subs"),
+            ["Release-Group.idx", "Release-Group.sub"],
+        )
+
+    def test_rules(self):
+        """Test first matching rule picks action and name."""
+        rules = Rules(
+            {
+                "files": [
+                    {"match": "*sample*", "action": "skip"},
+                    {
+                        "regex": r"(?i).*\bcd(?P<disc>\d+)\.avi",
+                        "name": "{release}.CD{disc}{ext}",
+                    },
+                    {"match": "*.m2ts"},
+                    {"match": "*.nfo", "name": "{release}.{name}{ext}"},
+                ]
+            }
+        )
+
+        self.assertEqual(
+            self.apply(
+                rules,
+                "release-cd1.avi",
+                "release-cd2.avi",
+                "sample.m2ts",
+                "movie.m2ts",
+                "release.nfo",
+                "movie.mkv",
+            ),
+            [
+                "Release-Group.CD1.avi",
+                "Release-Group.CD2.avi",
+                "Release-Group.m2ts",
+                "Release-Group.release.nfo",
+            ],
+        )
+
+    def test_name_collision(self):
+        """Test files with the same unpack name get unique names."""
+        self.assertEqual(
+            self.apply(Rules(), "movie.mkv", "sample.mkv", "dir/sample.mkv"),
+            [
+                "Release-Group.mkv",
+                "Release-Group.sample.mkv",
+                "Release-Group.sample.2.mkv",
+            ],
+        )
+
+    def test_name_not_file_name(self):
+        """Test names with a path raise exception."""
+        rules = Rules(
+            {"files": [{"regex": "(?P<dir>.*)/.*", "name": "{dir}"}]}
+        )
+
+        with self.assertRaises(RulesError):
+            self.apply(rules, "a/b/movie.mkv")
+
+    def test_load(self):
+        """Test rules are read from JSON file."""
+        rules_file = Path(self.tmp_dir, "rules.json")
+        with open(rules_file, "w") as fp:
+            json.dump({"files": [{"match": "*.flac"}]}, fp)
+
+        self.assertEqual(
+            self.apply(Rules.load(rules_file), "track.flac", "movie.mkv"),
+            ["Release-Group.flac"],
+        )
+
+        with open(rules_file, "w") as fp:
+            fp.write("{")
+        with self.assertRaises(RulesError):
+            Rules.load(rules_file)
+        with self.assertRaises(RulesError):
+            Rules.load(Path(self.tmp_dir, "missing.json"))
+
+    def test_unpack_release_dir_rars(self):
+        """Test releases are unpacked with the rules."""
+        episodes = {
+            "show.s01e01.mkv": os.urandom(1000),
+            "show.s01e02.mkv": os.urandom(1000),
+        }
+        self.write_release_rar(
+            "Show.S01-Group",
+            list(episodes.items()) + [("show.nfo", b"nfo")],
+        )
+        rules = Rules(
+            {
+                "files": [
+                    {
+                        "regex": r".*\.(?P<episode>s\d+e\d+)\.mkv",
+                        "name": "{release}.{episode}{ext}",
+                    }
+                ]
+            }
+        )
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir, rules=rules
+        )
+        release_unpacker.unpack_release_dir_rars()
+
+        for unpack_name, file_name in (
+            ("Show.S01-Group.s01e01.mkv", "show.s01e01.mkv"),
+            ("Show.S01-Group.s01e02.mkv", "show.s01e02.mkv"),
+        ):
+            with open(Path(self.unpack_dir, unpack_name), "rb") as fp:
+                self.assertEqual(fp.read(), episodes[file_name])
+        self.assertEqual(len(Path(self.unpack_dir).listdir()), 2)
@@ -0,0 +1,102 @@
+"""Test ScanIndex."""
+import unittest
+from unittest import mock
+
+from unipath import Path
+
+from releaseunpacker.discovery import list_dir
+from releaseunpacker.releaseunpacker import ReleaseUnpacker
+from releaseunpacker.scanindex import ScanIndex, ScanIndexError
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+
+
+@mock.patch("releaseunpacker.scanindex.RACY_MTIME_NS", 0)
+class TestScanIndex(ReleaseUnpackerTestCase, unittest.TestCase):
+    """ScanIndex test case."""
+
+    def setUp(self):
+        """Test setup."""
+        super().setUp()
+        self.index_file = Path(self.tmp_dir, "scan_index.db")
+        self.scan_index = ScanIndex(self.index_file)
+
+    def tearDown(self):
+        """Test cleanup."""
+        self.scan_index.close()
+        super().tearDown()
+
+    def test_repr(self):
+        """Test object string representation."""
+        self.assertEqual(
+            self.scan_index.__repr__(),
+            "<ScanIndex: {}>".format(self.index_file),
+        )
+
+    def test_invalid_index_file(self):
+        """Test index file that can't be opened raises exception."""
+        with self.assertRaises(ScanIndexError):
+            ScanIndex(Path(self.tmp_dir, "missing", "scan_index.db"))
+
+    def test_scan_same_as_scan_rars(self):
+        """Test index scan returns the same RAR files as scan_rars."""
+        for release in ("Release-Group", "Release.with.subs-Group"):
+            self.copy_test_directory_to_search_dir(release)
+        self.copy_test_file_to_search_dir("file_not_a_dir")
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir
+        )
+        rar_files = release_unpacker.scan_rars()
+
+        release_unpacker.scan_index = self.scan_index
+        self.assertEqual(release_unpacker.scan_rars(), rar_files)
+        self.assertEqual(release_unpacker.scan_rars(), rar_files)
+
+    def test_scan_only_lists_changed_dirs(self):
+        """Test unchanged dirs are not listed again."""
+        for release in ("Release-Group", "Release.with.subs-Group"):
+            self.copy_test_directory_to_search_dir(release)
+
+        with mock.patch(
+            "releaseunpacker.scanindex.list_dir", wraps=list_dir
+        ) as listing:
+            self.scan_index.scan(self.search_dir)
+            self.assertEqual(listing.call_count, 4)
+
+            listing.reset_mock()
+            self.scan_index.scan(self.search_dir)
+            self.assertEqual(listing.call_count, 0)
+
+            # New release only lists search dir and the new release dir
+            self.write_release_rar("New-Group", [("movie.mkv", b"movie")])
+            listing.reset_mock()
+            rar_files = self.scan_index.scan(self.search_dir)
+            self.assertEqual(listing.call_count, 2)
+
+        self.assertIn(
+            Path(self.search_dir, "New-Group", "new-group.rar"), rar_files
+        )
+
+    def test_scan_prunes_removed_dirs(self):
+        """Test removed dirs are removed from index."""
+        self.copy_test_directory_to_search_dir("Release.with.subs-Group")
+        self.scan_index.scan(self.search_dir)
+
+        Path(self.search_dir, "Release.with.subs-Group").rmtree()
+        self.assertEqual(self.scan_index.scan(self.search_dir), [])
+        self.assertEqual(
+            self.scan_index.db.execute("SELECT path FROM dirs").fetchall(),
+            [(self.search_dir,)],
+        )
+
+    def test_rebuild(self):
+        """Test rebuild empties index."""
+        self.copy_test_directory_to_search_dir("Release-Group")
+        self.scan_index.scan(self.search_dir)
+        self.scan_index.close()
+
+        self.scan_index = ScanIndex(self.index_file, rebuild=True)
+        self.assertEqual(
+            self.scan_index.db.execute("SELECT path FROM dirs").fetchall(),
+            [],
+        )
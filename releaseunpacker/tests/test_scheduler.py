@@ -0,0 +1,199 @@
+"""Test ReleaseScheduler."""
+import threading
+import time
+import unittest
+from unittest import mock
+
+from unipath import Path
+
+from releaseunpacker.releaseunpacker import ReleaseUnpacker
+from releaseunpacker.scheduler import ReleaseScheduler, ReleaseSchedulerError
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+
+
+class TestReleaseScheduler(ReleaseUnpackerTestCase, unittest.TestCase):
+    """ReleaseScheduler test case."""
+
+    def test_repr(self):
+        """Test object string representation."""
+        self.assertEqual(
+            ReleaseScheduler(4, 2).__repr__(),
+            "<ReleaseScheduler: 4 jobs (2 per device)>",
+        )
+
+    def test_invalid_jobs(self):
+        """Test invalid number of jobs raises exception."""
+        with self.assertRaises(ReleaseSchedulerError) as cm:
+            ReleaseScheduler(0)
+
+        self.assertEqual(str(cm.exception), "Jobs must be 1 or more, got 0")
+
+        with self.assertRaises(ReleaseSchedulerError) as cm:
+            ReleaseScheduler(2, 0)
+
+        self.assertEqual(
+            str(cm.exception), "Device jobs must be 1 or more, got 0"
+        )
+
+        with self.assertRaises(ReleaseSchedulerError) as cm:
+            ReleaseScheduler(2, 1, 0)
+
+        self.assertEqual(
+            str(cm.exception), "Output jobs must be 1 or more, got 0"
+        )
+
+    def test_scan_jobs(self):
+        """Test a job is created for each release."""
+        for release in ("Release-Group", "Release.with.subs-Group"):
+            self.copy_test_directory_to_search_dir(release)
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir
+        )
+        jobs = ReleaseScheduler(2).scan_jobs([release_unpacker])
+
+        self.assertEqual(
+            [job["release"]["dir"] for job in jobs],
+            [
+                Path(self.search_dir, "Release-Group"),
+                Path(self.search_dir, "Release.with.subs-Group"),
+            ],
+        )
+        self.assertEqual(
+            jobs[1]["release"]["rar_files"],
+            [
+                Path(
+                    self.search_dir,
+                    "Release.with.subs-Group/release.with.subs-group.rar",
+                ),
+                Path(self.search_dir, "Release.with.subs-Group/Subs/subs.rar"),
+            ],
+        )
+
+    def test_scan_jobs_release_gone(self):
+        """Test releases whose dir is gone are skipped."""
+        for release in ("Release-Group", "Release.with.subs-Group"):
+            self.copy_test_directory_to_search_dir(release)
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir
+        )
+        scan_releases = release_unpacker.scan_releases
+
+        def scan_and_remove():
+            releases = scan_releases()
+            Path(self.search_dir, "Release-Group").rmtree()
+            return releases
+
+        with mock.patch.object(
+            release_unpacker, "scan_releases", side_effect=scan_and_remove
+        ):
+            jobs = ReleaseScheduler(2).scan_jobs([release_unpacker])
+
+        self.assertEqual(
+            [job["release"]["dir"] for job in jobs],
+            [Path(self.search_dir, "Release.with.subs-Group")],
+        )
+
+    def test_run_error_isolation(self):
+        """Test a failing release doesn't stop the other releases."""
+        for release in ("Release-Group", "Release.with.subs-Group"):
+            self.copy_test_directory_to_search_dir(release)
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir
+        )
+        unpacked = []
+
+        def unpack_release(release):
+            if release["dir"].name == "Release-Group":
+                raise ValueError("Bad RAR")
+            unpacked.append(release["dir"].name)
+
+        release_scheduler = ReleaseScheduler(2, 2)
+        with mock.patch.object(
+            release_unpacker, "unpack_release", side_effect=unpack_release
+        ):
+            with self.assertLogs("releaseunpacker.scheduler") as cm:
+                self.assertFalse(release_scheduler.run([release_unpacker]))
+
+        self.assertEqual(unpacked, ["Release.with.subs-Group"])
+        self.assertEqual(len(release_scheduler.failed), 1)
+        self.assertEqual(
+            release_scheduler.failed[0][0]["dir"],
+            Path(self.search_dir, "Release-Group"),
+        )
+        self.assertIn(
+            "ERROR:releaseunpacker.scheduler:Unpack of {} failed: "
+            "Bad RAR".format(Path(self.search_dir, "Release-Group")),
+            cm.output,
+        )
+
+    def test_run_device_limit(self):
+        """Test releases on the same device are not unpacked in parallel."""
+        for release in ("Release-Group", "Release.with.subs-Group"):
+            self.copy_test_directory_to_search_dir(release)
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir
+        )
+        lock = threading.Lock()
+        active = []
+        max_active = []
+
+        def unpack_release(release):
+            with lock:
+                active.append(release)
+                max_active.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.remove(release)
+
+        with mock.patch.object(
+            release_unpacker, "unpack_release", side_effect=unpack_release
+        ):
+            self.assertTrue(ReleaseScheduler(4, 1).run([release_unpacker]))
+            self.assertEqual(max(max_active), 1)
+
+            max_active.clear()
+            self.assertTrue(ReleaseScheduler(4, 2).run([release_unpacker]))
+            self.assertEqual(max(max_active), 2)
+
+    def test_run_shared_tmp_and_unpack_dir(self):
+        """Test releases on other devices overlap with shared output dirs."""
+        for release in ("Release-Group", "Release.with.subs-Group"):
+            self.copy_test_directory_to_search_dir(release)
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir
+        )
+        release_devices = {"Release-Group": 1, "Release.with.subs-Group": 2}
+        lock = threading.Lock()
+        active = []
+        max_active = []
+
+        def stat(path):
+            return mock.Mock(st_dev=release_devices.get(Path(path).name, 3))
+
+        def unpack_release(release):
+            with lock:
+                active.append(release)
+                max_active.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.remove(release)
+
+        with mock.patch(
+            "releaseunpacker.scheduler.os.stat", side_effect=stat
+        ), mock.patch.object(
+            release_unpacker, "unpack_release", side_effect=unpack_release
+        ):
+            self.assertTrue(ReleaseScheduler(2).run([release_unpacker]))
+            self.assertEqual(max(max_active), 2)
+
+            # Both write to the same tmp and unpack dir device
+            max_active.clear()
+            self.assertTrue(
+                ReleaseScheduler(2, output_jobs=1).run([release_unpacker])
+            )
+            self.assertEqual(max(max_active), 1)
@@ -0,0 +1,148 @@
+"""Test UnpackService."""
+import os
+import unittest
+
+from unipath import Path
+
+from releaseunpacker.releaseunpacker import ReleaseUnpackerError
+from releaseunpacker.service import UnpackService, UnpackServiceError
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+
+
+class TestUnpackService(ReleaseUnpackerTestCase, unittest.TestCase):
+    """UnpackService test case."""
+
+    def setUp(self):
+        """Test setup."""
+        super().setUp()
+        self.progress = []
+
+    def record_progress(self, release_dir, done, total):
+        """Record progress calls."""
+        self.progress.append((release_dir, done, total))
+
+    def test_repr(self):
+        """Test object string representation."""
+        with UnpackService(self.tmp_dir, self.unpack_dir, jobs=3) as service:
+            self.assertEqual(
+                service.__repr__(),
+                "<UnpackService: 3 jobs ({}) ({})>".format(
+                    self.tmp_dir, self.unpack_dir
+                ),
+            )
+
+    def test_invalid_arguments(self):
+        """Test invalid jobs and dirs raise exception."""
+        for args, kwargs in (
+            ((self.tmp_dir, self.unpack_dir), {"jobs": 0}),
+            ((Path(self.tmp_dir, "missing"), self.unpack_dir), {}),
+            ((self.tmp_dir, Path(self.unpack_dir, "missing")), {}),
+        ):
+            with self.assertRaises(UnpackServiceError):
+                UnpackService(*args, **kwargs)
+
+    def test_unpack(self):
+        """Test releases are unpacked with progress."""
+        movies = {}
+        for release in ("Store1-Group", "Store2-Group"):
+            movies[release] = os.urandom(25000)
+            self.write_release_rar(
+                release,
+                [("movie.mkv", movies[release]), ("store.nfo", b"nfo")],
+                volume_size=10000,
+            )
+
+        with UnpackService(self.tmp_dir, self.unpack_dir) as service:
+            futures = service.unpack(
+                [Path(self.search_dir, release) for release in movies],
+                progress=self.record_progress,
+            )
+            self.assertEqual(
+                [future.result(timeout=10) for future in futures],
+                [True, True],
+            )
+
+        for release, movie in movies.items():
+            with open(Path(self.unpack_dir, release + ".mkv"), "rb") as fp:
+                self.assertEqual(fp.read(), movie)
+
+            release_progress = [
+                (done, total)
+                for release_dir, done, total in self.progress
+                if release_dir == Path(self.search_dir, release)
+            ]
+            self.assertEqual(release_progress[0], (0, 25000))
+            self.assertEqual(release_progress[-1], (25000, 25000))
+
+    def test_unpack_existing_file_progress(self):
+        """Test files already unpacked count as done."""
+        movie = os.urandom(25000)
+        self.write_release_rar("Store-Group", [("movie.mkv", movie)])
+        with open(Path(self.unpack_dir, "Store-Group.mkv"), "wb") as fp:
+            fp.write(movie)
+
+        with UnpackService(self.tmp_dir, self.unpack_dir) as service:
+            future = service.submit(
+                Path(self.search_dir, "Store-Group"),
+                progress=self.record_progress,
+            )
+            self.assertTrue(future.result(timeout=10))
+
+        self.assertEqual(
+            [(done, total) for _, done, total in self.progress],
+            [(0, 25000), (25000, 25000)],
+        )
+
+    def test_unpack_no_rars(self):
+        """Test result is False without RARs."""
+        with UnpackService(self.tmp_dir, self.unpack_dir) as service:
+            future = service.submit(self.search_dir)
+
+            self.assertFalse(future.result(timeout=10))
+
+    def test_unpack_error(self):
+        """Test failed unpack sets exception."""
+        with UnpackService(self.tmp_dir, self.unpack_dir) as service:
+            future = service.submit(Path(self.search_dir, "missing"))
+
+            self.assertIsInstance(
+                future.exception(timeout=10), ReleaseUnpackerError
+            )
+
+    def test_cancel(self):
+        """Test cancelled unpack stops and leaves nothing behind."""
+        self.write_release_rar(
+            "Store-Group",
+            [("movie.mkv", os.urandom(25000))],
+            volume_size=10000,
+        )
+
+        service = UnpackService(self.tmp_dir, self.unpack_dir)
+
+        def cancel_progress(release_dir, done, total):
+            self.record_progress(release_dir, done, total)
+            if done:
+                for future in list(service.futures):
+                    future.cancel()
+
+        future = service.submit(
+            Path(self.search_dir, "Store-Group"), progress=cancel_progress
+        )
+        service.close()
+
+        self.assertTrue(future.cancelled())
+        self.assertEqual([done for _, done, _ in self.progress], [0, 10000])
+        self.assertEqual(Path(self.unpack_dir).listdir(), [])
+        self.assertEqual(Path(self.tmp_dir).listdir(), [])
+        self.assertTrue(Path(self.search_dir, "Store-Group").exists())
+
+    def test_close_cancel(self):
+        """Test close with cancel cancels queued releases."""
+        self.write_release_rar("Store-Group", [("movie.mkv", b"movie")])
+
+        service = UnpackService(self.tmp_dir, self.unpack_dir, jobs=1)
+        futures = service.unpack([self.search_dir] * 3)
+        service.close(cancel=True)
+
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertTrue(futures[-1].cancelled())
@@ -0,0 +1,175 @@
+"""Test startup imports."""
+import os
+import subprocess
+import sys
+import unittest
+
+from unipath import Path
+
+import releaseunpacker
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+
+ROOT_DIR = Path(__file__).absolute().ancestor(3)
+BIN = Path(ROOT_DIR, "bin", "releaseunpacker")
+
+# Modules a cron run with nothing to unpack must not import
+EXTRACTION_MODULES = (
+    "ago",
+    "lazy",
+    "py7zr",
+    "rarfile",
+    "releaseunpacker.releaseunpacker",
+    "tendo",
+)
+
+
+def import_times(*args):
+    """Run python -X importtime with args.
+
+    Return (returncode, {module: cumulative microseconds}).
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime"] + list(args),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=dict(os.environ, PYTHONPATH=ROOT_DIR),
+        universal_newlines=True,
+    )
+
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+
+        _, cumulative, module = line[len("import time:") :].split("|")
+        if cumulative.strip().isdigit():
+            times[module.strip()] = int(cumulative)
+
+    return process.returncode, times
+
+
+class TestStartup(ReleaseUnpackerTestCase, unittest.TestCase):
+    """Startup test case."""
+
+    def assertNotImported(self, times):
+        """Assert none of the extraction modules were imported."""
+        self.assertEqual(
+            [
+                module
+                for module in times
+                if module.split(".")[0] in EXTRACTION_MODULES
+                or module in EXTRACTION_MODULES
+            ],
+            [],
+        )
+
+    def run_bin(self, *args):
+        """Run the releaseunpacker command, return import times."""
+        return import_times(
+            BIN, "-t", self.tmp_dir, "-u", self.unpack_dir, *args
+        )
+
+    def test_import_package(self):
+        """Test importing the package doesn't load the extraction stack."""
+        returncode, times = import_times("-c", "import releaseunpacker")
+
+        self.assertEqual(returncode, 0)
+        self.assertIn("releaseunpacker", times)
+        self.assertNotImported(times)
+
+    def test_lazy_names(self):
+        """Test public names are imported on first use."""
+        from releaseunpacker.rules import Rules
+
+        self.assertIs(releaseunpacker.Rules, Rules)
+        self.assertIn("ReleaseUnpacker", dir(releaseunpacker))
+        with self.assertRaises(AttributeError):
+            getattr(releaseunpacker, "Missing")
+
+    def test_nothing_to_do(self):
+        """Test a run without RARs quits before the extraction stack."""
+        Path(self.search_dir, "Empty-Group").mkdir()
+
+        returncode, times = self.run_bin(self.search_dir)
+
+        self.assertEqual(returncode, 0)
+        self.assertIn("releaseunpacker.discovery", times)
+        self.assertNotImported(times)
+
+    def test_nothing_to_do_missing_dirs(self):
+        """Test missing tmp and unpack dirs fail a run with nothing to do."""
+        Path(self.search_dir, "Empty-Group").mkdir()
+        missing_dir = Path(self.search_dir, "missing")
+
+        for args in (
+            ("-t", missing_dir, "-u", self.unpack_dir),
+            ("-t", self.tmp_dir, "-u", missing_dir),
+        ):
+            process = subprocess.run(
+                [sys.executable, BIN] + list(args) + [self.search_dir],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                env=dict(os.environ, PYTHONPATH=ROOT_DIR),
+                universal_newlines=True,
+            )
+
+            self.assertNotEqual(process.returncode, 0)
+            self.assertIn(
+                "dir {} doesn't exist".format(missing_dir), process.stdout
+            )
+
+    def test_pending_removals(self):
+        """Test a run with removals left isn't nothing to do."""
+        remove_queue = Path(self.tmp_dir, "remove.json")
+        with open(remove_queue, "w") as fp:
+            fp.write('["/missing/Release-Group"]')
+
+        returncode, times = self.run_bin(
+            "--remove-queue", remove_queue, self.search_dir
+        )
+
+        self.assertEqual(returncode, 0)
+        self.assertIn("rarfile", times)
+
+    def test_unpack(self):
+        """Test a run with RARs unpacks them."""
+        self.write_release_rar("Release-Group", [("movie.mkv", b"movie")])
+
+        returncode, times = self.run_bin(self.search_dir)
+
+        self.assertEqual(returncode, 0)
+        self.assertIn("rarfile", times)
+        self.assertEqual(
+            Path(self.unpack_dir).listdir(),
+            [Path(self.unpack_dir, "Release-Group.mkv")],
+        )
+
+    def test_unpack_failed_release(self):
+        """Test a failing release doesn't stop the others."""
+        volume_paths = self.write_release_rar(
+            "Bad-Group", [("movie.mkv", os.urandom(5000))]
+        )
+        with open(volume_paths[0], "r+b") as fp:
+            fp.seek(-100, os.SEEK_END)
+            byte = fp.read(1)
+            fp.seek(-100, os.SEEK_END)
+            fp.write(bytes([byte[0] ^ 0xFF]))
+
+        self.write_release_rar("Release-Group", [("movie.mkv", b"movie")])
+
+        process = subprocess.run(
+            [sys.executable, BIN, "-t", self.tmp_dir, "-u", self.unpack_dir]
+            + [self.search_dir],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=dict(os.environ, PYTHONPATH=ROOT_DIR),
+            universal_newlines=True,
+        )
+
+        self.assertNotEqual(process.returncode, 0)
+        self.assertIn("1 release(s) failed to unpack", process.stdout)
+        self.assertEqual(
+            Path(self.unpack_dir).listdir(),
+            [Path(self.unpack_dir, "Release-Group.mkv")],
+        )
+        self.assertTrue(Path(self.search_dir, "Bad-Group").exists())
@@ -0,0 +1,261 @@
+"""Test store copy."""
+import errno
+import os
+import unittest
+import zlib
+from unittest import mock
+
+from unipath import Path
+
+from releaseunpacker.releaseunpacker import ReleaseUnpackerRarFile
+from releaseunpacker.storecopy import (
+    StoreCopyError,
+    copy_stored_file,
+    stored_parts,
+)
+from releaseunpacker.tests.rarbuilder import truncate
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+from releaseunpacker.volumes import VolumeSet
+
+
+class TestStoreCopy(ReleaseUnpackerTestCase, unittest.TestCase):
+    """Store copy test case."""
+
+    def write_volumes(self, release, files, **kwargs):
+        """Write release and return parsed volume headers."""
+        volume_paths = self.write_release_rar(release, files, **kwargs)
+
+        return VolumeSet(volume_paths[0]).volumes
+
+    def test_stored_parts(self):
+        """Test parts of a file split over volumes."""
+        movie = os.urandom(25000)
+        for rar5 in (False, True):
+            volumes = self.write_volumes(
+                "Store{}-Group".format(rar5),
+                [("movie.mkv", movie), ("store.nfo", b"nfo")],
+                volume_size=10000,
+                rar5=rar5,
+            )
+            stored = stored_parts(volumes, "movie.mkv")
+
+            self.assertEqual(len(stored["parts"]), 3)
+            self.assertEqual(
+                [size for _, _, size in stored["parts"]], [10000, 10000, 5000]
+            )
+            self.assertEqual(stored["size"], len(movie))
+            self.assertEqual(stored["crc"], zlib.crc32(movie))
+
+    def test_stored_parts_not_copyable(self):
+        """Test None for files that can't be copied byte for byte."""
+        volumes = self.write_volumes(
+            "Store-Group",
+            [("movie.mkv", os.urandom(25000))],
+            volume_size=10000,
+        )
+
+        self.assertIsNone(stored_parts(volumes, "missing.mkv"))
+
+        # Middle volume missing
+        self.assertIsNone(stored_parts(volumes[::2], "movie.mkv"))
+
+        # Last volume missing
+        self.assertIsNone(stored_parts(volumes[:2], "movie.mkv"))
+
+        # Compressed
+        volumes[0]["files"][0]["stored"] = False
+        self.assertIsNone(stored_parts(volumes, "movie.mkv"))
+
+        # No hash to check the copy against
+        volumes[0]["files"][0]["stored"] = True
+        volumes[2]["files"][0]["crc"] = None
+        self.assertIsNone(stored_parts(volumes, "movie.mkv"))
+
+    def test_copy_stored_file(self):
+        """Test copy of a file split over volumes."""
+        movie = os.urandom(25000)
+        for rar5 in (False, True):
+            volumes = self.write_volumes(
+                "Store{}-Group".format(rar5),
+                [("movie.mkv", movie)],
+                volume_size=10000,
+                rar5=rar5,
+            )
+            dst_path = Path(self.unpack_dir, "movie{}.mkv".format(rar5))
+
+            self.assertEqual(
+                copy_stored_file(
+                    stored_parts(volumes, "movie.mkv"),
+                    dst_path,
+                    bytearray(4096),
+                ),
+                len(movie),
+            )
+            with open(dst_path, "rb") as fp:
+                self.assertEqual(fp.read(), movie)
+
+    def test_copy_stored_file_fallback(self):
+        """Test copy through buffer when the kernel can't copy."""
+        movie = os.urandom(25000)
+        volumes = self.write_volumes(
+            "Store-Group", [("movie.mkv", movie)], volume_size=10000
+        )
+        dst_path = Path(self.unpack_dir, "movie.mkv")
+
+        error = OSError(errno.EXDEV, "Invalid cross-device link")
+        with mock.patch(
+            "os.copy_file_range", side_effect=error, create=True
+        ), mock.patch("os.sendfile", side_effect=error):
+            copy_stored_file(
+                stored_parts(volumes, "movie.mkv"), dst_path, bytearray(4096)
+            )
+
+        with open(dst_path, "rb") as fp:
+            self.assertEqual(fp.read(), movie)
+
+    def test_copy_stored_file_preallocate_drop_cache(self):
+        """Test destination is preallocated and pages are dropped."""
+        volumes = self.write_volumes(
+            "Store-Group",
+            [("movie.mkv", os.urandom(25000))],
+            volume_size=10000,
+        )
+        stored = stored_parts(volumes, "movie.mkv")
+
+        with mock.patch(
+            "releaseunpacker.storecopy.preallocate"
+        ) as preallocate, mock.patch(
+            "releaseunpacker.storecopy.fadvise_dontneed"
+        ) as fadvise_dontneed:
+            copy_stored_file(
+                stored,
+                Path(self.unpack_dir, "movie.mkv"),
+                bytearray(4096),
+                drop_cache=True,
+            )
+
+        self.assertEqual(preallocate.call_args.args[1], 25000)
+
+        # Each volume part and the whole destination
+        self.assertEqual(
+            [call.args[1:] for call in fadvise_dontneed.call_args_list],
+            [part[1:] for part in stored["parts"]] + [()],
+        )
+
+    def test_copy_stored_file_crc_mismatch(self):
+        """Test corrupt data raises exception."""
+        volumes = self.write_volumes(
+            "Store-Group",
+            [("movie.mkv", os.urandom(25000))],
+            volume_size=10000,
+        )
+        stored = stored_parts(volumes, "movie.mkv")
+
+        # Flip a byte in the second volume
+        volume_path, offset, _ = stored["parts"][1]
+        with open(volume_path, "r+b") as fp:
+            fp.seek(offset + 100)
+            byte = fp.read(1)
+            fp.seek(offset + 100)
+            fp.write(bytes([byte[0] ^ 0xFF]))
+
+        with self.assertRaises(StoreCopyError) as cm:
+            copy_stored_file(
+                stored, Path(self.unpack_dir, "movie.mkv"), bytearray(4096)
+            )
+
+        self.assertTrue(str(cm.exception).startswith("CRC mismatch for"))
+
+    def test_copy_stored_file_blake2sp(self):
+        """Test RAR5 files with only a BLAKE2sp are checked against it."""
+        movie = os.urandom(25000)
+        volumes = self.write_volumes(
+            "Store-Group",
+            [("movie.mkv", movie)],
+            volume_size=10000,
+            rar5=True,
+            blake2=True,
+        )
+        stored = stored_parts(volumes, "movie.mkv")
+        self.assertIsNone(stored["crc"])
+        self.assertIsNotNone(stored["blake2sp"])
+
+        dst_path = Path(self.unpack_dir, "movie.mkv")
+        copy_stored_file(stored, dst_path, bytearray(4096))
+        with open(dst_path, "rb") as fp:
+            self.assertEqual(fp.read(), movie)
+
+        # Flip a byte in the last volume
+        volume_path, offset, _ = stored["parts"][2]
+        with open(volume_path, "r+b") as fp:
+            fp.seek(offset + 100)
+            byte = fp.read(1)
+            fp.seek(offset + 100)
+            fp.write(bytes([byte[0] ^ 0xFF]))
+
+        with self.assertRaises(StoreCopyError) as cm:
+            copy_stored_file(stored, dst_path, bytearray(4096))
+
+        self.assertTrue(str(cm.exception).startswith("BLAKE2sp mismatch for"))
+
+    def test_stream_file_blake2sp_corrupt(self):
+        """Test a corrupt BLAKE2sp only file is never renamed into place."""
+        volume_paths = self.write_release_rar(
+            "Store-Group",
+            [("movie.mkv", os.urandom(5000))],
+            rar5=True,
+            blake2=True,
+        )
+        with open(volume_paths[0], "r+b") as fp:
+            fp.seek(-100, os.SEEK_END)
+            byte = fp.read(1)
+            fp.seek(-100, os.SEEK_END)
+            fp.write(bytes([byte[0] ^ 0xFF]))
+
+        rar_file = ReleaseUnpackerRarFile(volume_paths[0])
+        with self.assertRaises(StoreCopyError):
+            rar_file.stream_file(
+                "movie.mkv", Path(self.unpack_dir, "Store-Group.mkv")
+            )
+
+        self.assertEqual(Path(self.unpack_dir).listdir(), [])
+
+    def test_copy_stored_file_short_volume(self):
+        """Test a volume shorter than its headers raises exception."""
+        volumes = self.write_volumes(
+            "Store-Group",
+            [("movie.mkv", os.urandom(25000))],
+            volume_size=10000,
+        )
+        stored = stored_parts(volumes, "movie.mkv")
+        volume_path, offset, _ = stored["parts"][2]
+        truncate(volume_path, offset + 1000)
+
+        with self.assertRaises(StoreCopyError) as cm:
+            copy_stored_file(
+                stored, Path(self.unpack_dir, "movie.mkv"), bytearray(4096)
+            )
+
+        self.assertEqual(
+            str(cm.exception),
+            "{} ended at {}, expected {} bytes".format(
+                volume_path, offset + 1000, offset + 5000
+            ),
+        )
+
+    def test_extract_file_store(self):
+        """Test stored files are extracted without rarfile."""
+        movie = os.urandom(25000)
+        volume_paths = self.write_release_rar(
+            "Store-Group", [("movie.mkv", movie)], volume_size=10000
+        )
+
+        rar_file = ReleaseUnpackerRarFile(volume_paths[0])
+        with mock.patch.object(rar_file.rar_file, "extract") as extract:
+            extracted_file_path = rar_file.extract_file(
+                "movie.mkv", self.tmp_dir
+            )
+
+        extract.assert_not_called()
+        with open(extracted_file_path, "rb") as fp:
+            self.assertEqual(fp.read(), movie)
@@ -0,0 +1,207 @@
+"""Test IoThrottle."""
+import io
+import os
+import time
+import unittest
+
+from unipath import Path
+
+from releaseunpacker.lib import copy_fileobj
+from releaseunpacker.releaseunpacker import ReleaseUnpacker
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+from releaseunpacker.throttle import (
+    MB,
+    MIN_RATE,
+    IoThrottle,
+    IoThrottleError,
+    parse_profile,
+)
+
+
+class CountingThrottle(object):
+    """Throttle that counts the bytes it's asked for."""
+
+    def __init__(self):
+        """Initialize CountingThrottle."""
+        self.consumed = 0
+
+    def consume(self, size):
+        """Count size bytes."""
+        self.consumed += size
+
+
+class TestIoThrottle(ReleaseUnpackerTestCase, unittest.TestCase):
+    """IoThrottle test case."""
+
+    def write_diskstats(self, ios, ms):
+        """Write diskstats with a device for tmp dir, return the path."""
+        st_dev = os.stat(self.tmp_dir).st_dev
+        diskstats_path = Path(self.search_dir, "diskstats")
+        with open(diskstats_path, "w") as fp:
+            fp.write(
+                "{:4d} {:7d} tmpdisk {} 0 0 {} 0 0 0 0 0 0 0\n".format(
+                    os.major(st_dev), os.minor(st_dev), ios, ms
+                )
+            )
+
+        return diskstats_path
+
+    def local_time(self, hour, minute):
+        """Return timestamp of hour:minute today in local time."""
+        return time.mktime(
+            time.localtime()[:3] + (hour, minute, 0, 0, 0, -1)
+        )
+
+    def test_repr(self):
+        """Test object string representation."""
+        self.assertEqual(
+            IoThrottle(20 * MB, [(0, 60, None)]).__repr__(),
+            "<IoThrottle: 20 MB/s (1 profiles) (fixed)>",
+        )
+        self.assertEqual(
+            IoThrottle(adaptive=True).__repr__(),
+            "<IoThrottle: no limit (0 profiles) (adaptive)>",
+        )
+
+    def test_invalid_arguments(self):
+        """Test invalid rate and latency raise exception."""
+        with self.assertRaises(IoThrottleError) as cm:
+            IoThrottle(0)
+        self.assertEqual(str(cm.exception), "Rate must be 1 or more, got 0")
+
+        with self.assertRaises(IoThrottleError) as cm:
+            IoThrottle(latency=0)
+        self.assertEqual(
+            str(cm.exception), "Latency must be more than 0, got 0"
+        )
+
+    def test_parse_profile(self):
+        """Test profiles are parsed from HH:MM-HH:MM=MB."""
+        self.assertEqual(
+            parse_profile("08:00-23:30=20"), (480, 1410, 20 * MB)
+        )
+        self.assertEqual(parse_profile("23:00-07:00=0"), (1380, 420, None))
+
+        for profile in ("08:00-23:00", "8-23=5", "08:00-24:00=5", "=5"):
+            with self.assertRaises(IoThrottleError):
+                parse_profile(profile)
+
+    def test_profiles(self):
+        """Test the profile matching the local time sets the rate."""
+        io_throttle = IoThrottle(
+            50 * MB,
+            [parse_profile("08:00-23:00=10"), parse_profile("23:00-02:00=0")],
+        )
+
+        self.assertEqual(
+            io_throttle.configured_rate(self.local_time(12, 0)), 10 * MB
+        )
+        self.assertIsNone(
+            io_throttle.configured_rate(self.local_time(1, 0))
+        )
+        self.assertEqual(
+            io_throttle.configured_rate(self.local_time(5, 0)), 50 * MB
+        )
+
+    def test_consume(self):
+        """Test consume waits when the rate is used up."""
+        io_throttle = IoThrottle(10 * MB)
+
+        start = time.monotonic()
+        io_throttle.consume(2 * MB)
+        io_throttle.consume(1 * MB)
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.25)
+
+    def test_consume_no_limit(self):
+        """Test consume doesn't wait without a limit."""
+        io_throttle = IoThrottle()
+
+        start = time.monotonic()
+        io_throttle.consume(1024 * MB)
+
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_adaptive(self):
+        """Test rate is halved while latency is high and raised after."""
+        diskstats_path = self.write_diskstats(100, 500)
+        io_throttle = IoThrottle(
+            8 * MB,
+            adaptive=True,
+            dirs=[self.tmp_dir],
+            latency=20,
+            diskstats=diskstats_path,
+        )
+        self.assertEqual(io_throttle.devices, {"tmpdisk"})
+
+        # 100 I/Os taking 50 ms each
+        self.write_diskstats(200, 5500)
+        io_throttle.adapt(time.monotonic() + 2)
+        self.assertEqual(io_throttle.current_rate(), 4 * MB)
+
+        self.write_diskstats(300, 10500)
+        io_throttle.adapt(time.monotonic() + 4)
+        self.assertEqual(io_throttle.current_rate(), 2 * MB)
+
+        # 100 I/Os taking 1 ms each, back to the rate in steps
+        for step in range(1, 8):
+            self.write_diskstats(300 + step * 100, 10500 + step * 100)
+            io_throttle.adapt(time.monotonic() + 4 + step * 2)
+        self.assertEqual(io_throttle.current_rate(), 8 * MB)
+        self.assertIsNone(io_throttle.limit)
+
+    def test_adaptive_min_rate(self):
+        """Test the rate isn't lowered below MIN_RATE."""
+        diskstats_path = self.write_diskstats(0, 0)
+        io_throttle = IoThrottle(
+            MIN_RATE,
+            adaptive=True,
+            dirs=[self.tmp_dir],
+            diskstats=diskstats_path,
+        )
+
+        self.write_diskstats(10, 10000)
+        io_throttle.adapt(time.monotonic() + 2)
+
+        self.assertEqual(io_throttle.current_rate(), MIN_RATE)
+
+    def test_adaptive_no_diskstats(self):
+        """Test dirs without disk stats aren't adapted to."""
+        io_throttle = IoThrottle(
+            adaptive=True,
+            dirs=[self.tmp_dir],
+            diskstats=Path(self.search_dir, "missing"),
+        )
+
+        self.assertEqual(io_throttle.devices, set())
+
+    def test_copy_fileobj(self):
+        """Test copy_fileobj takes the bytes read, not the buffer size."""
+        counting_throttle = CountingThrottle()
+
+        copied = copy_fileobj(
+            io.BytesIO(b"m" * 2500),
+            io.BytesIO(),
+            bytearray(1024),
+            throttle=counting_throttle,
+        )
+
+        self.assertEqual(copied, 2500)
+        self.assertEqual(counting_throttle.consumed, 2500)
+
+    def test_unpack(self):
+        """Test extraction and move take their bytes from the throttle."""
+        self.write_release_rar("Movie-Group", [("movie.mkv", b"m" * 5000)])
+        counting_throttle = CountingThrottle()
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir,
+            self.tmp_dir,
+            self.unpack_dir,
+            extract_mode="tmp",
+            throttle=counting_throttle,
+        )
+
+        release_unpacker.unpack_release_dir_rars()
+
+        self.assertGreaterEqual(counting_throttle.consumed, 5000)
+        self.assertTrue(Path(self.unpack_dir, "Movie-Group.mkv").exists())
@@ -0,0 +1,209 @@
+"""Test Verifier."""
+import json
+import os
+import unittest
+import zlib
+from unittest import mock
+
+import rarfile
+from unipath import Path
+
+from releaseunpacker.releaseunpacker import ReleaseUnpacker
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+from releaseunpacker.verify import (
+    SIDECAR_NAME,
+    Blake2sp,
+    Verifier,
+    expected_hash,
+    hash_file,
+)
+
+
+class TestVerifier(ReleaseUnpackerTestCase, unittest.TestCase):
+    """Verifier test case."""
+
+    def write_unpack_file(self, name, data):
+        """Write data to name in unpack dir and return the path."""
+        path = Path(self.unpack_dir, name)
+        with open(path, "wb") as fp:
+            fp.write(data)
+
+        return path
+
+    def verifier(self):
+        """Return Verifier with its sidecar in tmp dir."""
+        return Verifier(sidecar_dir=self.tmp_dir)
+
+    def test_repr(self):
+        """Test object string representation."""
+        self.assertEqual(Verifier(2).__repr__(), "<Verifier: 2 jobs>")
+
+    def test_blake2sp(self):
+        """Test BLAKE2sp matches the reference digest and rarfile."""
+        self.assertEqual(
+            Blake2sp().hexdigest(),
+            "dd0e891776933f43c7d032b08a917e25741f8aa9a12c12e1cac8801500f2ca4f",
+        )
+
+        for size in (1, 64, 511, 512, 513, 100000):
+            data = os.urandom(size)
+
+            # Updates not on block boundaries
+            blake2sp = Blake2sp()
+            for offset in range(0, size, 700):
+                blake2sp.update(data[offset : offset + 700])
+
+            self.assertEqual(
+                blake2sp.hexdigest(), rarfile.Blake2SP(data).hexdigest()
+            )
+
+    def test_hash_file(self):
+        """Test CRC32 and BLAKE2sp of files."""
+        data = os.urandom(100000)
+        path = self.write_unpack_file("movie.mkv", data)
+
+        self.assertEqual(
+            hash_file(path, "crc32"), "{:08x}".format(zlib.crc32(data))
+        )
+        self.assertEqual(
+            hash_file(path, "blake2sp"), rarfile.Blake2SP(data).hexdigest()
+        )
+
+        # Empty files can't be mapped
+        path = self.write_unpack_file("empty.nfo", b"")
+        self.assertEqual(hash_file(path, "crc32"), "00000000")
+
+    def test_expected_hash(self):
+        """Test CRC32 is preferred over BLAKE2sp."""
+        self.assertEqual(
+            expected_hash({"crc": 255, "blake2sp": "ab"}),
+            ("crc32", "000000ff"),
+        )
+        self.assertEqual(
+            expected_hash({"crc": None, "blake2sp": "ab"}), ("blake2sp", "ab")
+        )
+        self.assertIsNone(expected_hash({"crc": None, "blake2sp": None}))
+        self.assertIsNone(expected_hash({}))
+
+    def test_verify(self):
+        """Test matching and corrupt files in parallel."""
+        movie = os.urandom(100000)
+        good_path = self.write_unpack_file("good.mkv", movie)
+        bad_path = self.write_unpack_file("bad.mkv", b"\0" * len(movie))
+        rarfile_file = {"size": len(movie), "crc": zlib.crc32(movie)}
+
+        self.assertEqual(
+            self.verifier().verify(
+                [(good_path, rarfile_file), (bad_path, rarfile_file)]
+            ),
+            {good_path},
+        )
+
+        # Only verified files in sidecar, kept out of the unpack dir
+        with open(Path(self.tmp_dir, SIDECAR_NAME)) as fp:
+            self.assertEqual(list(json.load(fp)), [good_path])
+        self.assertFalse(Path(self.unpack_dir, SIDECAR_NAME).exists())
+
+    def test_verify_sidecar(self):
+        """Test verified files aren't hashed again until they change."""
+        movie = os.urandom(100000)
+        path = self.write_unpack_file("movie.mkv", movie)
+        rarfile_file = {"size": len(movie), "crc": zlib.crc32(movie)}
+        self.assertEqual(
+            self.verifier().verify([(path, rarfile_file)]), {path}
+        )
+
+        # New verifier reads the sidecar
+        with mock.patch("releaseunpacker.verify.hash_file") as hash_file_mock:
+            self.assertTrue(self.verifier().verify_file(path, rarfile_file))
+        hash_file_mock.assert_not_called()
+
+        # Changed file is hashed again
+        os.utime(path, ns=(0, 0))
+        self.assertTrue(self.verifier().verify_file(path, rarfile_file))
+        with open(path, "r+b") as fp:
+            fp.write(b"\0")
+        self.assertFalse(self.verifier().verify_file(path, rarfile_file))
+
+    def test_verify_sidecar_prune(self):
+        """Test files that are gone are dropped from the sidecar."""
+        movie = os.urandom(1000)
+        rarfile_file = {"size": len(movie), "crc": zlib.crc32(movie)}
+        old_path = self.write_unpack_file("old.mkv", movie)
+        self.verifier().verify([(old_path, rarfile_file)])
+
+        old_path.remove()
+        new_path = self.write_unpack_file("new.mkv", movie)
+        self.verifier().verify([(new_path, rarfile_file)])
+
+        with open(Path(self.tmp_dir, SIDECAR_NAME)) as fp:
+            self.assertEqual(list(json.load(fp)), [new_path])
+
+    def test_verify_saves_sidecar_once(self):
+        """Test the sidecar is saved once per verify, also on errors."""
+        movie = os.urandom(1000)
+        rarfile_file = {"size": len(movie), "crc": zlib.crc32(movie)}
+        paths = [
+            self.write_unpack_file("movie{}.mkv".format(i), movie)
+            for i in range(3)
+        ]
+
+        verifier = self.verifier()
+        with mock.patch.object(
+            verifier, "save_sidecar", wraps=verifier.save_sidecar
+        ) as save_sidecar_mock:
+            verifier.verify([(path, rarfile_file) for path in paths])
+        self.assertEqual(save_sidecar_mock.call_count, 1)
+
+        with open(Path(self.tmp_dir, SIDECAR_NAME)) as fp:
+            self.assertEqual(sorted(json.load(fp)), paths)
+
+        # Files verified before the error are saved
+        Path(self.tmp_dir, SIDECAR_NAME).remove()
+        verifier = self.verifier()
+        with self.assertRaises(OSError):
+            verifier.verify(
+                [
+                    (paths[0], rarfile_file),
+                    (Path(self.unpack_dir, "missing.mkv"), rarfile_file),
+                ]
+            )
+
+        with open(Path(self.tmp_dir, SIDECAR_NAME)) as fp:
+            self.assertEqual(list(json.load(fp)), [paths[0]])
+
+    def test_verify_without_hash(self):
+        """Test files without a hash in the RAR only match in size."""
+        path = self.write_unpack_file("movie.mkv", b"movie")
+
+        self.assertTrue(
+            Verifier().verify_file(path, {"size": 5, "crc": None})
+        )
+
+    def test_unpack_corrupt_existing_file(self):
+        """Test a corrupt file with the right size is unpacked again."""
+        movie = os.urandom(100000)
+        self.write_release_rar("Store-Group", [("movie.mkv", movie)])
+        self.write_unpack_file("Store-Group.mkv", b"\0" * len(movie))
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir
+        )
+        release_unpacker.unpack_release_dir_rars()
+
+        with open(Path(self.unpack_dir, "Store-Group.mkv"), "rb") as fp:
+            self.assertEqual(fp.read(), movie)
+
+    def test_unpack_no_verify(self):
+        """Test size match only without verify."""
+        movie = os.urandom(100000)
+        self.write_release_rar("Store-Group", [("movie.mkv", movie)])
+        self.write_unpack_file("Store-Group.mkv", b"\0" * len(movie))
+
+        release_unpacker = ReleaseUnpacker(
+            self.search_dir, self.tmp_dir, self.unpack_dir, verify=False
+        )
+        release_unpacker.unpack_release_dir_rars()
+
+        with open(Path(self.unpack_dir, "Store-Group.mkv"), "rb") as fp:
+            self.assertEqual(fp.read(), b"\0" * len(movie))
@@ -0,0 +1,200 @@
+"""Test VolumeSet."""
+import os
+import time
+import unittest
+import zlib
+
+from unipath import Path
+
+from releaseunpacker.rarheader import RAR4_MHD_PASSWORD, read_volume
+from releaseunpacker.tests.rarbuilder import truncate
+from releaseunpacker.tests.test_rarheader import rar_data
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+from releaseunpacker.volumes import (
+    COMPLETE,
+    INCOMPLETE,
+    STALLED,
+    VolumeSet,
+    volume_name,
+)
+
+
+class TestVolumeSet(ReleaseUnpackerTestCase, unittest.TestCase):
+    """VolumeSet test case."""
+
+    def test_volume_name(self):
+        """Test volume names for old and new naming."""
+        self.assertEqual(volume_name("rel.rar", 0, False), "rel.rar")
+        self.assertEqual(volume_name("rel.rar", 1, False), "rel.r00")
+        self.assertEqual(volume_name("rel.rar", 101, False), "rel.s00")
+        self.assertEqual(
+            volume_name("rel.part01.rar", 9, True), "rel.part10.rar"
+        )
+        self.assertEqual(
+            volume_name("rel.part001.rar", 1, True), "rel.part002.rar"
+        )
+
+    def test_single_archive_complete(self):
+        """Test a single archive is complete."""
+        self.copy_test_directory_to_search_dir("Release-Group")
+        volume_set = VolumeSet(
+            Path(self.search_dir, "Release-Group", "rar_file.rar")
+        )
+
+        self.assertEqual(volume_set.status, COMPLETE)
+        self.assertIsNone(volume_set.reason)
+        self.assertEqual(len(volume_set.volumes), 1)
+
+    def test_volume_set_complete(self):
+        """Test complete volume sets with old and new naming."""
+        for new_naming, rar5 in ((False, False), (True, False), (True, True)):
+            volume_paths = self.write_release_rar(
+                "Store{}{}-Group".format(new_naming, rar5),
+                [("movie.mkv", os.urandom(25000))],
+                volume_size=10000,
+                new_naming=new_naming,
+                rar5=rar5,
+            )
+            volume_set = VolumeSet(volume_paths[0])
+
+            self.assertEqual(volume_set.status, COMPLETE)
+            self.assertEqual(len(volume_set.volumes), 3)
+
+    def test_volume_missing(self):
+        """Test volume set with a missing volume is incomplete."""
+        volume_paths = self.write_release_rar(
+            "Store-Group",
+            [("movie.mkv", os.urandom(25000))],
+            volume_size=10000,
+        )
+        volume_paths[2].remove()
+        volume_set = VolumeSet(volume_paths[0])
+
+        self.assertEqual(volume_set.status, INCOMPLETE)
+        self.assertEqual(
+            volume_set.reason, "Volume store-group.r01 is missing"
+        )
+
+    def test_volume_truncated(self):
+        """Test volume set with a volume still copying is incomplete."""
+        volume_paths = self.write_release_rar(
+            "Store-Group",
+            [("movie.mkv", os.urandom(25000))],
+            volume_size=10000,
+            new_naming=True,
+        )
+        truncate(volume_paths[1], 5000)
+        volume_set = VolumeSet(volume_paths[0])
+
+        self.assertEqual(volume_set.status, INCOMPLETE)
+        self.assertTrue(
+            volume_set.reason.startswith(
+                "Volume store-group.part02.rar is incomplete"
+            )
+        )
+
+    def test_sfv_file_missing(self):
+        """Test file listed in SFV that is missing makes it incomplete."""
+        volume_paths = self.write_release_rar(
+            "Store-Group", [("movie.mkv", os.urandom(100))]
+        )
+        Path(volume_paths[0].parent, "store-group.sfv").write_file(
+            "; comment\nstore-group.rar 12345678\nstore-group.r00 87654321\n"
+        )
+        volume_set = VolumeSet(volume_paths[0])
+
+        self.assertEqual(volume_set.status, INCOMPLETE)
+        self.assertEqual(
+            volume_set.reason,
+            "store-group.r00 listed in store-group.sfv is missing",
+        )
+
+    def test_sfv_file_empty(self):
+        """Test empty or changed files listed in SFV make it incomplete."""
+        volume_paths = self.write_release_rar(
+            "Store-Group", [("movie.mkv", os.urandom(100))]
+        )
+        Path(volume_paths[0].parent, "store-group.nfo").write_file("")
+        sfv_path = Path(volume_paths[0].parent, "store-group.sfv")
+        sfv_path.write_file("store-group.nfo 00000000\n")
+
+        self.assertEqual(VolumeSet(volume_paths[0]).status, COMPLETE)
+
+        sfv_path.write_file("store-group.nfo 12345678\n")
+        volume_set = VolumeSet(volume_paths[0])
+        self.assertEqual(volume_set.status, INCOMPLETE)
+        self.assertEqual(
+            volume_set.reason,
+            "store-group.nfo listed in store-group.sfv is empty",
+        )
+
+        # Volume grew after its headers were read
+        sfv_path.write_file("store-group.rar 12345678\n")
+        volume_set = VolumeSet(volume_paths[0])
+        volume_set.read_volume = lambda path: dict(
+            read_volume(path), size=10
+        )
+        self.assertEqual(volume_set.status, INCOMPLETE)
+        self.assertEqual(
+            volume_set.reason,
+            "store-group.rar listed in store-group.sfv changed size",
+        )
+
+    def test_sfv_crc(self):
+        """Test CRC32 of files listed in SFV are checked with sfv_crc."""
+        volume_paths = self.write_release_rar(
+            "Store-Group", [("movie.mkv", os.urandom(100))]
+        )
+        with open(volume_paths[0], "rb") as fp:
+            crc = zlib.crc32(fp.read())
+        sfv_path = Path(volume_paths[0].parent, "store-group.sfv")
+        sfv_path.write_file("store-group.rar {:08X}\n".format(crc))
+
+        self.assertEqual(
+            VolumeSet(volume_paths[0], sfv_crc=True).status, COMPLETE
+        )
+
+        sfv_path.write_file("store-group.rar {:08x}\n".format(crc ^ 1))
+        self.assertEqual(VolumeSet(volume_paths[0]).status, COMPLETE)
+
+        volume_set = VolumeSet(volume_paths[0], sfv_crc=True)
+        self.assertEqual(volume_set.status, INCOMPLETE)
+        self.assertEqual(
+            volume_set.reason,
+            "store-group.rar listed in store-group.sfv has CRC32 {:08x}, "
+            "expected {:08x}".format(crc, crc ^ 1),
+        )
+
+    def test_headers_encrypted(self):
+        """Test volume sets with encrypted headers are incomplete."""
+        Path(self.search_dir, "Release-Group").mkdir()
+        rar_file_path = Path(self.search_dir, "Release-Group", "rel.rar")
+        with open(rar_file_path, "wb") as fp:
+            fp.write(rar_data(flags=RAR4_MHD_PASSWORD))
+        volume_set = VolumeSet(rar_file_path)
+
+        self.assertEqual(volume_set.status, INCOMPLETE)
+        self.assertEqual(
+            volume_set.reason,
+            "Headers of rel.rar are encrypted, volumes can't be checked",
+        )
+        self.assertTrue(volume_set.headers_encrypted)
+
+    def test_stalled(self):
+        """Test incomplete volume set without changes is stalled."""
+        volume_paths = self.write_release_rar(
+            "Store-Group",
+            [("movie.mkv", os.urandom(25000))],
+            volume_size=10000,
+        )
+        volume_paths[2].remove()
+        old = time.time() - 7200
+        for volume_path in volume_paths[:2]:
+            os.utime(volume_path, (old, old))
+
+        self.assertEqual(
+            VolumeSet(volume_paths[0], stall_time=3600).status, STALLED
+        )
+        self.assertEqual(
+            VolumeSet(volume_paths[0], stall_time=10800).status, INCOMPLETE
+        )
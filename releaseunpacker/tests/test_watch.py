@@ -0,0 +1,173 @@
+"""Test ReleaseWatcher."""
+import select
+import unittest
+
+from unipath import Path
+
+from releaseunpacker.tests.test_releaseunpacker import ReleaseUnpackerTestCase
+from releaseunpacker.watch import (
+    IN_CREATE,
+    IN_ISDIR,
+    IN_MODIFY,
+    ReleaseWatcher,
+    ReleaseWatcherError,
+)
+
+
+class TestReleaseWatcher(ReleaseUnpackerTestCase, unittest.TestCase):
+    """ReleaseWatcher test case."""
+
+    def test_repr(self):
+        """Test object string representation."""
+        release_watcher = ReleaseWatcher([self.search_dir], inotify=False)
+
+        self.assertEqual(
+            release_watcher.__repr__(),
+            "<ReleaseWatcher: {} (polling)>".format(self.search_dir),
+        )
+
+    def test_release_dir_not_a_dir(self):
+        """Test release dir that is not a dir raises exception."""
+        release_dir = Path(self.search_dir, "missing")
+
+        with self.assertRaises(ReleaseWatcherError) as cm:
+            ReleaseWatcher([release_dir], inotify=False)
+
+        self.assertEqual(
+            str(cm.exception),
+            "Release dir {} is not a dir".format(release_dir),
+        )
+
+    def test_affected_dir(self):
+        """Test events are mapped to release dirs."""
+        release_watcher = ReleaseWatcher([self.search_dir], inotify=False)
+        release = Path(self.search_dir, "Release-Group")
+
+        self.assertEqual(
+            release_watcher.affected_dir(
+                self.search_dir, "Release-Group", IN_CREATE | IN_ISDIR
+            ),
+            release,
+        )
+        self.assertEqual(
+            release_watcher.affected_dir(release, "rar.r00", IN_MODIFY),
+            release,
+        )
+        self.assertEqual(
+            release_watcher.affected_dir(
+                Path(release, "Subs"), "subs.rar", IN_MODIFY
+            ),
+            release,
+        )
+        self.assertIsNone(
+            release_watcher.affected_dir(self.search_dir, "file", IN_MODIFY)
+        )
+        self.assertIsNone(
+            release_watcher.affected_dir(
+                Path(self.search_dir, "Movies"),
+                ".Release-Group.releaseunpacker-claim",
+                IN_MODIFY,
+            )
+        )
+
+    def test_ready_waits_for_settle_and_stable_size(self):
+        """Test dirs are only ready when settled and not growing."""
+        volume_paths = self.write_release_rar(
+            "Release-Group", [("movie.mkv", b"movie")]
+        )
+        release = volume_paths[0].parent
+        release_watcher = ReleaseWatcher(
+            [self.search_dir], settle_time=10, inotify=False
+        )
+
+        release_watcher.changed(release, now=100)
+        self.assertEqual(release_watcher.ready(now=105), [])
+
+        # First check after settle time records sizes
+        self.assertEqual(release_watcher.ready(now=110), [])
+
+        # Volume grew, wait another settle time
+        with open(volume_paths[0], "ab") as fp:
+            fp.write(b"more")
+        self.assertEqual(release_watcher.ready(now=120), [])
+        self.assertEqual(release_watcher.ready(now=130), [release])
+        self.assertEqual(release_watcher.pending, {})
+
+    def test_ready_retry(self):
+        """Test dirs retried are ready again after retry time."""
+        volume_paths = self.write_release_rar(
+            "Release-Group", [("movie.mkv", b"movie")]
+        )
+        release = volume_paths[0].parent
+        release_watcher = ReleaseWatcher(
+            [self.search_dir], retry_time=60, inotify=False
+        )
+        release_watcher.signatures[release] = release_watcher.signature(
+            release
+        )
+
+        release_watcher.retry(release, now=100)
+        self.assertEqual(release_watcher.ready(now=150), [])
+        self.assertEqual(release_watcher.ready(now=160), [release])
+        self.assertEqual(release_watcher.retries, {})
+
+    def test_run_retries_deferred(self):
+        """Test dirs the callback didn't unpack are handed to it again."""
+        self.write_release_rar("Release-Group", [("movie.mkv", b"movie")])
+        release = Path(self.search_dir, "Release-Group")
+        release_watcher = ReleaseWatcher(
+            [self.search_dir], settle_time=0, retry_time=0, inotify=False
+        )
+        calls = []
+
+        def callback(ready):
+            calls.append(ready)
+            if len(calls) == 1:
+                return []
+
+            release_watcher.stop()
+            return ready
+
+        release_watcher.run(callback)
+
+        self.assertEqual(calls, [[release], [release]])
+        self.assertEqual(release_watcher.retries, {})
+
+    def test_scan_marks_changed_releases(self):
+        """Test polling scan marks new and changed releases."""
+        self.copy_test_directory_to_search_dir("Release-Group")
+        release_watcher = ReleaseWatcher([self.search_dir], inotify=False)
+
+        release_watcher.scan()
+        self.assertEqual(
+            list(release_watcher.pending),
+            [Path(self.search_dir, "Release-Group")],
+        )
+
+        release_watcher.pending = {}
+        release_watcher.scan()
+        self.assertEqual(release_watcher.pending, {})
+
+        self.copy_test_directory_to_search_dir("Release.with.subs-Group")
+        release_watcher.scan()
+        self.assertEqual(
+            list(release_watcher.pending),
+            [Path(self.search_dir, "Release.with.subs-Group")],
+        )
+
+    def test_inotify_events(self):
+        """Test inotify events mark new releases and watch new dirs."""
+        release_watcher = ReleaseWatcher([self.search_dir])
+        if not release_watcher.inotify:
+            self.skipTest("inotify not available")
+
+        try:
+            self.write_release_rar("Release-Group", [("movie.mkv", b"movie")])
+            select.select([release_watcher.inotify], [], [], 1)
+            release_watcher.handle_events()
+
+            release = Path(self.search_dir, "Release-Group")
+            self.assertEqual(list(release_watcher.pending), [release])
+            self.assertIn(release, release_watcher.inotify.watches.values())
+        finally:
+            release_watcher.close()
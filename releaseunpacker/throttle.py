@@ -0,0 +1,259 @@
+"""ReleaseUnpacker I/O bandwidth throttle."""
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+DISKSTATS = "/proc/diskstats"
+
+# Bytes that may be copied at once after the throttle was idle, in seconds of
+# the rate
+BURST_SECONDS = 0.5
+
+# Adaptive mode samples device latency this often, halves the rate when it's
+# above the target and raises it a step when it's below
+ADAPT_INTERVAL = 1.0
+ADAPT_STEP = 1.25
+MIN_RATE = 1 * MB
+LATENCY = 50
+
+
+class IoThrottleError(Exception):
+    """IoThrottle error."""
+
+    pass
+
+
+def parse_time(value):
+    """Return minutes after midnight of HH:MM."""
+    hours, _, minutes = value.partition(":")
+    if not (hours.isdigit() and minutes.isdigit()):
+        raise IoThrottleError("Invalid time {}".format(value))
+
+    hours, minutes = int(hours), int(minutes)
+    if hours > 23 or minutes > 59:
+        raise IoThrottleError("Invalid time {}".format(value))
+
+    return hours * 60 + minutes
+
+
+def parse_profile(profile):
+    """Return (start, end, bytes per second) from HH:MM-HH:MM=MB.
+
+    Start and end are minutes after midnight, a profile that ends before it
+    starts runs over midnight. 0 MB means no limit, returned as None.
+    """
+    times, _, rate = profile.partition("=")
+    start, _, end = times.partition("-")
+    if not (start and end and rate.isdigit()):
+        raise IoThrottleError(
+            "Invalid profile {}, use HH:MM-HH:MM=MB".format(profile)
+        )
+
+    return parse_time(start), parse_time(end), int(rate) * MB or None
+
+
+def device_name(path, diskstats=DISKSTATS):
+    """Return name of the block device of path in diskstats, None if none."""
+    st_dev = os.stat(path).st_dev
+    major, minor = os.major(st_dev), os.minor(st_dev)
+    try:
+        with open(diskstats) as fp:
+            for line in fp:
+                fields = line.split()
+                if (int(fields[0]), int(fields[1])) == (major, minor):
+                    return fields[2]
+    except OSError:
+        pass
+
+    return None
+
+
+def read_diskstats(diskstats=DISKSTATS):
+    """Return {device name: (ios, ms spent on ios)} from diskstats."""
+    stats = {}
+    with open(diskstats) as fp:
+        for line in fp:
+            fields = line.split()
+            stats[fields[2]] = (
+                int(fields[3]) + int(fields[7]),
+                int(fields[6]) + int(fields[10]),
+            )
+
+    return stats
+
+
+class IoThrottle(object):
+    """Limit the bytes per second read and written by unpacks.
+
+    A token bucket shared by all extractions and moves, every copy takes
+    tokens for a chunk before it copies it and waits when there aren't
+    enough. rate is bytes per second, None for no limit. profiles is a list
+    of (start, end, rate) time of day windows, the first window that matches
+    the local time sets the rate instead.
+
+    With adaptive the latency of the devices of dirs is sampled from
+    /proc/diskstats. While it's above latency ms per I/O the rate is halved,
+    down to MIN_RATE, when it drops again the rate goes back up in steps.
+    Without a rate adaptive mode starts from the throughput seen.
+    """
+
+    def __init__(
+        self,
+        rate=None,
+        profiles=None,
+        adaptive=False,
+        dirs=None,
+        latency=LATENCY,
+        diskstats=DISKSTATS,
+    ):
+        """Initialize and validate IoThrottle."""
+        self.rate = rate
+        self.profiles = profiles or []
+        self.adaptive = adaptive
+        self.latency = latency
+        self.diskstats = diskstats
+        self.lock = threading.Lock()
+        self.tokens = 0
+        self.updated = time.monotonic()
+
+        # Adaptive state, the limit below the configured rate
+        self.limit = None
+        self.sampled = self.updated
+        self.sampled_bytes = 0
+        self.sampled_stats = {}
+
+        if self.rate is not None and self.rate < 1:
+            raise IoThrottleError(
+                "Rate must be 1 or more, got {}".format(self.rate)
+            )
+        elif self.latency <= 0:
+            raise IoThrottleError(
+                "Latency must be more than 0, got {}".format(self.latency)
+            )
+
+        self.devices = set()
+        if self.adaptive:
+            for dir in dirs or []:
+                name = device_name(dir, self.diskstats)
+                if name:
+                    self.devices.add(name)
+                else:
+                    log.warning(
+                        "No disk stats for %s, not adapting to it", dir
+                    )
+            if self.devices:
+                self.sampled_stats = read_diskstats(self.diskstats)
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<IoThrottle: {} ({} profiles) ({})>".format(
+            "{} MB/s".format(self.rate // MB) if self.rate else "no limit",
+            len(self.profiles),
+            "adaptive" if self.adaptive else "fixed",
+        )
+
+    def configured_rate(self, now=None):
+        """Return rate of the profile matching the local time, else rate."""
+        local_time = time.localtime(now)
+        minute = local_time.tm_hour * 60 + local_time.tm_min
+        for start, end, rate in self.profiles:
+            if start <= end:
+                matches = start <= minute < end
+            else:
+                matches = minute >= start or minute < end
+            if matches:
+                return rate
+
+        return self.rate
+
+    def current_rate(self, now=None):
+        """Return bytes per second allowed now, None for no limit."""
+        rate = self.configured_rate(now)
+        if self.limit is None:
+            return rate
+        elif rate is None:
+            return self.limit
+
+        return min(rate, self.limit)
+
+    def device_latency(self):
+        """Return highest ms per I/O of the devices since the last sample.
+
+        Return None if the devices did no I/O.
+        """
+        stats = read_diskstats(self.diskstats)
+        latencies = []
+        for name in self.devices:
+            if name not in stats or name not in self.sampled_stats:
+                continue
+
+            ios = stats[name][0] - self.sampled_stats[name][0]
+            ms = stats[name][1] - self.sampled_stats[name][1]
+            if ios > 0:
+                latencies.append(ms / ios)
+        self.sampled_stats = stats
+
+        return max(latencies) if latencies else None
+
+    def adapt(self, monotonic):
+        """Raise or lower the limit from the device latency, call with lock."""
+        seconds = monotonic - self.sampled
+        if seconds < ADAPT_INTERVAL:
+            return
+
+        seen_rate = self.sampled_bytes / seconds
+        self.sampled = monotonic
+        self.sampled_bytes = 0
+        latency = self.device_latency()
+        if latency is None:
+            return
+
+        if latency > self.latency:
+            limit = max(
+                (self.limit or self.configured_rate() or seen_rate) / 2,
+                MIN_RATE,
+            )
+            if limit != self.limit:
+                log.debug(
+                    "Device latency %.1f ms, limiting I/O to %s MB/s",
+                    latency,
+                    round(limit / MB, 1),
+                )
+            self.limit = limit
+        elif self.limit is not None:
+            self.limit *= ADAPT_STEP
+            rate = self.configured_rate()
+            if (rate and self.limit >= rate) or (
+                not rate and self.limit >= 2 * max(seen_rate, MIN_RATE)
+            ):
+                log.debug("Device latency %.1f ms, I/O not limited", latency)
+                self.limit = None
+
+    def consume(self, size):
+        """Take size bytes from the bucket, wait until they're allowed."""
+        with self.lock:
+            now = time.monotonic()
+            if self.devices:
+                self.sampled_bytes += size
+                self.adapt(now)
+
+            rate = self.current_rate()
+            if rate is None:
+                self.tokens = 0
+                self.updated = now
+                return
+
+            self.tokens = min(
+                rate * BURST_SECONDS,
+                self.tokens + (now - self.updated) * rate,
+            )
+            self.updated = now
+            self.tokens -= size
+            wait = -self.tokens / rate if self.tokens < 0 else 0
+
+        if wait:
+            time.sleep(wait)
@@ -0,0 +1,262 @@
+"""ReleaseUnpacker unpacked file verification."""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from unipath import Path
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 16 * 1024 * 1024
+JOBS = 4
+
+# Verified files are remembered in this file in the sidecar dir, not next to
+# the files
+SIDECAR_NAME = ".releaseunpacker-verified.json"
+
+# BLAKE2sp hashes 64 byte blocks round robin over 8 BLAKE2s leaves
+BLAKE2SP_LEAVES = 8
+BLAKE2SP_BLOCK = 64
+BLAKE2SP_GROUP = BLAKE2SP_LEAVES * BLAKE2SP_BLOCK
+
+
+class Blake2sp(object):
+    """BLAKE2sp hash, the hash RAR5 archives can store instead of CRC32.
+
+    Built from hashlib.blake2s leaf and root nodes. Full groups of 8 blocks
+    are split over the leaves with strided memoryview copies, so data is
+    never sliced block by block in Python.
+    """
+
+    def __init__(self):
+        """Initialize Blake2sp."""
+        self.leaves = [
+            hashlib.blake2s(
+                fanout=BLAKE2SP_LEAVES,
+                depth=2,
+                node_offset=leaf,
+                inner_size=32,
+                last_node=leaf == BLAKE2SP_LEAVES - 1,
+            )
+            for leaf in range(BLAKE2SP_LEAVES)
+        ]
+        self.pending = bytearray()
+
+    def update_groups(self, view):
+        """Hash view, a whole number of groups, starting at the first leaf."""
+        # Blocks are 8 words, leaf n gets words n * 8 to n * 8 + 7 of every
+        # group
+        words = view.cast("Q")
+        leaf_data = bytearray(len(view) // BLAKE2SP_LEAVES)
+        leaf_words = memoryview(leaf_data).cast("Q")
+        word_step = BLAKE2SP_GROUP // 8
+        for leaf in range(BLAKE2SP_LEAVES):
+            for word in range(8):
+                leaf_words[word::8] = words[leaf * 8 + word :: word_step]
+            self.leaves[leaf].update(leaf_words)
+
+    def update(self, data):
+        """Hash data."""
+        view = memoryview(data).cast("B")
+        if self.pending:
+            need = BLAKE2SP_GROUP - len(self.pending)
+            self.pending += view[:need]
+            view = view[need:]
+            if len(self.pending) < BLAKE2SP_GROUP:
+                return
+
+            self.update_groups(memoryview(self.pending))
+            self.pending = bytearray()
+
+        groups_size = len(view) - len(view) % BLAKE2SP_GROUP
+        if groups_size:
+            self.update_groups(view[:groups_size])
+        self.pending += view[groups_size:]
+
+    def hexdigest(self):
+        """Return hex digest of data hashed so far."""
+        leaves = [leaf.copy() for leaf in self.leaves]
+        for offset in range(0, len(self.pending), BLAKE2SP_BLOCK):
+            leaves[offset // BLAKE2SP_BLOCK].update(
+                self.pending[offset : offset + BLAKE2SP_BLOCK]
+            )
+
+        root = hashlib.blake2s(
+            fanout=BLAKE2SP_LEAVES,
+            depth=2,
+            node_depth=1,
+            inner_size=32,
+            last_node=True,
+        )
+        for leaf in leaves:
+            root.update(leaf.digest())
+
+        return root.hexdigest()
+
+
+def expected_hash(rarfile_file):
+    """Return (hash type, hex digest) of a file in a RAR or None."""
+    if rarfile_file.get("crc") is not None:
+        return "crc32", "{:08x}".format(rarfile_file["crc"])
+    elif rarfile_file.get("blake2sp"):
+        return "blake2sp", rarfile_file["blake2sp"]
+
+    return None
+
+
+def hash_view(view, hash_type):
+    """Return hex digest of view in CHUNK_SIZE chunks."""
+    if hash_type == "crc32":
+        crc = 0
+        for offset in range(0, len(view), CHUNK_SIZE):
+            crc = zlib.crc32(view[offset : offset + CHUNK_SIZE], crc)
+
+        return "{:08x}".format(crc)
+
+    blake2sp = Blake2sp()
+    for offset in range(0, len(view), CHUNK_SIZE):
+        blake2sp.update(view[offset : offset + CHUNK_SIZE])
+
+    return blake2sp.hexdigest()
+
+
+def hash_file(path, hash_type):
+    """Return hex digest of the file at path.
+
+    The file is mapped with mmap and read ahead sequentially, zlib and
+    hashlib release the GIL so files can be hashed in parallel threads.
+    """
+    with open(path, "rb") as fp:
+        if not os.fstat(fp.fileno()).st_size:
+            return hash_view(memoryview(b""), hash_type)
+
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+
+            with memoryview(mm) as view:
+                return hash_view(view, hash_type)
+
+
+class Verifier(object):
+    """Verify unpacked files against the hashes in the RAR headers.
+
+    Files are hashed in parallel, jobs at a time. Verified files are
+    remembered by path with size, mtime and hash in a sidecar file in
+    sidecar_dir, like tmp dir, so a file is only hashed again when it
+    changed and nothing is added to the unpack dir. Files that are gone are
+    dropped from the sidecar file when it's saved. Without a sidecar_dir
+    nothing is remembered.
+    """
+
+    def __init__(self, jobs=JOBS, sidecar_dir=None):
+        """Initialize Verifier."""
+        self.jobs = jobs
+        self.sidecar_dir = sidecar_dir
+        self.lock = threading.Lock()
+        self.verified = None
+        self.changed = False
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<Verifier: {} jobs>".format(self.jobs)
+
+    def sidecar(self):
+        """Return verified files by path from the sidecar file."""
+        if self.verified is None:
+            self.verified = {}
+            if self.sidecar_dir:
+                try:
+                    with open(Path(self.sidecar_dir, SIDECAR_NAME)) as fp:
+                        self.verified = json.load(fp)
+                except (OSError, ValueError):
+                    pass
+
+        return self.verified
+
+    def save_sidecar(self):
+        """Write verified files that still exist to the sidecar file.
+
+        Nothing is written if no file was verified since the last save.
+        """
+        if not self.sidecar_dir or not self.changed:
+            return
+
+        for path in list(self.verified):
+            if not os.path.exists(path):
+                del self.verified[path]
+
+        sidecar_path = Path(self.sidecar_dir, SIDECAR_NAME)
+        tmp_path = "{}.{}.tmp".format(sidecar_path, os.getpid())
+        with open(tmp_path, "w") as fp:
+            json.dump(self.verified, fp, sort_keys=True)
+        os.replace(tmp_path, sidecar_path)
+        self.changed = False
+
+    def verify_file(self, path, rarfile_file):
+        """Return True if the file at path matches rarfile_file.
+
+        Files without a hash in the RAR headers only have to match in size.
+        Verified files are saved to the sidecar file by verify.
+        """
+        path = Path(path).absolute()
+        expected = expected_hash(rarfile_file)
+        if not expected:
+            log.debug("No hash for %s in RAR, size match only", path)
+            return True
+
+        stat = os.stat(path)
+        verified = [stat.st_size, stat.st_mtime_ns] + list(expected)
+        with self.lock:
+            if self.sidecar().get(path) == verified:
+                log.debug("%s already verified", path)
+                return True
+
+        digest = hash_file(path, expected[0])
+        if digest != expected[1]:
+            log.warning(
+                "%s %s %s doesn't match %s in RAR",
+                path,
+                expected[0],
+                digest,
+                expected[1],
+            )
+            return False
+
+        log.info("%s verified, %s match", path, expected[0])
+        with self.lock:
+            self.sidecar()[path] = verified
+            self.changed = True
+
+        return True
+
+    def verify(self, unpack_files):
+        """Return paths of the unpack files that match the RAR.
+
+        unpack_files is a list of (path, rarfile_file) tuples, they are
+        verified in parallel. The sidecar file is saved once when all files
+        are verified, or when verifying fails.
+        """
+        try:
+            with ThreadPoolExecutor(self.jobs) as executor:
+                matches = executor.map(
+                    lambda unpack_file: self.verify_file(*unpack_file),
+                    unpack_files,
+                )
+
+                return {
+                    path
+                    for (path, _), match in zip(unpack_files, matches)
+                    if match
+                }
+        finally:
+            with self.lock:
+                try:
+                    self.save_sidecar()
+                except OSError as e:
+                    log.warning("Can't save verified files: %s", e)
@@ -0,0 +1,255 @@
+"""ReleaseUnpacker volume set analyser."""
+import logging
+import os
+import re
+import time
+
+from lazy import lazy
+from unipath import Path
+
+from .rarheader import RarHeaderError, RarHeaderTruncatedError, read_volume
+from .verify import hash_file
+
+log = logging.getLogger(__name__)
+
+COMPLETE = "complete"
+INCOMPLETE = "incomplete"
+STALLED = "stalled"
+
+# Incomplete volume sets without changes for this long are stalled
+STALL_TIME = 6 * 60 * 60
+
+PART_RE = re.compile(r"^(?P<base>.*)\.part(?P<number>\d+)\.rar$", re.I)
+
+
+def volume_name(first_volume_name, number, new_naming):
+    """Return file name of volume number (0 based) in a volume set."""
+    if new_naming:
+        match = PART_RE.match(first_volume_name)
+        digits = len(match.group("number"))
+
+        return "{}.part{}.rar".format(
+            match.group("base"), str(number + 1).zfill(digits)
+        )
+
+    if number == 0:
+        return first_volume_name
+
+    base = first_volume_name[: -len(".rar")]
+    letter = "rstuvwxyz"[(number - 1) // 100]
+    if first_volume_name.endswith(".RAR"):
+        letter = letter.upper()
+
+    return "{}.{}{:02d}".format(base, letter, (number - 1) % 100)
+
+
+def read_sfv(sfv_path):
+    """Return (file name, CRC32) listed in the SFV file at sfv_path.
+
+    The CRC32 is None if it isn't a hex number.
+    """
+    files = []
+    with open(sfv_path, "r", errors="replace") as fp:
+        for line in fp:
+            line = line.strip()
+            if not line or line.startswith(";"):
+                continue
+
+            fields = line.rsplit(None, 1)
+            try:
+                crc = int(fields[1], 16)
+            except (IndexError, ValueError):
+                crc = None
+
+            files.append((fields[0], crc))
+
+    return files
+
+
+class VolumeSet(object):
+    """RAR volume set of a release.
+
+    Reads the headers of every volume once, without reading any file data,
+    and classifies the volume set as complete, incomplete or stalled. A
+    volume set is incomplete when a volume is missing, shorter than its
+    headers say, when a file listed in an SFV is missing or empty, when a
+    listed volume changed size while it was checked or, with sfv_crc, when
+    the CRC32 of a listed file doesn't match. Volume sets with encrypted
+    headers are incomplete as well, the volumes after the first can't be
+    checked. An incomplete volume set that hasn't changed for stall_time
+    seconds is stalled. With a header_cache volumes that didn't change since
+    they were cached are not read again.
+    """
+
+    def __init__(
+        self,
+        rar_file_path,
+        stall_time=STALL_TIME,
+        header_cache=None,
+        sfv_crc=False,
+    ):
+        """Initialize VolumeSet."""
+        self.rar_file_path = Path(rar_file_path)
+        self.stall_time = stall_time
+        self.header_cache = header_cache
+        self.sfv_crc = sfv_crc
+        self.reason = None
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<VolumeSet: {} ({})>".format(self.rar_file_path, self.status)
+
+    def incomplete(self, reason):
+        """Set reason and return INCOMPLETE."""
+        self.reason = reason
+
+        return INCOMPLETE
+
+    @lazy
+    def volumes(self):
+        """Return parsed headers of all volumes found."""
+        self.status
+
+        return self._volumes
+
+    @lazy
+    def status(self):
+        """Return volume set status, complete, incomplete or stalled."""
+        status = self.analyse()
+        if status == INCOMPLETE and self.stalled():
+            return STALLED
+
+        return status
+
+    def stalled(self):
+        """Return True if nothing in the release dir changed in stall_time."""
+        newest = 0
+        with os.scandir(self.rar_file_path.parent) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    newest = max(newest, entry.stat().st_mtime)
+
+        return time.time() - newest > self.stall_time
+
+    @property
+    def headers_encrypted(self):
+        """Return True if the headers of the first volume are encrypted."""
+        return bool(self.volumes) and self.volumes[0]["headers_encrypted"]
+
+    def read_volume(self, volume_path):
+        """Return parsed headers of volume_path."""
+        if self.header_cache:
+            return self.header_cache.read_volume(volume_path)
+
+        return read_volume(volume_path)
+
+    def analyse(self):
+        """Read volume headers and return COMPLETE or INCOMPLETE."""
+        self._volumes = []
+        dir = self.rar_file_path.parent
+        first_volume_name = self.rar_file_path.name
+        number = 0
+
+        while True:
+            volume_path = Path(dir, first_volume_name)
+            if number:
+                volume_path = Path(
+                    dir, volume_name(first_volume_name, number, new_naming)
+                )
+
+            if not volume_path.exists():
+                return self.incomplete(
+                    "Volume {} is missing".format(volume_path.name)
+                )
+
+            try:
+                volume = self.read_volume(volume_path)
+            except RarHeaderTruncatedError as e:
+                return self.incomplete(
+                    "Volume {} is incomplete: {}".format(volume_path.name, e)
+                )
+            except RarHeaderError as e:
+                return self.incomplete(
+                    "Volume {} is invalid: {}".format(volume_path.name, e)
+                )
+            self._volumes.append(volume)
+
+            if volume["headers_encrypted"]:
+                return self.incomplete(
+                    "Headers of {} are encrypted, volumes can't be "
+                    "checked".format(volume_path.name)
+                )
+
+            if number == 0:
+                if not volume["volume"]:
+                    break
+
+                match = PART_RE.match(first_volume_name)
+                new_naming = bool(match)
+                if new_naming and int(match.group("number")) != 1:
+                    return self.incomplete("First volume is missing")
+
+            if (
+                volume["volume_number"] is not None
+                and volume["volume"]
+                and volume["volume_number"] != number
+            ):
+                return self.incomplete(
+                    "Volume {} has volume number {}, expected {}".format(
+                        volume_path.name, volume["volume_number"], number
+                    )
+                )
+
+            if not volume["more_volumes"]:
+                break
+
+            number += 1
+
+        sfv_reason = self.check_sfv(dir)
+        if sfv_reason:
+            return self.incomplete(sfv_reason)
+
+        self.reason = None
+
+        return COMPLETE
+
+    def check_sfv(self, dir):
+        """Return why a file listed in an SFV in dir is bad, None if none.
+
+        Listed files must exist and have data, unless their CRC32 is the one
+        of an empty file, and volumes must still have the size their headers
+        were read at. With sfv_crc the CRC32 of every file must match.
+        """
+        volume_sizes = {
+            Path(volume["path"]).name: volume["size"]
+            for volume in self._volumes
+        }
+        for sfv_path in dir.listdir(pattern="*.sfv"):
+            for file_name, crc in read_sfv(sfv_path):
+                path = Path(dir, file_name)
+                try:
+                    size = os.stat(path).st_size
+                except FileNotFoundError:
+                    return "{} listed in {} is missing".format(
+                        file_name, sfv_path.name
+                    )
+
+                if not size and crc:
+                    return "{} listed in {} is empty".format(
+                        file_name, sfv_path.name
+                    )
+                elif volume_sizes.get(path.name, size) != size:
+                    return "{} listed in {} changed size".format(
+                        file_name, sfv_path.name
+                    )
+                elif self.sfv_crc and crc is not None:
+                    digest = hash_file(path, "crc32")
+                    if digest != "{:08x}".format(crc):
+                        return (
+                            "{} listed in {} has CRC32 {}, expected "
+                            "{:08x}".format(
+                                file_name, sfv_path.name, digest, crc
+                            )
+                        )
+
+        return None
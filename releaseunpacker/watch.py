@@ -0,0 +1,361 @@
+"""ReleaseUnpacker watch mode."""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+from unipath import Path
+
+from .claim import is_claim_file
+from .discovery import SUBS_DIR_NAMES, iter_releases
+
+log = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_ONLYDIR
+)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class ReleaseWatcherError(Exception):
+    """ReleaseWatcher error."""
+
+    pass
+
+
+class Inotify(object):
+    """Minimal Linux inotify binding watching dir trees."""
+
+    def __init__(self):
+        """Initialize inotify instance."""
+        libc_name = ctypes.util.find_library("c")
+        try:
+            self.libc = ctypes.CDLL(libc_name, use_errno=True)
+            inotify_init1 = self.libc.inotify_init1
+        except (OSError, AttributeError) as e:
+            raise ReleaseWatcherError("inotify not available: {}".format(e))
+
+        self.fd = inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise ReleaseWatcherError(
+                "inotify_init1 failed: {}".format(
+                    os.strerror(ctypes.get_errno())
+                )
+            )
+
+        self.watches = {}
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<Inotify: {} watches>".format(len(self.watches))
+
+    def fileno(self):
+        """Return inotify file descriptor."""
+        return self.fd
+
+    def close(self):
+        """Close inotify file descriptor."""
+        os.close(self.fd)
+
+    def add_watch(self, dir):
+        """Watch dir, raise ReleaseWatcherError if watch can't be added."""
+        wd = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(dir), WATCH_MASK
+        )
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                return None
+
+            raise ReleaseWatcherError(
+                "Can't watch {}: {}".format(dir, os.strerror(error))
+            )
+
+        self.watches[wd] = dir
+
+        return wd
+
+    def add_watch_tree(self, top):
+        """Watch top and all dirs below it."""
+        self.add_watch(top)
+        for dir, subdirs, _ in os.walk(top):
+            for name in subdirs:
+                self.add_watch(os.path.join(dir, name))
+
+    def read_events(self):
+        """Return list of (dir, name, mask) events ready to be read."""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+
+                events.append(
+                    (self.watches.get(wd), os.fsdecode(name), mask)
+                )
+
+        return events
+
+
+class ReleaseWatcher(object):
+    """Watch release dirs and unpack releases when they stop changing.
+
+    Changes are picked up with inotify when possible and by polling the
+    release dirs otherwise. A changed release dir is handed to the callback
+    once nothing in it changed for settle_time seconds and its files kept
+    the same sizes between two checks. Dirs the callback didn't unpack, like
+    deferred releases, are handed to it again after retry_time seconds.
+    """
+
+    def __init__(
+        self,
+        release_dirs,
+        settle_time=10,
+        poll_interval=60,
+        inotify=True,
+        retry_time=60,
+    ):
+        """Initialize and validate ReleaseWatcher."""
+        self.release_dirs = [Path(dir).absolute() for dir in release_dirs]
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.retry_time = retry_time
+        self.inotify = None
+        self.pending = {}
+        self.retries = {}
+        self.signatures = {}
+        self.stop_event = threading.Event()
+
+        for dir in self.release_dirs:
+            if not dir.isdir():
+                raise ReleaseWatcherError(
+                    "Release dir {} is not a dir".format(dir)
+                )
+
+        if inotify:
+            try:
+                self.inotify = Inotify()
+                for dir in self.release_dirs:
+                    self.inotify.add_watch_tree(dir)
+            except ReleaseWatcherError as e:
+                log.warning("%s, falling back to polling", e)
+                if self.inotify:
+                    self.inotify.close()
+                self.inotify = None
+
+    def __repr__(self):
+        """Return object string representation."""
+        return "<ReleaseWatcher: {} ({})>".format(
+            ", ".join(self.release_dirs),
+            "inotify" if self.inotify else "polling",
+        )
+
+    def stop(self):
+        """Stop watching."""
+        self.stop_event.set()
+
+    def close(self):
+        """Close inotify instance."""
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
+
+    def signature(self, dir):
+        """Return sizes and mtimes of all files in dir and its sub dirs."""
+        signature = []
+        for root, _, files in os.walk(dir):
+            for name in files:
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                signature.append(
+                    (root, name, stat.st_size, stat.st_mtime_ns)
+                )
+
+        return sorted(signature)
+
+    def affected_dir(self, dir, name, mask):
+        """Return release dir affected by an event or None."""
+        if dir is None or is_claim_file(name):
+            return None
+
+        dir = Path(dir)
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            return Path(dir, name)
+
+        if dir.name.lower() in SUBS_DIR_NAMES:
+            dir = dir.parent
+
+        if dir in self.release_dirs:
+            return None
+
+        return dir
+
+    def changed(self, dir, now=None):
+        """Mark dir as changed."""
+        self.pending[dir] = now if now is not None else time.monotonic()
+
+    def retry(self, dir, now=None):
+        """Hand dir to the callback again after retry_time seconds."""
+        if now is None:
+            now = time.monotonic()
+
+        self.retries[dir] = now + self.retry_time
+
+    def scan(self):
+        """Mark release dirs that changed since the last scan."""
+        signatures = {}
+        for top in self.release_dirs:
+            for release in iter_releases(top):
+                signatures[release["dir"]] = self.signature(release["dir"])
+
+        for dir, signature in signatures.items():
+            if self.signatures.get(dir) != signature:
+                self.changed(dir)
+        self.signatures = signatures
+
+    def handle_events(self):
+        """Read inotify events and mark affected dirs as changed."""
+        for dir, name, mask in self.inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                log.warning("inotify queue overflow, rescanning")
+                self.signatures = {}
+                self.scan()
+                continue
+
+            # Watch new dirs
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self.inotify.add_watch_tree(os.path.join(dir, name))
+                except ReleaseWatcherError as e:
+                    log.warning(e)
+
+            affected_dir = self.affected_dir(dir, name, mask)
+            if affected_dir:
+                log.debug("Change in %s", affected_dir)
+                self.changed(affected_dir)
+
+    def ready(self, now=None):
+        """Return dirs that have settled and remove them from pending.
+
+        Dirs whose file sizes still change are kept pending.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        # Retries are ready right away unless the dir changed again
+        for dir, retry_time in list(self.retries.items()):
+            if now >= retry_time:
+                del self.retries[dir]
+                self.pending.setdefault(dir, now - self.settle_time)
+
+        ready = []
+        for dir, changed_time in list(self.pending.items()):
+            if now - changed_time < self.settle_time:
+                continue
+
+            if not dir.exists():
+                del self.pending[dir]
+                continue
+
+            signature = self.signature(dir)
+            if self.signatures.get(dir) != signature:
+                # Still growing, check again after settle_time
+                self.signatures[dir] = signature
+                self.pending[dir] = now
+                continue
+
+            del self.pending[dir]
+            ready.append(dir)
+
+        return ready
+
+    def wait(self, timeout):
+        """Wait for changes up to timeout seconds."""
+        if self.inotify:
+            readable, _, _ = select.select([self.inotify], [], [], timeout)
+            if readable:
+                self.handle_events()
+        else:
+            self.stop_event.wait(timeout)
+
+    def run(self, callback):
+        """Watch release dirs and call callback with settled dirs.
+
+        callback returns the dirs it unpacked, the other dirs are retried.
+        """
+        log.info("Watching %s", self)
+
+        self.scan()
+        last_poll = time.monotonic()
+
+        while not self.stop_event.is_set():
+            self.wait(min(1, self.settle_time))
+
+            if not self.inotify and (
+                time.monotonic() - last_poll >= self.poll_interval
+            ):
+                self.scan()
+                last_poll = time.monotonic()
+
+            ready = self.ready()
+            if not ready:
+                continue
+
+            unpacked = callback(ready)
+
+            # Ignore changes made while unpacking the ready dirs
+            if self.inotify:
+                self.handle_events()
+            for dir in ready:
+                self.pending.pop(dir, None)
+                if not dir.exists():
+                    self.signatures.pop(dir, None)
+                    continue
+
+                self.signatures[dir] = self.signature(dir)
+                if dir not in unpacked:
+                    log.debug(
+                        "%s not unpacked, retrying in %s seconds",
+                        dir,
+                        self.retry_time,
+                    )
+                    self.retry(dir)
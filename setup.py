@@ -19,5 +19,8 @@ setup(
         'rarfile',
         'tendo',
         'unipath',
-    ]
+    ],
+    extras_require={
+        '7z': ['py7zr'],
+    },
 )